@@ -0,0 +1,182 @@
+#!/usr/bin/env python3
+"""
+Collector memory benchmark for Proxmox OpenTelemetry Monitoring
+
+Runs the VM, storage, SMART and temperature collectors against synthetic
+command output (2,000 VMs, 60 disks, a dual-socket 64-core sensor tree) and
+real OpenTelemetry SDK gauges, then reports per cycle:
+- peak traced allocation while the cycle runs (tracemalloc)
+- memory still held after the cycle (returned samples plus SDK state)
+- process RSS after all cycles
+
+Each mode runs in its own process so RSS is comparable:
+- interned: label sets are reused across cycles (current behaviour)
+- fresh:    the label interners are cleared before every cycle, so every
+            series gets a new attribute mapping as with per-cycle dicts
+
+Usage:
+    python benchmarks/collector_memory_benchmark.py [--cycles 10] [--vms 2000] [--disks 60]
+"""
+import argparse
+import json
+import os
+import resource
+import subprocess
+import sys
+import tracemalloc
+
+PROJECT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def synthetic_outputs(vm_count, disk_count):
+    """Build command -> output for the commands the collectors run."""
+    outputs = {}
+
+    vms = []
+    for i in range(vm_count):
+        vmid = 100 + i
+        vms.append({
+            "vmid": vmid, "name": f"guest-{vmid}", "type": "qemu" if i % 4 else "lxc",
+            "status": "running" if i % 10 else "stopped", "node": f"pve{i % 8}",
+            "cpu": (i % 97) / 100, "mem": (i % 64 + 1) * 2 ** 28, "maxmem": 2 ** 34,
+        })
+    outputs["pvesh get /cluster/resources --type vm -output-format json"] = json.dumps(vms)
+
+    storages = [{"storage": f"store{i}", "type": "dir" if i % 2 else "lvmthin",
+                 "content": "images,rootdir", "active": 1, "shared": 0} for i in range(8)]
+    outputs["pvesh get /storage -output-format json"] = json.dumps(storages)
+    for storage in storages:
+        outputs[f"pvesh get /nodes/`hostname`/storage/{storage['storage']}/status -output-format json"] = json.dumps(
+            {"total": 2 ** 40, "used": 2 ** 39, "avail": 2 ** 39})
+
+    devices = []
+    for i in range(disk_count):
+        name = f"nvme{i}n1" if i % 2 else f"sd{chr(97 + i % 26)}{i // 26}"
+        devices.append({"name": name, "type": "disk", "size": "1.8T"})
+        smart = {"model_name": f"Model {i % 3}", "serial_number": f"SN{i:06d}",
+                 "temperature": {"current": 30 + i % 15}, "smart_status": {"passed": True}}
+        if name.startswith("nvme"):
+            smart["nvme_smart_health_information_log"] = {
+                "critical_warning": 0, "temperature": 35, "data_units_read": 10 ** 8 + i,
+                "data_units_written": 2 * 10 ** 8 + i, "power_on_hours": 12000 + i, "media_errors": 0,
+            }
+        else:
+            smart["ata_smart_attributes"] = {"table": [
+                {"id": attr_id, "name": f"Attribute_{attr_id}", "value": 100, "worst": 100,
+                 "thresh": 10, "raw": {"value": attr_id * 1000 + i}}
+                for attr_id in range(1, 21)
+            ]}
+        outputs[f"smartctl -a -j /dev/{name}"] = json.dumps(smart)
+    outputs["lsblk -d -o NAME,TYPE,SIZE -J"] = json.dumps({"blockdevices": devices})
+
+    sensors = {}
+    coretemp = {"Adapter": "ISA adapter"}
+    for package in range(2):
+        coretemp[f"Package id {package}"] = {"temp1_input": 55.0, "temp1_max": 84.0, "temp1_crit": 100.0}
+    for core in range(64):
+        coretemp[f"Core {core}"] = {f"temp{core + 2}_input": 50.0 + core % 7,
+                                    f"temp{core + 2}_max": 84.0, f"temp{core + 2}_crit": 100.0}
+    sensors["coretemp-isa-0000"] = coretemp
+    for i in range(4):
+        sensors[f"nvme-pci-0{i}00"] = {
+            "Adapter": "PCI adapter",
+            "Composite": {"temp1_input": 40.0, "temp1_max": 80.0, "temp1_crit": 85.0},
+            "Sensor 1": {"temp2_input": 41.0, "temp2_max": 65261.8},
+        }
+    outputs["sensors -j"] = json.dumps(sensors)
+    return outputs
+
+
+def run_mode(mode, cycles, vm_count, disk_count):
+    """Run the collectors for a number of cycles in this process and print one JSON result line."""
+    sys.path.insert(0, PROJECT_DIR)
+    from opentelemetry.sdk.metrics import MeterProvider
+    from opentelemetry.sdk.metrics.export import InMemoryMetricReader
+    from lib.config import load_config
+    from lib.samples import LabelInterner
+    from lib.collectors import storage_collector, temperature_collector, vm_collector
+    from lib.instruments import create_sync_instruments
+
+    load_config()
+    outputs = synthetic_outputs(vm_count, disk_count)
+
+    def fake_run_command(command, timeout=30, shell=True):
+        return outputs.get(command)
+
+    modules = (vm_collector, storage_collector, temperature_collector)
+    for module in modules:
+        module.run_command = fake_run_command
+    interners = [value for module in modules for value in vars(module).values() if isinstance(value, LabelInterner)]
+
+    reader = InMemoryMetricReader()
+    meter = MeterProvider(metric_readers=[reader]).get_meter("benchmark")
+    metrics_dict = create_sync_instruments(meter)
+
+    def cycle():
+        samples = vm_collector.collect_vm_metrics(
+            metrics_dict['vm_status'], metrics_dict['vm_cpu_usage'], metrics_dict['vm_memory_usage'])
+        samples += storage_collector.collect_storage_metrics(
+            metrics_dict['storage_status'], metrics_dict['storage_usage'],
+            metrics_dict['storage_used'], metrics_dict['storage_total'])
+        samples += storage_collector.collect_disk_smart_metrics(metrics_dict['smart_metrics'])
+        samples += temperature_collector.collect_temperature_metrics(metrics_dict['temperature'])
+        reader.get_metrics_data()
+        return samples
+
+    # Warm-up cycle fills the SDK aggregation tables and the interners
+    samples = cycle()
+
+    tracemalloc.start()
+    peaks, retained = [], []
+    for _ in range(cycles):
+        if mode == "fresh":
+            for interner in interners:
+                interner.clear()
+        del samples
+        before = tracemalloc.get_traced_memory()[0]
+        tracemalloc.reset_peak()
+        samples = cycle()
+        current, peak = tracemalloc.get_traced_memory()
+        peaks.append(peak - before)
+        retained.append(current - before)
+    tracemalloc.stop()
+
+    with open("/proc/self/status") as f:
+        rss_kb = next(int(line.split()[1]) for line in f if line.startswith("VmRSS:"))
+    print(json.dumps({
+        "mode": mode,
+        "samples": len(samples),
+        "peak_alloc_kb": sorted(peaks)[len(peaks) // 2] / 1024,
+        "retained_kb": sorted(retained)[len(retained) // 2] / 1024,
+        "rss_kb": rss_kb,
+        "max_rss_kb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+    }))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--cycles", type=int, default=10)
+    parser.add_argument("--vms", type=int, default=2000)
+    parser.add_argument("--disks", type=int, default=60)
+    parser.add_argument("--mode", choices=("interned", "fresh"), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.mode:
+        run_mode(args.mode, args.cycles, args.vms, args.disks)
+        return
+
+    env = dict(os.environ, LOG_FILE_PATH=os.devnull)
+    for mode in ("fresh", "interned"):
+        result = subprocess.run(
+            [sys.executable, os.path.abspath(__file__), "--mode", mode, "--cycles", str(args.cycles),
+             "--vms", str(args.vms), "--disks", str(args.disks)],
+            cwd=PROJECT_DIR, env=env, capture_output=True, text=True, check=True
+        )
+        stats = json.loads(result.stdout.strip().splitlines()[-1])
+        print(f"{mode:<9} samples {stats['samples']:6d}  per-cycle peak alloc {stats['peak_alloc_kb']:9.1f} KiB  "
+              f"retained {stats['retained_kb']:8.1f} KiB  RSS {stats['rss_kb'] / 1024:6.1f} MiB  "
+              f"max RSS {stats['max_rss_kb'] / 1024:6.1f} MiB")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,101 @@
+#!/usr/bin/env python3
+"""
+Startup benchmark for Proxmox OpenTelemetry Monitoring
+
+Measures:
+- import cost of main.py and lib.config (python -X importtime)
+- time-to-first-export: wall time from starting `main.py --once` until the
+  first OTLP metrics request reaches a local HTTP sink, and until exit
+
+Usage:
+    python benchmarks/startup_benchmark.py [--runs 5] [--collectors system,network]
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+PROJECT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+class _SinkHandler(BaseHTTPRequestHandler):
+    """Accepts OTLP/HTTP requests and records when the first metrics export arrives."""
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length", 0))
+        self.rfile.read(length)
+        if self.path == "/v1/metrics" and self.server.first_metrics_at is None:
+            self.server.first_metrics_at = time.perf_counter()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/x-protobuf")
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+
+    def log_message(self, format, *args):
+        pass
+
+
+def measure_import_cost(module):
+    """Return the cumulative import time of a module in milliseconds."""
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=PROJECT_DIR, capture_output=True, text=True
+    )
+    # importtime lines: "import time: self [us] | cumulative | imported package"
+    for line in reversed(result.stderr.splitlines()):
+        parts = [part.strip() for part in line.split("|")]
+        if len(parts) == 3 and parts[2] == module:
+            return int(parts[1]) / 1000
+    raise RuntimeError(f"Could not measure import of {module}: {result.stderr[-500:]}")
+
+
+def measure_first_export(env):
+    """Run main.py --once against a local sink.
+
+    Returns:
+        tuple: (seconds until the first metrics export, seconds until exit)
+    """
+    server = ThreadingHTTPServer(("127.0.0.1", 0), _SinkHandler)
+    server.first_metrics_at = None
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+
+    run_env = dict(env, OTEL_COLLECTOR_HOST="127.0.0.1", OTEL_COLLECTOR_PORT=str(server.server_address[1]))
+    started = time.perf_counter()
+    subprocess.run([sys.executable, "main.py", "--once"], cwd=PROJECT_DIR, env=run_env,
+                   stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, check=True)
+    finished = time.perf_counter()
+    server.shutdown()
+
+    if server.first_metrics_at is None:
+        raise RuntimeError("main.py --once exited without exporting metrics")
+    return server.first_metrics_at - started, finished - started
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--collectors", help="ENABLED_COLLECTORS for the --once runs (default: all)")
+    args = parser.parse_args()
+
+    env = dict(os.environ)
+    env["LOG_FILE_PATH"] = os.path.join(tempfile.mkdtemp(prefix="proxmox-otel-bench-"), "agent.log")
+    if args.collectors is not None:
+        env["ENABLED_COLLECTORS"] = args.collectors
+
+    for module in ("lib.config", "main"):
+        samples = [measure_import_cost(module) for _ in range(args.runs)]
+        print(f"import {module:<12} median {statistics.median(samples):8.1f} ms  (min {min(samples):.1f} ms)")
+
+    first_export, total = zip(*(measure_first_export(env) for _ in range(args.runs)))
+    print(f"time to first export  median {statistics.median(first_export) * 1000:8.1f} ms  (min {min(first_export) * 1000:.1f} ms)")
+    print(f"--once total runtime  median {statistics.median(total) * 1000:8.1f} ms  (min {min(total) * 1000:.1f} ms)")
+
+
+if __name__ == "__main__":
+    main()
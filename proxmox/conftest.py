@@ -0,0 +1 @@
+# Lets the tests under tests/ import lib.* the way main.py does, from this directory
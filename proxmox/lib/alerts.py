@@ -0,0 +1,251 @@
+#!/usr/bin/env python3
+"""
+Alert evaluation for Proxmox OpenTelemetry Monitoring
+
+Collectors hand their samples to an AlertEngine instead of emitting alert log
+records themselves. The engine keeps the state of every (rule, series) pair in
+memory and emits a log record only when an alert starts firing or resolves:
+
+    inactive -> pending   value crosses the fire threshold
+    pending  -> firing    the value stayed past it for the rule's for_seconds
+    firing   -> inactive  value crosses back over the clear threshold, or the
+                          series has not been reported for STALE_SECONDS
+
+The clear threshold lies on the safe side of the fire threshold, so a sensor
+hovering around the limit does not fire and resolve every cycle. Firing
+notifications are additionally rate-limited per rule; a resolution is only
+sent for a firing notification that was sent. The proxmox_alert_active gauge
+reports every pending (0) and firing (1) series, whether notified or not.
+"""
+import threading
+import time
+from collections import deque, namedtuple
+from lib.config import logger
+from lib.utils import create_log_record
+
+# Firing series that stop being reported (disk pulled, pool exported) resolve after this long
+STALE_SECONDS = 600
+
+# fire/clear: threshold numbers, or functions of the sample labels returning one
+# above:      True fires at value >= fire and clears below clear; False fires at
+#             value <= fire and clears above clear
+# summary:    str.format template over the sample labels and {value}
+AlertRule = namedtuple("AlertRule",
+                       "name metric severity summary series_labels match fire clear above for_seconds",
+                       defaults=(True, 0))
+
+
+class _SeriesState:
+    __slots__ = ("firing", "since", "last_seen", "notified", "labels", "value")
+
+    def __init__(self, now, labels, value):
+        self.firing = False
+        self.since = now
+        self.last_seen = now
+        self.notified = False
+        self.labels = labels
+        self.value = value
+
+
+class _Labels(dict):
+    """Template fields for labels a sample doesn't carry render as '?'."""
+
+    def __missing__(self, key):
+        return "?"
+
+
+def _threshold(threshold, labels):
+    return threshold(labels) if callable(threshold) else threshold
+
+
+def build_alert_rules(config):
+    """Return the alert rules for the current configuration."""
+    temp_for = config.alert_for_seconds
+    hysteresis = config.temp_alert_hysteresis
+
+    def cpu_fire(labels):
+        return float(labels["critical"]) - config.temp_critical_threshold
+
+    def nvme_fire(labels):
+        return float(labels["critical"]) - config.disk_temp_warning_threshold
+
+    return [
+        AlertRule("cpu_temperature_critical", "temperature", "ERROR",
+                  "CPU {name} temperature critical: {value}°C (critical {critical}°C)",
+                  ("source", "name", "socket"), {"source": "cpu"},
+                  fire=cpu_fire, clear=lambda labels: cpu_fire(labels) - hysteresis, for_seconds=temp_for),
+        AlertRule("nvme_temperature_high", "temperature", "ERROR",
+                  "NVMe {name} temperature high: {value}°C (critical {critical}°C)",
+                  ("source", "name"), {"source": "nvme", "type": "composite"},
+                  fire=nvme_fire, clear=lambda labels: nvme_fire(labels) - hysteresis, for_seconds=temp_for),
+        # zfs_pool_health_status is 0 only for ONLINE
+        AlertRule("zfs_pool_unhealthy", "zfs_pool_health_status", "ERROR",
+                  "ZFS pool {pool} is {health_text}",
+                  ("pool",), {}, fire=1, clear=1),
+        AlertRule("smart_health_failed", "smart_metrics", "ERROR",
+                  "SMART overall health check failed on /dev/{device} ({model}, S/N {serial})",
+                  ("device",), {"attribute_name": "smart_passed"}, fire=0, clear=0, above=False),
+        # Any bit set: spare below threshold, temperature, reliability degraded, read-only, backup failed
+        AlertRule("nvme_critical_warning", "smart_metrics", "ERROR",
+                  "NVMe /dev/{device} ({model}) reports critical warning {value}",
+                  ("device",), {"attribute_name": "nvme_critical_warning"}, fire=1, clear=1),
+    ]
+
+
+class AlertEngine:
+    """Per-rule, per-series alert state with transition-only notifications.
+
+    evaluate() may be called from the collection loop and from observable
+    callbacks on the export threads; all state is guarded by one lock.
+    """
+
+    def __init__(self, rules, logger_otel=None, max_notifications_per_hour=20):
+        self.logger_otel = logger_otel
+        self.max_notifications_per_hour = max_notifications_per_hour
+        self._lock = threading.Lock()
+        # (rule name, series label values) -> _SeriesState
+        self._states = {}
+        # rule name -> monotonic times of the firing notifications of the last hour
+        self._notifications = {}
+        self._suppressed = {}
+        self.set_rules(rules)
+
+    def set_rules(self, rules, max_notifications_per_hour=None):
+        """Replace the rules, keeping the state of rules that still exist (configuration reload)."""
+        with self._lock:
+            self.rules = list(rules)
+            if max_notifications_per_hour is not None:
+                self.max_notifications_per_hour = max_notifications_per_hour
+            self._rules_by_metric = {}
+            for rule in self.rules:
+                self._rules_by_metric.setdefault(rule.metric, []).append(rule)
+            names = {rule.name for rule in self.rules}
+            self._states = {key: state for key, state in self._states.items() if key[0] in names}
+
+    def evaluate(self, samples, now=None):
+        """Update the alert states from a batch of Sample objects.
+
+        A rule is evaluated only when the batch holds samples of its metric,
+        so a collector that did not run (or failed) leaves its alerts alone.
+        """
+        if now is None:
+            now = time.monotonic()
+        by_metric = {}
+        for sample in samples:
+            if sample.metric in self._rules_by_metric:
+                by_metric.setdefault(sample.metric, []).append(sample)
+        if not by_metric:
+            return
+        with self._lock:
+            for metric, metric_samples in by_metric.items():
+                for rule in self._rules_by_metric.get(metric, ()):
+                    self._evaluate_rule(rule, metric_samples, now)
+
+    def _evaluate_rule(self, rule, samples, now):
+        seen = set()
+        for sample in samples:
+            labels = sample.labels
+            if any(labels.get(key) != value for key, value in rule.match.items()):
+                continue
+            try:
+                value = float(sample.value)
+                fire = _threshold(rule.fire, labels)
+                clear = _threshold(rule.clear, labels)
+            except (KeyError, TypeError, ValueError) as e:
+                logger.error("Cannot evaluate alert %s for %s: %s", rule.name, dict(labels), e)
+                continue
+            key = (rule.name, tuple(labels.get(label) for label in rule.series_labels))
+            seen.add(key)
+            state = self._states.get(key)
+            breached = value >= fire if rule.above else value <= fire
+            cleared = value < clear if rule.above else value > clear
+
+            if state is None:
+                if breached:
+                    state = self._states[key] = _SeriesState(now, labels, value)
+                else:
+                    continue
+            state.last_seen = now
+            state.labels = labels
+            state.value = value
+
+            if not state.firing:
+                if not breached:
+                    # Back under the fire threshold before for_seconds passed
+                    del self._states[key]
+                elif now - state.since >= rule.for_seconds:
+                    state.firing = True
+                    state.since = now
+                    state.notified = self._allow_notification(rule, now)
+                    if state.notified:
+                        self._notify(rule, state, "firing")
+            elif cleared:
+                del self._states[key]
+                if state.notified:
+                    self._notify(rule, state, "resolved", now - state.since)
+
+        for key in [key for key in self._states if key[0] == rule.name and key not in seen]:
+            state = self._states[key]
+            if not state.firing:
+                del self._states[key]
+            elif now - state.last_seen >= STALE_SECONDS:
+                del self._states[key]
+                if state.notified:
+                    self._notify(rule, state, "resolved", now - state.since, stale=True)
+
+    def _allow_notification(self, rule, now):
+        if not self.max_notifications_per_hour:
+            return True
+        sent = self._notifications.setdefault(rule.name, deque())
+        while sent and now - sent[0] >= 3600:
+            sent.popleft()
+        if len(sent) >= self.max_notifications_per_hour:
+            self._suppressed[rule.name] = self._suppressed.get(rule.name, 0) + 1
+            logger.warning("Alert %s: %d notifications in the last hour, suppressing further ones "
+                           "(%d suppressed so far)", rule.name, len(sent), self._suppressed[rule.name])
+            return False
+        sent.append(now)
+        return True
+
+    def _notify(self, rule, state, transition, duration=None, stale=False):
+        summary = rule.summary.format_map(_Labels(state.labels, value=f"{state.value:g}"))
+        if transition == "firing":
+            body = f"ALERT: {summary}"
+            severity = rule.severity
+            logger.warning("%s", body)
+        else:
+            body = f"RESOLVED: {summary}" + (" (no longer reported)" if stale else "")
+            severity = "INFO"
+            logger.info("%s after %.0fs", body, duration)
+        if not self.logger_otel:
+            return
+        attributes = dict(state.labels)
+        attributes.update({
+            "event.type": "alert",
+            "alert.name": rule.name,
+            "alert.state": transition,
+            "value": state.value,
+        })
+        if duration is not None:
+            attributes["alert.duration_seconds"] = round(duration, 1)
+        self.logger_otel.emit(create_log_record(
+            timestamp=int(time.time() * 1e9),
+            body=body,
+            severity=severity,
+            attributes=attributes
+        ))
+
+    def active(self):
+        """Return (attributes, 1 if firing else 0) for every pending or firing series."""
+        with self._lock:
+            rules = {rule.name: rule for rule in self.rules}
+            states = list(self._states.items())
+        result = []
+        for (name, values), state in states:
+            rule = rules[name]
+            attributes = {"alertname": name, "severity": rule.severity.lower()}
+            for label, value in zip(rule.series_labels, values):
+                if value is not None:
+                    attributes[label] = value
+            result.append((attributes, 1 if state.firing else 0))
+        return result
@@ -0,0 +1,175 @@
+#!/usr/bin/env python3
+"""
+Cluster reporter election for Proxmox OpenTelemetry Monitoring
+
+Every node in a Proxmox cluster sees the same cluster-wide API data
+(/cluster/resources, /cluster/status, shared storages). When cluster mode is
+enabled only one elected node runs those cluster-scope collectors, while every
+node keeps collecting its own node-local data.
+
+Two election strategies are supported:
+- "lock":    hold a pmxcfs lock directory (/etc/pve/priv/lock) and refresh its
+             mtime every cycle. pmxcfs expires unrefreshed locks, so another
+             node takes over when the reporter disappears. Any local directory
+             can be used as a stand-in for testing.
+- "members": the online node with the lexicographically lowest name in
+             /etc/pve/.members is the reporter, as long as the cluster is quorate.
+"""
+import errno
+import json
+import os
+import time
+
+from lib.config import logger, get_config
+
+
+def read_pve_members(path):
+    """Read the pmxcfs membership file.
+
+    Args:
+        path (str): Path to the .members file (normally /etc/pve/.members)
+
+    Returns:
+        dict: Parsed membership data, or None if the file is missing or invalid
+    """
+    try:
+        with open(path, 'r') as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+    except (OSError, ValueError) as e:
+        logger.error("Error reading cluster members file %s: %s", path, e)
+        return None
+
+
+class ClusterElection:
+    """Decide whether this node is the cluster-scope reporter."""
+
+    def __init__(self, enabled=None, strategy=None, lock_dir=None, lock_name=None,
+                 lease_seconds=None, members_file=None, node_name=None):
+        config = get_config()
+        self.enabled = config.cluster_mode if enabled is None else enabled
+        self.strategy = strategy or config.cluster_election
+        self.lock_path = os.path.join(lock_dir or config.cluster_lock_dir, lock_name or config.cluster_lock_name)
+        self.lease_seconds = config.cluster_lease_seconds if lease_seconds is None else lease_seconds
+        self.members_file = members_file or config.pve_members_file
+        self.node_name = node_name or config.node_name
+        self.is_leader = not self.enabled
+        self._lock_stamp = None
+
+    def release(self):
+        """Give up the reporter lock if this node holds it (e.g. before a reconfiguration)."""
+        if self._lock_stamp is None:
+            return
+        try:
+            if self._stamp() == self._lock_stamp:
+                os.rmdir(self.lock_path)
+        except OSError as e:
+            logger.debug("Could not release cluster reporter lock %s: %s", self.lock_path, e)
+        self._lock_stamp = None
+        self.is_leader = False
+
+    def refresh(self):
+        """Re-evaluate leadership. Call once per collection cycle.
+
+        Returns:
+            bool: True if this node should run cluster-scope collectors
+        """
+        if not self.enabled:
+            return True
+
+        try:
+            if self.strategy == "members":
+                leader = self._refresh_members()
+            else:
+                leader = self._refresh_lock()
+        except Exception as e:
+            logger.error("Error during cluster reporter election: %s", e)
+            leader = False
+
+        if leader != self.is_leader:
+            if leader:
+                logger.info("Node %s is now the cluster reporter (%s election)", self.node_name, self.strategy)
+            else:
+                logger.info("Node %s is no longer the cluster reporter", self.node_name)
+        self.is_leader = leader
+        return leader
+
+    def _refresh_members(self):
+        members = read_pve_members(self.members_file)
+        if not members:
+            # Standalone node without pmxcfs membership data
+            return True
+
+        cluster_info = members.get('cluster', {})
+        if cluster_info and not cluster_info.get('quorate', 0):
+            return False
+
+        online_nodes = sorted(
+            name for name, node in members.get('nodelist', {}).items()
+            if node.get('online', 0)
+        )
+        if not online_nodes:
+            return True
+        return online_nodes[0] == self.node_name
+
+    def _refresh_lock(self):
+        now = time.time()
+
+        if self._lock_stamp is not None:
+            # Refresh the lease. A missing directory, or one whose inode/mtime
+            # we did not set, means our lock expired and may have been taken
+            # over by another node.
+            try:
+                if self._stamp() == self._lock_stamp:
+                    os.utime(self.lock_path, (now, now))
+                    self._lock_stamp = self._stamp()
+                    return True
+            except FileNotFoundError:
+                pass
+            logger.warning("Cluster reporter lock %s expired", self.lock_path)
+            self._lock_stamp = None
+
+        if self._try_acquire():
+            return True
+
+        # Lock is held elsewhere - take it over only when the lease is stale.
+        # pmxcfs expires stale locks on its own; this also covers plain
+        # directories used as a local stand-in.
+        try:
+            st = os.stat(self.lock_path)
+        except FileNotFoundError:
+            return self._try_acquire()
+
+        age = now - st.st_mtime
+        if age > self.lease_seconds:
+            # Remove only the directory found stale. If another node took it
+            # over since the stat, the lock is a new directory (or was just
+            # refreshed) and removing it would make both nodes the reporter.
+            try:
+                if self._stamp() != (st.st_ino, st.st_mtime_ns):
+                    return False
+                logger.info("Cluster reporter lock is stale (%.0fs old), taking over", age)
+                os.rmdir(self.lock_path)
+            except FileNotFoundError:
+                pass
+            except OSError as e:
+                logger.error("Cannot remove stale cluster reporter lock %s: %s", self.lock_path, e)
+                return False
+            return self._try_acquire()
+
+        return False
+
+    def _try_acquire(self):
+        try:
+            os.mkdir(self.lock_path)
+        except OSError as e:
+            if e.errno != errno.EEXIST:
+                logger.error("Cannot create cluster reporter lock %s: %s", self.lock_path, e)
+            return False
+        self._lock_stamp = self._stamp()
+        return True
+
+    def _stamp(self):
+        st = os.stat(self.lock_path)
+        return (st.st_ino, st.st_mtime_ns)
@@ -0,0 +1,255 @@
+#!/usr/bin/env python3
+"""
+cgroup v2 per-guest resource collector for Proxmox OpenTelemetry Monitoring
+
+Reads CPU, memory, block I/O and CPU pressure for every guest running on this
+node directly from the cgroup v2 hierarchy:
+- QEMU VMs:       /sys/fs/cgroup/qemu.slice/<vmid>.scope
+- LXC containers: /sys/fs/cgroup/lxc/<ctid>
+
+Guest directories are discovered with one scandir pass per cycle. Directory
+file descriptors and the previous CPU counters are kept between cycles, so each
+cycle only costs a handful of small reads per guest.
+"""
+import os
+import re
+import time
+from lib.config import logger, get_config
+from lib.samples import Sample
+
+# Guest cgroup parents and the guest type reported by /cluster/resources
+_GUEST_PARENTS = (
+    ("qemu", "qemu.slice", re.compile(r'^(\d+)\.scope$')),
+    ("lxc", "lxc", re.compile(r'^(\d+)$')),
+)
+
+# Guest config files, used to resolve names without calling pvesh
+_GUEST_CONFIGS = {
+    "qemu": ("/etc/pve/qemu-server/{}.conf", "name:"),
+    "lxc": ("/etc/pve/lxc/{}.conf", "hostname:"),
+}
+
+# (type, vmid) -> (inode, dir fd) for each guest cgroup directory
+_guest_dirs = {}
+# (type, vmid) -> (usage_usec, monotonic timestamp) from the previous cycle
+_prev_cpu_usage = {}
+# (type, vmid) -> (config mtime, name)
+_guest_names = {}
+# (type, vmid) -> per-guest sample from the last cycle, read by observable callbacks
+_last_guest_samples = {}
+
+
+def _read_at(dir_fd, name):
+    """Read a small cgroup file relative to an open directory descriptor."""
+    fd = os.open(name, os.O_RDONLY, dir_fd=dir_fd)
+    try:
+        return os.read(fd, 65536).decode()
+    finally:
+        os.close(fd)
+
+
+def _parse_flat_keyed(content):
+    """Parse 'key value' lines (cpu.stat, memory.stat) into a dict of ints."""
+    values = {}
+    for line in content.splitlines():
+        parts = line.split()
+        if len(parts) == 2:
+            try:
+                values[parts[0]] = int(parts[1])
+            except ValueError:
+                continue
+    return values
+
+
+def _parse_io_stat(content):
+    """Sum io.stat counters ('MAJ:MIN rbytes=.. wbytes=.. rios=.. wios=..') over all devices."""
+    totals = {'rbytes': 0, 'wbytes': 0, 'rios': 0, 'wios': 0}
+    for line in content.splitlines():
+        for field in line.split()[1:]:
+            key, _, value = field.partition('=')
+            if key in totals:
+                totals[key] += int(value)
+    return totals
+
+
+def _parse_pressure(content):
+    """Parse a PSI file into {'some': {'avg10': .., 'avg60': .., 'avg300': .., 'total': ..}, 'full': {...}}."""
+    pressure = {}
+    for line in content.splitlines():
+        parts = line.split()
+        if not parts:
+            continue
+        fields = {}
+        for field in parts[1:]:
+            key, _, value = field.partition('=')
+            fields[key] = int(value) if key == 'total' else float(value)
+        pressure[parts[0]] = fields
+    return pressure
+
+
+def _guest_name(guest_type, vmid):
+    """Resolve the guest name from its config file, cached by mtime."""
+    path_template, name_key = _GUEST_CONFIGS[guest_type]
+    path = path_template.format(vmid)
+    key = (guest_type, vmid)
+    try:
+        mtime = os.stat(path).st_mtime
+    except OSError:
+        return _guest_names.get(key, (None, f"vm-{vmid}"))[1]
+
+    cached = _guest_names.get(key)
+    if cached and cached[0] == mtime:
+        return cached[1]
+
+    name = f"vm-{vmid}"
+    try:
+        with open(path, 'r') as f:
+            for line in f:
+                # Snapshot sections repeat the name; only the current config counts
+                if line.startswith('['):
+                    break
+                if line.startswith(name_key):
+                    name = line[len(name_key):].strip() or name
+                    break
+    except OSError as e:
+        logger.debug("Could not read guest config %s: %s", path, e)
+    _guest_names[key] = (mtime, name)
+    return name
+
+
+def _scan_guest_dirs():
+    """Discover guest cgroups in one scandir pass and keep their directory fds open."""
+    seen = set()
+    cgroup_root = get_config().cgroup_root
+    for guest_type, parent, pattern in _GUEST_PARENTS:
+        parent_path = os.path.join(cgroup_root, parent)
+        try:
+            entries = os.scandir(parent_path)
+        except FileNotFoundError:
+            continue
+        with entries:
+            for entry in entries:
+                match = pattern.match(entry.name)
+                if not match or not entry.is_dir(follow_symlinks=False):
+                    continue
+                key = (guest_type, match.group(1))
+                seen.add(key)
+                cached = _guest_dirs.get(key)
+                # A guest restart recreates the directory with a new inode
+                if cached and cached[0] == entry.inode():
+                    continue
+                if cached:
+                    os.close(cached[1])
+                    _prev_cpu_usage.pop(key, None)
+                try:
+                    fd = os.open(entry.path, os.O_RDONLY | os.O_DIRECTORY)
+                except OSError as e:
+                    logger.debug("Could not open cgroup directory %s: %s", entry.path, e)
+                    _guest_dirs.pop(key, None)
+                    continue
+                _guest_dirs[key] = (entry.inode(), fd)
+
+    # Forget guests that stopped or migrated away
+    for key in list(_guest_dirs):
+        if key not in seen:
+            os.close(_guest_dirs.pop(key)[1])
+            _prev_cpu_usage.pop(key, None)
+            _last_guest_samples.pop(key, None)
+    return _guest_dirs
+
+
+def collect_guest_cgroup_metrics(guest_cpu_usage=None, guest_memory=None, guest_cpu_pressure=None):
+    """Collect per-guest resource usage from cgroup v2 for QEMU VMs and LXC containers.
+
+    Returns:
+        list: Sample objects keyed 'guest_cpu_usage', 'guest_memory' and
+              'guest_cpu_pressure'
+    """
+    logger.debug("Collecting guest cgroup metrics")
+    guest_metrics = []
+
+    try:
+        guest_dirs = _scan_guest_dirs()
+    except Exception as e:
+        logger.error("Error scanning guest cgroups under %s: %s", get_config().cgroup_root, e)
+        return guest_metrics
+
+    for key, (_, dir_fd) in list(guest_dirs.items()):
+        guest_type, vmid = key
+        try:
+            now = time.monotonic()
+            cpu_stat = _parse_flat_keyed(_read_at(dir_fd, "cpu.stat"))
+            memory_current = int(_read_at(dir_fd, "memory.current"))
+            memory_stat = _parse_flat_keyed(_read_at(dir_fd, "memory.stat"))
+            io_stat = _parse_io_stat(_read_at(dir_fd, "io.stat"))
+            try:
+                cpu_pressure = _parse_pressure(_read_at(dir_fd, "cpu.pressure"))
+            except FileNotFoundError:
+                # Kernels booted without psi=1 do not expose pressure files
+                cpu_pressure = {}
+        except FileNotFoundError:
+            # Guest stopped between the scan and the read
+            continue
+        except Exception as e:
+            logger.error("Error reading cgroup data for %s %s: %s", guest_type, vmid, e)
+            continue
+
+        # Same attributes as collect_vm_metrics
+        guest_labels = {
+            "vmid": vmid,
+            "name": _guest_name(guest_type, vmid),
+            "type": guest_type
+        }
+
+        # CPU rate from the usage_usec delta; 100% means one full host CPU
+        usage_usec = cpu_stat.get('usage_usec', 0)
+        cpu_percent = None
+        prev = _prev_cpu_usage.get(key)
+        if prev is not None and now > prev[1]:
+            cpu_percent = max(usage_usec - prev[0], 0) / ((now - prev[1]) * 1e6) * 100
+        _prev_cpu_usage[key] = (usage_usec, now)
+
+        guest_data = {
+            'labels': guest_labels,
+            'cpu_percent': cpu_percent,
+            'memory': {
+                'current': memory_current,
+                'anon': memory_stat.get('anon', 0),
+                'file': memory_stat.get('file', 0),
+            },
+            'io': io_stat,
+            'cpu_pressure': cpu_pressure,
+        }
+
+        if cpu_percent is not None:
+            guest_metrics.append(Sample('guest_cpu_usage', cpu_percent, guest_labels))
+            if guest_cpu_usage:
+                guest_cpu_usage.set(cpu_percent, guest_labels)
+
+        for kind, value in guest_data['memory'].items():
+            memory_labels = dict(guest_labels, kind=kind)
+            guest_metrics.append(Sample('guest_memory', value, memory_labels))
+            if guest_memory:
+                guest_memory.set(value, memory_labels)
+
+        for scope, fields in cpu_pressure.items():
+            for window in ('avg10', 'avg60', 'avg300'):
+                if window in fields:
+                    pressure_labels = dict(guest_labels, scope=scope, window=window)
+                    guest_metrics.append(Sample('guest_cpu_pressure', fields[window], pressure_labels))
+                    if guest_cpu_pressure:
+                        guest_cpu_pressure.set(fields[window], pressure_labels)
+
+        _last_guest_samples[key] = guest_data
+        logger.debug("Guest %s %s: CPU=%s, memory=%s", guest_type, vmid, cpu_percent, memory_current)
+
+    return guest_metrics
+
+
+def get_guest_io_counters():
+    """Return the cumulative block I/O counters from the last collection cycle.
+
+    Returns:
+        list: (labels, io_stat) tuples, one per guest
+    """
+    return [(sample['labels'], sample['io']) for sample in list(_last_guest_samples.values())]
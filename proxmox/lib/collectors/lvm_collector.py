@@ -0,0 +1,111 @@
+#!/usr/bin/env python3
+"""
+LVM and LVM-thin collector for Proxmox OpenTelemetry Monitoring
+
+pvesh reports only the data usage of an lvmthin storage; a thin pool whose
+metadata fills up switches to read-only and takes its guests down with it.
+This collector reads every logical volume with one `lvs` call and every
+volume group with one `vgs` call (both JSON reports), and reuses the result
+for LVM_INTERVAL seconds.
+"""
+import json
+import time
+from lib.config import logger, get_config
+from lib.samples import LabelInterner
+from lib.utils import run_command, vmid_from_volume_name
+
+LVS_COMMAND = ("lvs --reportformat json --units b --nosuffix "
+               "-o lv_name,vg_name,lv_attr,data_percent,metadata_percent,lv_size,pool_lv")
+VGS_COMMAND = "vgs --reportformat json --units b --nosuffix -o vg_name,vg_size,vg_free"
+
+
+def _build_thin_volume_labels(vg, lv, pool):
+    labels = {"vg": vg, "lv": lv, "pool": pool}
+    # Proxmox names guest disks vm-<vmid>-disk-N on lvmthin storages
+    vmid = vmid_from_volume_name(lv)
+    if vmid:
+        labels["vmid"] = vmid
+    return labels
+
+
+_thin_pool_labels = LabelInterner("vg", "pool")
+_thin_volume_labels = LabelInterner(build=_build_thin_volume_labels)
+_vg_labels = LabelInterner("vg")
+
+# (monotonic time of the last lvs/vgs, metrics)
+_lvm_cache = (None, {})
+
+
+def _parse_number(value):
+    """Parse an LVM report number; empty strings (e.g. data_percent of a plain LV) become None."""
+    try:
+        return float(value) if '.' in value else int(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def _report_rows(output, kind):
+    """Return the rows of an `lvs`/`vgs` JSON report ('lv' or 'vg')."""
+    rows = []
+    for report in json.loads(output).get('report', []):
+        rows.extend(report.get(kind, []))
+    return rows
+
+
+def collect_lvm_metrics():
+    """Collect thin pool fill, thin volume usage and volume group capacity.
+
+    Returns:
+        dict: 'thin_pools', 'thin_volumes' and 'volume_groups', each a list of
+              (labels, metrics) tuples with interned labels
+    """
+    global _lvm_cache
+
+    now = time.monotonic()
+    cached_at, metrics = _lvm_cache
+    if cached_at is not None and now - cached_at < get_config().lvm_interval_seconds:
+        return metrics
+
+    logger.debug("Collecting LVM metrics")
+    metrics = {'thin_pools': [], 'thin_volumes': [], 'volume_groups': []}
+
+    lvs_output = run_command(LVS_COMMAND)
+    if lvs_output:
+        try:
+            for lv in _report_rows(lvs_output, 'lv'):
+                # lv_attr[0]: 't' thin pool, 'V' thin volume
+                volume_type = lv.get('lv_attr', ' ')[:1]
+                size = _parse_number(lv.get('lv_size'))
+                data_percent = _parse_number(lv.get('data_percent'))
+                if volume_type == 't':
+                    metrics['thin_pools'].append((_thin_pool_labels.get(lv['vg_name'], lv['lv_name']), {
+                        'size': size,
+                        'data_percent': data_percent,
+                        'metadata_percent': _parse_number(lv.get('metadata_percent')),
+                    }))
+                elif volume_type == 'V':
+                    labels = _thin_volume_labels.get(lv['vg_name'], lv['lv_name'], lv.get('pool_lv', ''))
+                    used = size * data_percent / 100 if size is not None and data_percent is not None else None
+                    metrics['thin_volumes'].append((labels, {'size': size, 'used': used}))
+        except (ValueError, KeyError, AttributeError) as e:
+            logger.error("Error parsing lvs report: %s", e)
+
+    vgs_output = run_command(VGS_COMMAND)
+    if vgs_output:
+        try:
+            for vg in _report_rows(vgs_output, 'vg'):
+                metrics['volume_groups'].append((_vg_labels.get(vg['vg_name']), {
+                    'size': _parse_number(vg.get('vg_size')),
+                    'free': _parse_number(vg.get('vg_free')),
+                }))
+        except (ValueError, KeyError, AttributeError) as e:
+            logger.error("Error parsing vgs report: %s", e)
+
+    # Keep the previous result if both commands failed, so a transient error does not blank the series
+    if any(metrics.values()) or cached_at is None:
+        _lvm_cache = (now, metrics)
+    else:
+        _lvm_cache = (now, _lvm_cache[1])
+    logger.debug("Collected %d thin pools, %d thin volumes and %d volume groups",
+                 len(metrics['thin_pools']), len(metrics['thin_volumes']), len(metrics['volume_groups']))
+    return _lvm_cache[1]
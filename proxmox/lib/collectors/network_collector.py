@@ -0,0 +1,120 @@
+#!/usr/bin/env python3
+"""
+Network interface metrics collector for Proxmox OpenTelemetry Monitoring
+
+Counters for every interface come from a single read of /proc/net/dev; no
+subprocesses are spawned. Interfaces are classified once from
+/sys/class/net/<iface> (bridge, bond, physical, guest) and the classification
+is reused until the interface set changes (e.g. a VM NIC hotplug).
+
+Guest interfaces follow the Proxmox naming scheme and are mapped to VM IDs:
+- tap<vmid>i<N>:  QEMU VM network device netN
+- veth<vmid>i<N>: LXC container network device netN
+"""
+import os
+import re
+import time
+from lib.config import logger, get_config
+
+PROC_NET_DEV = "/proc/net/dev"
+SYS_CLASS_NET = "/sys/class/net"
+
+_GUEST_IFACE_RE = re.compile(r'^(tap|veth)(\d+)i(\d+)$')
+# Loopback and the per-NIC firewall plumbing (fwbr/fwpr/fwln) duplicate traffic
+# already counted on the guest tap/veth and the host bridge
+_SKIPPED_IFACE_PREFIXES = ('lo', 'fwbr', 'fwpr', 'fwln')
+
+# Reads within this window reuse the previous parse, so the per-counter
+# observable callbacks of one export share a single /proc/net/dev read
+_CACHE_TTL_SECONDS = 1.0
+
+_iface_set = frozenset()
+_iface_labels = {}
+_last_read = (0.0, {})
+
+
+def _classify_interface(iface):
+    """Build the attribute set for an interface from its name and sysfs entries."""
+    labels = {"node": get_config().node_name, "interface": iface}
+    guest_match = _GUEST_IFACE_RE.match(iface)
+    if guest_match:
+        labels["kind"] = "guest"
+        labels["guest_type"] = "qemu" if guest_match.group(1) == "tap" else "lxc"
+        labels["vmid"] = guest_match.group(2)
+        labels["net"] = f"net{guest_match.group(3)}"
+        return labels
+
+    sys_path = os.path.join(SYS_CLASS_NET, iface)
+    if os.path.isdir(os.path.join(sys_path, "bridge")):
+        labels["kind"] = "bridge"
+    elif os.path.isdir(os.path.join(sys_path, "bonding")):
+        labels["kind"] = "bond"
+    elif os.path.exists(os.path.join(sys_path, "device")):
+        labels["kind"] = "physical"
+    else:
+        labels["kind"] = "virtual"
+    return labels
+
+
+def _parse_proc_net_dev(content):
+    """Parse /proc/net/dev into {iface: (rx_bytes, rx_packets, rx_errs, rx_drop, tx_bytes, tx_packets, tx_errs, tx_drop)}."""
+    counters = {}
+    # The first two lines are column headers
+    for line in content.splitlines()[2:]:
+        iface, _, data = line.partition(':')
+        iface = iface.strip()
+        if not iface or iface.startswith(_SKIPPED_IFACE_PREFIXES):
+            continue
+        fields = data.split()
+        if len(fields) < 16:
+            continue
+        counters[iface] = (
+            int(fields[0]), int(fields[1]), int(fields[2]), int(fields[3]),
+            int(fields[8]), int(fields[9]), int(fields[10]), int(fields[11]),
+        )
+    return counters
+
+
+def collect_network_data_raw():
+    """Collect raw network interface counters without updating OpenTelemetry instruments.
+
+    Returns:
+        dict: Interface names as keys; each value holds the interface 'labels'
+              and cumulative rx/tx bytes, packets, errors and drops.
+    """
+    global _iface_set, _iface_labels, _last_read
+
+    now = time.monotonic()
+    if now - _last_read[0] < _CACHE_TTL_SECONDS:
+        return _last_read[1]
+
+    try:
+        with open(PROC_NET_DEV, 'r') as f:
+            counters = _parse_proc_net_dev(f.read())
+    except Exception as e:
+        logger.error("Error reading %s: %s", PROC_NET_DEV, e)
+        return {}
+
+    # Reclassify interfaces only when the set changes (hotplug, guest start/stop)
+    iface_set = frozenset(counters)
+    if iface_set != _iface_set:
+        logger.debug("Network interface set changed: %s interfaces", len(iface_set))
+        _iface_labels = {iface: _iface_labels.get(iface) or _classify_interface(iface) for iface in iface_set}
+        _iface_set = iface_set
+
+    net_metrics = {}
+    for iface, values in counters.items():
+        net_metrics[iface] = {
+            'labels': _iface_labels[iface],
+            'rx_bytes': values[0],
+            'rx_packets': values[1],
+            'rx_errors': values[2],
+            'rx_drops': values[3],
+            'tx_bytes': values[4],
+            'tx_packets': values[5],
+            'tx_errors': values[6],
+            'tx_drops': values[7],
+        }
+
+    _last_read = (now, net_metrics)
+    return net_metrics
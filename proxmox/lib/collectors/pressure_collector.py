@@ -0,0 +1,112 @@
+#!/usr/bin/env python3
+"""
+Pressure Stall Information (PSI) collector for Proxmox OpenTelemetry Monitoring
+
+A background sampler reads /proc/pressure/{cpu,memory,io} every
+psi_sample_interval_seconds and turns the cumulative 'total' stall counters
+into stall-percentage samples kept in fixed-size ring buffers. At export time
+the min, max and p95 of those samples are reported next to the kernel's own
+avg10/avg60/avg300 values, which exposes short stalls that the kernel averages
+smooth over.
+"""
+import os
+import time
+from lib.config import logger, get_config
+from lib.ringbuffer import RingBuffer
+from lib.sampler import PeriodicSampler
+
+PRESSURE_DIR = "/proc/pressure"
+PRESSURE_RESOURCES = ("cpu", "memory", "io")
+
+
+def _parse_pressure_line(line):
+    """Parse 'some avg10=0.00 avg60=0.00 avg300=0.00 total=0' into (scope, fields)."""
+    parts = line.split()
+    fields = {}
+    for field in parts[1:]:
+        key, _, value = field.partition('=')
+        fields[key] = int(value) if key == 'total' else float(value)
+    return parts[0], fields
+
+
+class PressureSampler(PeriodicSampler):
+    """Background thread sampling PSI stall counters into ring buffers."""
+
+    def __init__(self, sample_interval=None, window_seconds=None, pressure_dir=PRESSURE_DIR):
+        config = get_config()
+        super().__init__(
+            "psi-sampler",
+            sample_interval or config.psi_sample_interval_seconds,
+            window_seconds or config.collection_interval_seconds
+        )
+        self.pressure_dir = pressure_dir
+        self._fds = {}
+        # (resource, scope) -> RingBuffer of stall percentages
+        self._buffers = {}
+        # (resource, scope) -> latest kernel fields (avg10, avg60, avg300, total)
+        self._latest = {}
+        # (resource, scope) -> (total_usec, monotonic time) of the previous sample
+        self._prev = {}
+
+    @staticmethod
+    def available(pressure_dir=PRESSURE_DIR):
+        return os.path.exists(os.path.join(pressure_dir, "cpu"))
+
+    def setup(self):
+        # Keep the PSI files open; each sample is then a seek and a small read
+        for resource in PRESSURE_RESOURCES:
+            try:
+                self._fds[resource] = os.open(os.path.join(self.pressure_dir, resource), os.O_RDONLY)
+            except OSError as e:
+                logger.warning("PSI not available for %s: %s", resource, e)
+
+    def teardown(self):
+        for fd in self._fds.values():
+            os.close(fd)
+        self._fds.clear()
+
+    def sample(self):
+        """Take one sample of every PSI file."""
+        for resource, fd in self._fds.items():
+            try:
+                os.lseek(fd, 0, os.SEEK_SET)
+                content = os.read(fd, 256).decode()
+            except OSError as e:
+                logger.error("Error reading PSI for %s: %s", resource, e)
+                continue
+
+            now = time.monotonic()
+            for line in content.splitlines():
+                scope, fields = _parse_pressure_line(line)
+                key = (resource, scope)
+                total = fields.get('total', 0)
+                with self._lock:
+                    prev = self._prev.get(key)
+                    if prev is not None and now > prev[1]:
+                        stall_percent = max(total - prev[0], 0) / ((now - prev[1]) * 1e6) * 100
+                        buffer = self._buffers.get(key)
+                        if buffer is None:
+                            buffer = self._buffers[key] = RingBuffer(self.capacity)
+                        buffer.append(min(stall_percent, 100.0))
+                    self._prev[key] = (total, now)
+                    self._latest[key] = fields
+
+    def snapshot(self):
+        """Return the current PSI statistics.
+
+        Returns:
+            list: (resource, scope, stats) tuples where stats maps min/max/p95
+                  (sampled) and avg10/avg60/avg300 (kernel) to stall percentages
+        """
+        results = []
+        with self._lock:
+            for key, fields in self._latest.items():
+                stats = {window: fields[window] for window in ('avg10', 'avg60', 'avg300') if window in fields}
+                buffer = self._buffers.get(key)
+                summary = buffer.summary() if buffer is not None else None
+                if summary:
+                    stats['min'] = summary['min']
+                    stats['max'] = summary['max']
+                    stats['p95'] = summary['p95']
+                results.append((key[0], key[1], stats))
+        return results
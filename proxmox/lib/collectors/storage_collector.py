@@ -5,12 +5,66 @@ Storage metrics collector for Proxmox OpenTelemetry Monitoring
 import json
 import re
 from lib.config import logger
+from lib.samples import Sample, LabelInterner
+from lib.nvme import read_nvme_health
 from lib.utils import run_command
 
+_storage_labels = LabelInterner("storage", "type", "content")
+_storage_mb_labels = LabelInterner(build=lambda storage, storage_type, content: {
+    "storage": storage, "type": storage_type, "content": content, "unit": "MB"
+})
+
+
+def _smart_attribute_labels(disk, model, serial, attr_id, attr_name, value_type):
+    attr_name_clean = re.sub(r'[^a-zA-Z0-9_]', '_', attr_name).lower()
+    return {
+        "device": disk,
+        "model": model,
+        "serial": serial,
+        "attribute_id": str(attr_id),
+        "attribute_name": attr_name_clean,
+        "type": value_type,
+        "legend": f"Disk: {disk} ({attr_name})",
+        "metric": value_type,
+    }
+
+
+def _smart_named_labels(disk, model, serial, attribute_name, legend_name):
+    return {
+        "device": disk,
+        "model": model,
+        "serial": serial,
+        "attribute_name": attribute_name,
+        "type": "raw",
+        "legend": f"Disk: {disk} ({legend_name})",
+        "metric": attribute_name,
+    }
+
+
+_smart_attribute_interner = LabelInterner(build=_smart_attribute_labels)
+_smart_named_interner = LabelInterner(build=_smart_named_labels)
+
+# NVMe health log fields exported as SMART attributes: (field, attribute name, legend name)
+_NVME_ATTRIBUTES = (
+    ("data_units_written", "nvme_data_units_written", "NVMe Data Units Written"),
+    ("data_units_read", "nvme_data_units_read", "NVMe Data Units Read"),
+    ("power_on_hours", "nvme_power_on_hours", "NVMe Power On Hours"),
+    ("media_errors", "nvme_media_errors", "NVMe Media Errors"),
+    ("critical_warning", "nvme_critical_warning", "NVMe Critical Warning"),
+)
+
 def collect_storage_metrics(storage_status=None, storage_usage=None, 
-                          storage_used=None, storage_total=None):
-    """Collect Proxmox storage metrics."""
-    logger.info("Collecting Proxmox storage metrics")
+                          storage_used=None, storage_total=None, include_shared=True):
+    """Collect Proxmox storage metrics.
+
+    Shared storages report the same usage on every node, so in cluster mode
+    only the elected reporter passes include_shared=True.
+
+    Returns:
+        list: Sample objects keyed 'storage_status', 'storage_usage',
+              'storage_used' and 'storage_total'
+    """
+    logger.debug("Collecting Proxmox storage metrics")
     storage_metrics = []
     
     # Get list of all storages using the Proxmox API
@@ -21,102 +75,122 @@ def collect_storage_metrics(storage_status=None, storage_usage=None,
             for storage in storages:
                 try:
                     storage_id = storage.get('storage')
-                    storage_type = storage.get('type', 'unknown')
-                    storage_active = storage.get('active', 0)
                     
                     if not storage_id:
                         continue
                     
-                    # Create labels for this storage
-                    storage_labels = {
-                        "storage": storage_id,
-                        "type": storage_type,
-                        "content": ",".join(storage.get('content', [])),
-                    }
-                    
-                    storage_data = {
-                        'id': storage_id,
-                        'type': storage_type,
-                        'active': bool(storage_active),
-                        'content': storage.get('content', []),
-                        'labels': storage_labels
-                    }
-                    
-                    # Send storage status metric (1=active, 0=inactive)
-                    if storage_status:
-                        storage_status.set(1 if storage_active else 0, storage_labels)
-                    
-                    # Skip detailed usage/capacity for ZFS storages (handled by ZFS collector)
-                    if storage_type == "zfspool":
-                        logger.info(f"Skipping usage/capacity for ZFS storage {storage_id} (handled by ZFS collector)")
-                        storage_metrics.append(storage_data)
+                    # Shared storages are cluster-scope - only the reporter collects them
+                    if storage.get('shared', 0) and not include_shared:
+                        logger.debug("Skipping shared storage %s (collected by cluster reporter)", storage_id)
                         continue
                     
-                    # Get detailed storage info
-                    storage_details_cmd = f"pvesh get /nodes/`hostname`/storage/{storage_id}/status -output-format json"
-                    storage_details = run_command(storage_details_cmd)
+                    # Get detailed storage info (ZFS storages are handled by the ZFS collector)
+                    details = None
+                    if storage.get('type') != "zfspool":
+                        storage_details_cmd = f"pvesh get /nodes/`hostname`/storage/{storage_id}/status -output-format json"
+                        storage_details = run_command(storage_details_cmd)
+                        if storage_details:
+                            details = json.loads(storage_details)
                     
-                    if storage_details:
-                        details = json.loads(storage_details)
-                        
-                        # Get usage data if available
-                        if 'total' in details and 'used' in details and details.get('total', 0) > 0:
-                            total_bytes = details.get('total', 0)
-                            used_bytes = details.get('used', 0)
-                            avail_bytes = details.get('avail', 0)
-                            
-                            # Convert to MB (two decimal places)
-                            total_mb = round(total_bytes / (1024 * 1024), 2)
-                            used_mb = round(used_bytes / (1024 * 1024), 2)
-                            avail_mb = round(avail_bytes / (1024 * 1024), 2)
-                            
-                            # Calculate percentage
-                            used_percent = (used_mb / total_mb) * 100 if total_mb > 0 else 0
-                            
-                            storage_data['usage'] = {
-                                'total_mb': total_mb,
-                                'used_mb': used_mb,
-                                'avail_mb': avail_mb,
-                                'percent': used_percent
-                            }
-                            
-                            # Update labels for MB
-                            mb_labels = dict(storage_labels)
-                            mb_labels['unit'] = 'MB'
-                            
-                            # Send storage usage metrics (all in MB)
-                            if storage_usage:
-                                storage_usage.set(used_percent, mb_labels)
-                            if storage_total:
-                                storage_total.set(total_mb, mb_labels)
-                            if storage_used:
-                                storage_used.set(used_mb, mb_labels)
-                            
-                            logger.info(f"Storage {storage_id} ({storage_type}): {used_percent:.1f}% ({used_mb:.2f}MB/{total_mb:.2f}MB)")
-                        else:
-                            logger.info(f"Storage {storage_id} ({storage_type}): no usage data available")
-                        
-                        storage_metrics.append(storage_data)
+                    storage_metrics.extend(record_storage_metrics(
+                        storage, details, storage_status, storage_usage, storage_used, storage_total))
                     
                 except Exception as e:
-                    logger.error(f"Error processing storage data: {e}")
+                    logger.error("Error processing storage data: %s", e)
         
         except json.JSONDecodeError as e:
-            logger.error(f"Error parsing storage list JSON: {e}")
+            logger.error("Error parsing storage list JSON: %s", e)
+    
+    return storage_metrics
+
+
+def record_storage_metrics(storage, details, storage_status=None, storage_usage=None,
+                           storage_used=None, storage_total=None):
+    """Set the metrics of one storage from its configuration and status.
+
+    Args:
+        storage (dict): /storage entry (or /nodes/{node}/storage entry, which
+                        also carries the status fields)
+        details (dict): /nodes/{node}/storage/{storage}/status response, or None
+
+    Returns:
+        list: Sample objects keyed 'storage_status', 'storage_usage',
+              'storage_used' and 'storage_total'
+    """
+    storage_metrics = []
+    storage_id = storage['storage']
+    storage_type = storage.get('type', 'unknown')
+    storage_active = storage.get('active', 0)
+    
+    # Labels for this storage, shared across cycles
+    content = storage.get('content', [])
+    if not isinstance(content, str):
+        content = ",".join(content)
+    storage_labels = _storage_labels.get(storage_id, storage_type, content)
+    
+    # Send storage status metric (1=active, 0=inactive)
+    status_value = 1 if storage_active else 0
+    storage_metrics.append(Sample('storage_status', status_value, storage_labels))
+    if storage_status:
+        storage_status.set(status_value, storage_labels)
+    
+    # Skip detailed usage/capacity for ZFS storages (handled by ZFS collector)
+    if storage_type == "zfspool":
+        logger.debug("Skipping usage/capacity for ZFS storage %s (handled by ZFS collector)", storage_id)
+        return storage_metrics
+    
+    # Get usage data if available
+    if details and 'total' in details and 'used' in details and details.get('total', 0) > 0:
+        total_bytes = details.get('total', 0)
+        used_bytes = details.get('used', 0)
+        
+        # Convert to MB (two decimal places)
+        total_mb = round(total_bytes / (1024 * 1024), 2)
+        used_mb = round(used_bytes / (1024 * 1024), 2)
+        
+        # Calculate percentage
+        used_percent = (used_mb / total_mb) * 100 if total_mb > 0 else 0
+        
+        # Labels for MB values
+        mb_labels = _storage_mb_labels.get(storage_id, storage_type, content)
+        storage_metrics.append(Sample('storage_usage', used_percent, mb_labels))
+        storage_metrics.append(Sample('storage_total', total_mb, mb_labels))
+        storage_metrics.append(Sample('storage_used', used_mb, mb_labels))
+        
+        # Send storage usage metrics (all in MB)
+        if storage_usage:
+            storage_usage.set(used_percent, mb_labels)
+        if storage_total:
+            storage_total.set(total_mb, mb_labels)
+        if storage_used:
+            storage_used.set(used_mb, mb_labels)
+        
+        logger.debug("Storage %s (%s): %.1f%% (%.2fMB/%.2fMB)", storage_id, storage_type, used_percent, used_mb, total_mb)
+    elif details is not None:
+        logger.debug("Storage %s (%s): no usage data available", storage_id, storage_type)
     
     return storage_metrics
 
 
 def collect_disk_smart_metrics(smart_metrics=None):
-    """Collect SMART metrics for physical disks."""
-    logger.info("Collecting disk SMART metrics")
-    smart_data = {}
+    """Collect SMART metrics for physical disks.
+
+    Returns:
+        list: Sample objects keyed 'smart_metrics'
+    """
+    logger.debug("Collecting disk SMART metrics")
+    smart_samples = []
     
     # Get list of physical disks
     lsblk_output = run_command("lsblk -d -o NAME,TYPE,SIZE -J")
     if not lsblk_output:
         logger.error("Failed to get disk list")
-        return smart_data
+        return smart_samples
+    
+    def record(value, labels):
+        smart_samples.append(Sample('smart_metrics', value, labels))
+        if smart_metrics:
+            smart_metrics.set(value, labels)
     
     try:
         disks = json.loads(lsblk_output)["blockdevices"]
@@ -125,13 +199,27 @@ def collect_disk_smart_metrics(smart_metrics=None):
         for disk in physical_disks:
             # Skip loop, ram, sr devices, and ZFS virtual devices (zd*)
             if disk.startswith(('loop', 'ram', 'sr', 'zd')):
-                logger.debug(f"Skipping non-physical or unsupported device: /dev/{disk}")
+                logger.debug("Skipping non-physical or unsupported device: /dev/%s", disk)
                 continue
+            
+            # NVMe health log through the admin passthrough ioctl; smartctl if that is unavailable
+            if disk.startswith("nvme"):
+                nvme_health = read_nvme_health(disk)
+                if nvme_health is not None:
+                    disk_model, disk_serial, nvme_log = nvme_health
+                    _record_nvme_log(record, disk, disk_model, disk_serial, nvme_log)
+                    if nvme_log["temperature"] is not None:
+                        record(nvme_log["temperature"], _smart_named_interner.get(
+                            disk, disk_model, disk_serial, "temperature", "Temperature"))
+                    # smartctl reports NVMe health as passed while no critical warning bit is set
+                    record(0 if nvme_log["critical_warning"] else 1, _smart_named_interner.get(
+                        disk, disk_model, disk_serial, "smart_passed", "SMART Passed"))
+                    continue
                 
             # Get SMART data in JSON format
             smartctl_output = run_command(f"smartctl -a -j /dev/{disk}")
             if not smartctl_output:
-                logger.info(f"No SMART data for disk /dev/{disk}")
+                logger.debug("No SMART data for disk /dev/%s", disk)
                 continue
                 
             try:
@@ -139,134 +227,63 @@ def collect_disk_smart_metrics(smart_metrics=None):
                 disk_model = disk_smart.get("model_name", "Unknown")
                 disk_serial = disk_smart.get("serial_number", "Unknown")
                 
-                # Create basic disk info
-                smart_data[disk] = {
-                    "model": disk_model,
-                    "serial": disk_serial,
-                    "attributes": {}
-                }
-                
                 # Process SMART attributes if available
                 if "ata_smart_attributes" in disk_smart and "table" in disk_smart["ata_smart_attributes"]:
                     for attr in disk_smart["ata_smart_attributes"]["table"]:
                         attr_id = attr.get("id")
-                        attr_name = attr.get("name", f"Unknown_{attr_id}")
+                        attr_name = attr.get("name") or f"Unknown_{attr_id}"
                         attr_value = attr.get("value")
                         attr_raw = attr.get("raw", {}).get("value")
-                        attr_thresh = attr.get("thresh")
-                        attr_worst = attr.get("worst")
                         
-                        # Clean up attribute name
-                        attr_name_clean = re.sub(r'[^a-zA-Z0-9_]', '_', attr_name).lower()
-                        
-                        # Store the attribute data
-                        smart_data[disk]["attributes"][attr_name_clean] = {
-                            "id": attr_id,
-                            "name": attr_name,
-                            "value": attr_value,
-                            "raw": attr_raw,
-                            "threshold": attr_thresh,
-                            "worst": attr_worst
-                        }
-                        
-                        # Create labels for this attribute
-                        labels = {
-                            "device": disk,
-                            "model": disk_model,
-                            "serial": disk_serial,
-                            "attribute_id": str(attr_id),
-                            "attribute_name": attr_name_clean,
-                        }
-                        legend = f"Disk: {disk} ({attr_name})"
                         # Send normalized value metric
-                        if smart_metrics and attr_value is not None:
-                            smart_metrics.set(attr_value, dict(labels, **{"type": "normalized", "legend": legend, "metric": "normalized"}))
+                        if attr_value is not None:
+                            record(attr_value, _smart_attribute_interner.get(
+                                disk, disk_model, disk_serial, attr_id, attr_name, "normalized"))
                         
                         # Send raw value metric for some useful attributes
-                        if smart_metrics and attr_raw is not None:
-                            smart_metrics.set(attr_raw, dict(labels, **{"type": "raw", "legend": legend, "metric": "raw"}))
+                        if attr_raw is not None:
+                            record(attr_raw, _smart_attribute_interner.get(
+                                disk, disk_model, disk_serial, attr_id, attr_name, "raw"))
                 
                 # Process NVMe SMART attributes if available
                 elif "nvme_smart_health_information_log" in disk_smart:
-                    logger.info(f"Processing NVMe SMART for /dev/{disk}")
-                    nvme_log = disk_smart["nvme_smart_health_information_log"]
-                    
-                    # Create base labels for NVMe attributes
-                    labels_base = {
-                        "device": disk,
-                        "model": disk_model,
-                        "serial": disk_serial,
-                    }
-                    
-                    # Report key NVMe SMART attributes
-                    if smart_metrics and "data_units_written" in nvme_log:
-                        legend = f"Disk: {disk} (NVMe Data Units Written)"
-                        smart_metrics.set(nvme_log["data_units_written"], 
-                                        dict(labels_base, attribute_name="nvme_data_units_written", type="raw", legend=legend, metric="nvme_data_units_written"))
-                    
-                    if smart_metrics and "data_units_read" in nvme_log:
-                        legend = f"Disk: {disk} (NVMe Data Units Read)"
-                        smart_metrics.set(nvme_log["data_units_read"], 
-                                        dict(labels_base, attribute_name="nvme_data_units_read", type="raw", legend=legend, metric="nvme_data_units_read"))
-                    
-                    if smart_metrics and "power_on_hours" in nvme_log:
-                        legend = f"Disk: {disk} (NVMe Power On Hours)"
-                        smart_metrics.set(nvme_log["power_on_hours"], 
-                                        dict(labels_base, attribute_name="nvme_power_on_hours", type="raw", legend=legend, metric="nvme_power_on_hours"))
-                    
-                    if smart_metrics and "media_errors" in nvme_log:
-                        legend = f"Disk: {disk} (NVMe Media Errors)"
-                        smart_metrics.set(nvme_log["media_errors"], 
-                                        dict(labels_base, attribute_name="nvme_media_errors", type="raw", legend=legend, metric="nvme_media_errors"))
-                    
-                    if smart_metrics and "critical_warning" in nvme_log:
-                        legend = f"Disk: {disk} (NVMe Critical Warning)"
-                        smart_metrics.set(nvme_log["critical_warning"], 
-                                        dict(labels_base, attribute_name="nvme_critical_warning", type="raw", legend=legend, metric="nvme_critical_warning"))
-                    
-                    # Store these values in our return structure too
-                    for key, value in nvme_log.items():
-                        if isinstance(value, (int, float)):
-                            attr_name_clean = f"nvme_{key}"
-                            smart_data[disk]["attributes"][attr_name_clean] = {
-                                "name": key,
-                                "raw": value
-                            }
+                    logger.debug("Processing NVMe SMART for /dev/%s", disk)
+                    _record_nvme_log(record, disk, disk_model, disk_serial,
+                                     disk_smart["nvme_smart_health_information_log"])
                 
                 # Extract temperature from SMART data if available
                 if "temperature" in disk_smart and "current" in disk_smart["temperature"]:
                     temp = disk_smart["temperature"]["current"]
-                    smart_data[disk]["temperature"] = temp
-                    
-                    # Create labels for temperature
-                    temp_labels = {
-                        "device": disk,
-                        "model": disk_model,
-                        "serial": disk_serial,
-                        "attribute_name": "temperature",
-                        "type": "raw",
-                        "legend": f"Disk: {disk} (Temperature)",
-                        "metric": "temperature"
-                    }
                     
                     # Send temperature as a separate metric
-                    if smart_metrics:
-                        smart_metrics.set(temp, temp_labels)
+                    record(temp, _smart_named_interner.get(disk, disk_model, disk_serial, "temperature", "Temperature"))
                     
-                    logger.info(f"Disk {disk} ({disk_model}) temperature: {temp}°C")
-                
+                    logger.debug("Disk %s (%s) temperature: %s°C", disk, disk_model, temp)
+
+                # Overall health self-assessment, 1 = passed (alerted on by lib/alerts.py)
+                if "passed" in disk_smart.get("smart_status", {}):
+                    record(1 if disk_smart["smart_status"]["passed"] else 0, _smart_named_interner.get(
+                        disk, disk_model, disk_serial, "smart_passed", "SMART Passed"))
+
                 # Log other important SMART metrics
-                logger.info(f"Disk {disk} ({disk_model}, S/N: {disk_serial}) SMART status: {_get_smart_health_status(disk_smart)}")
+                logger.debug("Disk %s (%s, S/N: %s) SMART status: %s", disk, disk_model, disk_serial, _get_smart_health_status(disk_smart))
                 
             except json.JSONDecodeError as e:
-                logger.error(f"Error parsing SMART data for disk {disk}: {e}")
+                logger.error("Error parsing SMART data for disk %s: %s", disk, e)
     
     except json.JSONDecodeError as e:
-        logger.error(f"Error parsing disk list JSON: {e}")
+        logger.error("Error parsing disk list JSON: %s", e)
     except Exception as e:
-        logger.error(f"Unexpected error while collecting SMART metrics: {e}")
+        logger.error("Unexpected error while collecting SMART metrics: %s", e)
     
-    return smart_data
+    return smart_samples
+
+
+def _record_nvme_log(record, disk, model, serial, nvme_log):
+    """Report the key fields of an NVMe health log (from smartctl or lib/nvme.py)."""
+    for field, attribute_name, legend_name in _NVME_ATTRIBUTES:
+        if field in nvme_log:
+            record(nvme_log[field], _smart_named_interner.get(disk, model, serial, attribute_name, legend_name))
 
 
 def _get_smart_health_status(smart_data):
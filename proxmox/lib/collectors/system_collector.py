@@ -3,134 +3,154 @@
 System metrics collector for Proxmox OpenTelemetry Monitoring
 """
 import json
+import os
 import re
 import time
-from lib.config import logger
+from lib.config import logger, get_config
 from lib.utils import run_command
+from lib.cluster import read_pve_members
+from lib.samples import Sample, LabelInterner
 
-# Helper to compute CPU usage from /proc/stat
-_prev_cpu_times = None
-def get_cpu_usage_proc_stat():
-    global _prev_cpu_times
+_node_labels = LabelInterner("node", "hostname")
+_cluster_node_labels = LabelInterner("node")
+
+# Last cluster status and where it came from ('members' file or 'pvesh')
+_cluster_status_cache = {'source': None, 'mtime': None, 'timestamp': 0.0, 'status': None}
+
+def read_cpu_times_proc_stat():
+    """Return (idle, total) jiffies of the aggregate 'cpu' line in /proc/stat, or None."""
     try:
         with open('/proc/stat', 'r') as f:
             line = f.readline()
             if not line.startswith('cpu '):
-                return 0
+                return None
             parts = line.strip().split()
             # user, nice, system, idle, iowait, irq, softirq, steal, guest, guest_nice
             values = list(map(int, parts[1:]))
             idle = values[3] + values[4] if len(values) > 4 else values[3]
-            total = sum(values)
-            if _prev_cpu_times is not None:
-                prev_idle, prev_total = _prev_cpu_times
-                delta_idle = idle - prev_idle
-                delta_total = total - prev_total
-                cpu_usage = 1.0 - (delta_idle / delta_total) if delta_total > 0 else 0
-            else:
-                cpu_usage = 0
-            _prev_cpu_times = (idle, total)
-            return cpu_usage * 100
+            return idle, sum(values)
     except Exception as e:
-        logger.error(f"Error reading /proc/stat for CPU usage: {e}")
+        logger.error("Error reading /proc/stat for CPU usage: %s", e)
+        return None
+
+def cpu_usage_between(prev_times, cpu_times):
+    """CPU usage percent between two read_cpu_times_proc_stat() results."""
+    if prev_times is None or cpu_times is None:
         return 0
+    delta_idle = cpu_times[0] - prev_times[0]
+    delta_total = cpu_times[1] - prev_times[1]
+    return (1.0 - delta_idle / delta_total) * 100 if delta_total > 0 else 0
+
+# Previous /proc/stat reading of the system collector's fallback; the
+# high-frequency sampler keeps its own so the two do not shorten each other's delta
+_prev_cpu_times = None
+def get_cpu_usage_proc_stat():
+    global _prev_cpu_times
+    cpu_times = read_cpu_times_proc_stat()
+    cpu_usage = cpu_usage_between(_prev_cpu_times, cpu_times)
+    if cpu_times is not None:
+        _prev_cpu_times = cpu_times
+    return cpu_usage
 
 def collect_system_metrics(cpu_usage=None, memory_usage=None, memory_total=None, 
-                          memory_used=None, node_uptime=None, 
-                          net_in_bytes=None, net_out_bytes=None):
-    """Collect system metrics from Proxmox node."""
-    logger.info("Collecting node system metrics")
-    system_metrics = {}
+                          memory_used=None, node_uptime=None):
+    """Collect system metrics from Proxmox node.
+
+    Returns:
+        list: Sample objects keyed 'cpu_usage', 'memory_usage', 'memory_total',
+              'memory_used' and 'node_uptime'
+    """
+    logger.debug("Collecting node system metrics")
+    system_metrics = []
     
     try:
         # Get node status from Proxmox API
         node_status = run_command("pvesh get /nodes/`hostname`/status -output-format json")
         if node_status:
             try:
-                node_data = json.loads(node_status)
-                
-                # Node information
-                hostname = node_data.get('pveversion', 'unknown').split('/')[-1]
-                node_id = node_data.get('node', 'unknown')
-                
-                # Basic labels for all metrics
-                node_labels = {
-                    "node": node_id,
-                    "hostname": hostname
-                }
-                
-                system_metrics['node'] = {
-                    'id': node_id,
-                    'hostname': hostname,
-                    'pve_version': node_data.get('pveversion', 'unknown'),
-                    'kernel_version': node_data.get('kernel', 'unknown'),
-                    'uptime': node_data.get('uptime', 0)
-                }
-                
-                # Memory metrics
-                if 'memory' in node_data:
-                    memory_data = node_data['memory']
-                    total_mem = memory_data.get('total', 0)
-                    used_mem = memory_data.get('used', 0)
-                    free_mem = memory_data.get('free', 0)
-                    
-                    # Calculate percentage
-                    mem_usage_pct = (used_mem / total_mem) * 100 if total_mem > 0 else 0
-                    
-                    system_metrics['memory'] = {
-                        'total': total_mem,
-                        'used': used_mem,
-                        'free': free_mem,
-                        'usage_percent': mem_usage_pct
-                    }
-                    
-                    # Send memory metrics
-                    if memory_usage:
-                        memory_usage.set(mem_usage_pct, node_labels)
-                    if memory_total:
-                        memory_total.set(total_mem, node_labels)
-                    if memory_used:
-                        memory_used.set(used_mem, node_labels)
-                    
-                    logger.info(f"Memory Usage: {mem_usage_pct:.1f}% ({used_mem/(1024**3):.1f}GB/{total_mem/(1024**3):.1f}GB)")
-                
-                # CPU metrics
-                if 'cpu' in node_data:
-                    cpu_data = node_data['cpu']
-                    # If Proxmox API returns 0, fallback to /proc/stat
-                    if cpu_data == 0:
-                        logger.warning("Proxmox API returned cpu=0, using /proc/stat fallback.")
-                        cpu_usage_pct = get_cpu_usage_proc_stat()
-                    else:
-                        cpu_usage_pct = cpu_data * 100 if isinstance(cpu_data, (int, float)) else 0
-                    
-                    system_metrics['cpu'] = {
-                        'usage_percent': cpu_usage_pct
-                    }
-                    
-                    # Send CPU metrics
-                    if cpu_usage:
-                        cpu_usage.set(cpu_usage_pct, node_labels)
-                    
-                    logger.info(f"CPU Usage: {cpu_usage_pct:.1f}%")
-                
-                # Uptime
-                uptime_seconds = node_data.get('uptime', 0)
-                if node_uptime:
-                    node_uptime.set(uptime_seconds, node_labels)
+                system_metrics = record_node_status(json.loads(node_status), cpu_usage, memory_usage,
+                                                    memory_total, memory_used, node_uptime)
                 
-                logger.info(f"Node Uptime: {uptime_seconds/(60*60*24):.1f} days")
-                
-                # Disk I/O metrics are now collected via observable callbacks in main.py
+                # Disk I/O and network metrics are collected via observable callbacks in main.py
                 
             except json.JSONDecodeError as e:
-                logger.error(f"Error parsing node status JSON: {e}")
+                logger.error("Error parsing node status JSON: %s", e)
     
     except Exception as e:
-        logger.error(f"Error collecting system metrics: {e}")
+        logger.error("Error collecting system metrics: %s", e)
     
     return system_metrics
 
+def record_node_status(node_data, cpu_usage=None, memory_usage=None, memory_total=None,
+                       memory_used=None, node_uptime=None, node_name=None, proc_stat_fallback=True):
+    """Set the node metrics from a /nodes/{node}/status response.
+
+    The API poller passes node_name, the node it polled, and
+    proc_stat_fallback=False since /proc/stat is not that node's.
+
+    Returns:
+        list: Sample objects keyed 'cpu_usage', 'memory_usage', 'memory_total',
+              'memory_used' and 'node_uptime'
+    """
+    system_metrics = []
+    
+    # Node information
+    hostname = node_data.get('pveversion', 'unknown').split('/')[-1]
+    node_id = node_name or node_data.get('node', 'unknown')
+    
+    # Basic labels for all metrics
+    node_labels = _node_labels.get(node_id, hostname)
+    
+    # Memory metrics
+    if 'memory' in node_data:
+        memory_data = node_data['memory']
+        total_mem = memory_data.get('total', 0)
+        used_mem = memory_data.get('used', 0)
+        
+        # Calculate percentage
+        mem_usage_pct = (used_mem / total_mem) * 100 if total_mem > 0 else 0
+        
+        system_metrics.append(Sample('memory_usage', mem_usage_pct, node_labels))
+        system_metrics.append(Sample('memory_total', total_mem, node_labels))
+        system_metrics.append(Sample('memory_used', used_mem, node_labels))
+        
+        # Send memory metrics
+        if memory_usage:
+            memory_usage.set(mem_usage_pct, node_labels)
+        if memory_total:
+            memory_total.set(total_mem, node_labels)
+        if memory_used:
+            memory_used.set(used_mem, node_labels)
+        
+        logger.debug("Memory Usage: %.1f%% (%.1fGB/%.1fGB)", mem_usage_pct, used_mem/(1024**3), total_mem/(1024**3))
+    
+    # CPU metrics
+    if 'cpu' in node_data:
+        cpu_data = node_data['cpu']
+        # If Proxmox API returns 0, fallback to /proc/stat (only for the local node)
+        if cpu_data == 0 and proc_stat_fallback:
+            logger.warning("Proxmox API returned cpu=0, using /proc/stat fallback.")
+            cpu_usage_pct = get_cpu_usage_proc_stat()
+        else:
+            cpu_usage_pct = cpu_data * 100 if isinstance(cpu_data, (int, float)) else 0
+        
+        system_metrics.append(Sample('cpu_usage', cpu_usage_pct, node_labels))
+        
+        # Send CPU metrics
+        if cpu_usage:
+            cpu_usage.set(cpu_usage_pct, node_labels)
+        
+        logger.debug("CPU Usage: %.1f%%", cpu_usage_pct)
+    
+    # Uptime
+    uptime_seconds = node_data.get('uptime', 0)
+    system_metrics.append(Sample('node_uptime', uptime_seconds, node_labels))
+    if node_uptime:
+        node_uptime.set(uptime_seconds, node_labels)
+    
+    logger.debug("Node Uptime: %.1f days", uptime_seconds/(60*60*24))
+    
+    return system_metrics
 
 def collect_disk_io_data_raw():
     """Collect raw disk I/O metrics without updating OpenTelemetry instruments.
@@ -139,12 +159,15 @@ def collect_disk_io_data_raw():
         dict: A dictionary with device names as keys and I/O metrics as values.
               Each device's metrics include bytes_read, bytes_written, and other stats.
     """
-    logger.info("Collecting disk I/O metrics")
+    logger.debug("Collecting disk I/O metrics")
     io_metrics = {}
     
-    # Run command to get disk I/O statistics
-    io_stats = run_command("cat /proc/diskstats")
-    if not io_stats:
+    # Read disk I/O statistics directly - this also runs from the 1 Hz sampler
+    try:
+        with open('/proc/diskstats', 'r') as f:
+            io_stats = f.read()
+    except OSError as e:
+        logger.error("Error reading /proc/diskstats: %s", e)
         return io_metrics
     
     # Parse disk I/O statistics
@@ -192,65 +215,123 @@ def collect_disk_io_data_raw():
             'time_writing_ms': time_writing_ms
         }
         
-        logger.info(f"Disk {device}: Read {bytes_read/(1024**3):.1f}GB, Write {bytes_written/(1024**3):.1f}GB")
+        logger.debug("Disk %s: Read %.1fGB, Write %.1fGB", device, bytes_read/(1024**3), bytes_written/(1024**3))
     
     return io_metrics
 
 
-def collect_cluster_status(cluster_quorate=None, cluster_nodes=None):
-    """Collect Proxmox cluster status metrics."""
-    logger.info("Collecting cluster status")
-    cluster_metrics = {
+def _read_cluster_status_members():
+    """Build cluster status from /etc/pve/.members, re-reading it when its mtime changes.
+
+    pmxcfs does not reliably update the mtime of .members, so a cached status
+    is also re-read once it is CLUSTER_STATUS_INTERVAL seconds old.
+
+    Returns:
+        dict: Cluster status, or None if the members file is not available
+    """
+    members_file = get_config().pve_members_file
+    try:
+        mtime = os.stat(members_file).st_mtime_ns
+    except OSError:
+        return None
+
+    if (_cluster_status_cache['source'] == 'members' and _cluster_status_cache['mtime'] == mtime
+            and time.monotonic() - _cluster_status_cache['timestamp'] < get_config().cluster_status_interval_seconds):
+        return _cluster_status_cache['status']
+
+    members = read_pve_members(members_file)
+    if members is None:
+        return None
+
+    status = {
+        'quorate': None,
+        'nodes': {},
+        'in_cluster': False
+    }
+    # A standalone node has no 'cluster' section
+    cluster_info = members.get('cluster')
+    if cluster_info:
+        status['in_cluster'] = True
+        status['quorate'] = bool(cluster_info.get('quorate', 0))
+        for node_id, node in members.get('nodelist', {}).items():
+            status['nodes'][node_id] = {
+                'online': bool(node.get('online', 0)),
+                'ip': node.get('ip', 'unknown'),
+                'id': node.get('id', 0)
+            }
+
+    _cluster_status_cache.update(source='members', mtime=mtime, timestamp=time.monotonic(), status=status)
+    return status
+
+
+def _read_cluster_status_pvesh():
+    """Build cluster status from the Proxmox API, refreshed at most every CLUSTER_STATUS_INTERVAL_SECONDS."""
+    if (_cluster_status_cache['source'] == 'pvesh'
+            and time.monotonic() - _cluster_status_cache['timestamp'] < get_config().cluster_status_interval_seconds):
+        return _cluster_status_cache['status']
+
+    status = {
         'quorate': None,
         'nodes': {},
         'in_cluster': False
     }
-    
-    # Check if node is part of a cluster
     cluster_status = run_command("pvesh get /cluster/status -output-format json")
-    if not cluster_status:
-        logger.info("Node is not part of a cluster")
+    if cluster_status:
+        try:
+            for item in json.loads(cluster_status) or []:
+                if item.get('type') == 'quorum':
+                    status['in_cluster'] = True
+                    status['quorate'] = bool(item.get('quorate', 0))
+                elif item.get('type') == 'node':
+                    status['nodes'][item.get('name', 'unknown')] = {
+                        'online': bool(item.get('online', 0)),
+                        'ip': item.get('ip', 'unknown'),
+                        'id': item.get('id', 0)
+                    }
+        except json.JSONDecodeError as e:
+            logger.error("Error parsing cluster status JSON: %s", e)
+
+    _cluster_status_cache.update(source='pvesh', mtime=None, timestamp=time.monotonic(), status=status)
+    return status
+
+
+def collect_cluster_status(cluster_quorate=None, cluster_nodes=None, include_nodes=True):
+    """Collect Proxmox cluster status metrics.
+
+    The status is read from the local pmxcfs members file and cached until the
+    file changes; pvesh is only used when that file is unavailable. Gauges are
+    set from the cached status on every call.
+
+    Quorum is reported by every node (each node has its own view of quorum),
+    the per-node online list only when include_nodes is True (cluster reporter).
+
+    Returns:
+        list: Sample objects keyed 'cluster_quorate' and 'cluster_nodes'
+    """
+    logger.debug("Collecting cluster status")
+    cluster_metrics = []
+    status = _read_cluster_status_members()
+    if status is None:
+        status = _read_cluster_status_pvesh()
+
+    if not status['in_cluster']:
+        logger.debug("Node is not part of a cluster")
         return cluster_metrics
-    
-    try:
-        status_data = json.loads(cluster_status)
-        if not status_data:
-            logger.info("No cluster data available")
-            return cluster_metrics
-        
-        # Node is part of a cluster
-        cluster_metrics['in_cluster'] = True
-        
-        # Get quorum status
-        for item in status_data:
-            if item.get('type') == 'quorum':
-                quorate = item.get('quorate', 0)
-                cluster_metrics['quorate'] = bool(quorate)
-                
-                # Send quorate metric
-                if cluster_quorate:
-                    cluster_quorate.set(1 if quorate else 0, {})
-                
-                logger.info(f"Cluster quorate: {quorate}")
-                
-            elif item.get('type') == 'node':
-                node_id = item.get('name', 'unknown')
-                node_online = item.get('online', 0)
-                
-                # Store node status
-                cluster_metrics['nodes'][node_id] = {
-                    'online': bool(node_online),
-                    'ip': item.get('ip', 'unknown'),
-                    'id': item.get('id', 0)
-                }
-                
-                # Send node online metric
-                if cluster_nodes:
-                    cluster_nodes.set(1 if node_online else 0, {"node": node_id})
-                
-                logger.info(f"Cluster node {node_id}: {'online' if node_online else 'offline'}")
-    
-    except json.JSONDecodeError as e:
-        logger.error(f"Error parsing cluster status JSON: {e}")
-    
-    return cluster_metrics
\ No newline at end of file
+
+    quorate = status['quorate']
+    if quorate is not None:
+        quorate_labels = _cluster_node_labels.get(get_config().node_name)
+        cluster_metrics.append(Sample('cluster_quorate', 1 if quorate else 0, quorate_labels))
+        if cluster_quorate:
+            cluster_quorate.set(1 if quorate else 0, quorate_labels)
+    logger.debug("Cluster quorate: %s", quorate)
+
+    if include_nodes:
+        for node_id, node in status['nodes'].items():
+            node_labels = _cluster_node_labels.get(node_id)
+            cluster_metrics.append(Sample('cluster_nodes', 1 if node['online'] else 0, node_labels))
+            if cluster_nodes:
+                cluster_nodes.set(1 if node['online'] else 0, node_labels)
+            logger.debug("Cluster node %s: %s", node_id, 'online' if node['online'] else 'offline')
+
+    return cluster_metrics
@@ -0,0 +1,351 @@
+#!/usr/bin/env python3
+"""
+PVE task collector for Proxmox OpenTelemetry Monitoring
+
+Finished tasks are appended to /var/log/pve/tasks/index, one UPID per line
+followed by the end time and status; running and recently finished tasks are
+listed in /var/log/pve/tasks/active. The index grows without bound, so it is
+tailed from a persisted offset: each cycle reads only the lines appended
+since the previous one. When PVE trims the index in place, reading resumes
+after the last processed task, looked up in the recent end of the file. The
+per-guest results (last status, duration and
+last success) are kept in the state file so a restart does not rescan the
+history. Backup jobs covering several guests have an empty UPID id; their
+per-guest results are read from that task's own log file, once.
+"""
+import json
+import os
+import re
+from lib.config import logger, get_config
+from lib.samples import LabelInterner, Sample
+
+# Tracked UPID task types and the `type` label they are exported with
+TRACKED_TASK_TYPES = {"vzdump": "backup", "pvesr": "replication"}
+
+# Bytes read from the end of the index when there is no state yet, or to find
+# the last processed task after the index was rewritten in place
+INDEX_SEED_BYTES = 1024 * 1024
+
+# UPIDs remembered to avoid counting a task twice (active file, index rewrites)
+_RECENT_UPIDS = 500
+
+_FINISHED_BACKUP_RE = re.compile(r'Finished Backup of VM (\d+) \((\d+):(\d+):(\d+)\)')
+_FAILED_BACKUP_RE = re.compile(r'ERROR: Backup of VM (\d+) failed')
+
+_task_labels = LabelInterner("node", "type", "vmid")
+_backup_labels = LabelInterner("node", "vmid")
+_run_labels = LabelInterner("node", "type", "vmid", "status")
+_running_labels = LabelInterner("node", "type")
+
+# Tail position and per-guest results, loaded from the state file on first use
+_state = None
+
+
+def parse_upid(upid):
+    """Decode a PVE UPID (UPID:node:pid:pstart:starttime:type:id:user:).
+
+    Returns:
+        dict: node, pid, pstart, starttime (epoch seconds), type, id and user,
+              or None if the string is not a PVE UPID
+    """
+    parts = upid.split(':')
+    if len(parts) < 9 or parts[0] != 'UPID':
+        return None
+    try:
+        return {
+            'node': parts[1],
+            'pid': int(parts[2], 16),
+            'pstart': int(parts[3], 16),
+            'starttime': int(parts[4], 16),
+            'starttime_hex': parts[4],
+            'type': parts[5],
+            'id': parts[6],
+            'user': parts[7],
+        }
+    except ValueError:
+        return None
+
+
+def parse_index_line(line, active=False):
+    """Parse a line of the task index or active file.
+
+    Index lines are '<UPID> <endtime hex> <status>'; active lines carry a
+    'saved' flag after the UPID and no end time while the task runs.
+
+    Returns:
+        tuple: (upid, task, endtime or None, status or None), or None for malformed lines
+    """
+    fields = line.split(' ', 3 if active else 2)
+    task = parse_upid(fields[0])
+    if task is None:
+        return None
+    if active:
+        fields = fields[:1] + fields[2:]
+    if len(fields) < 3:
+        return fields[0], task, None, None
+    try:
+        return fields[0], task, int(fields[1], 16), fields[2].strip()
+    except ValueError:
+        return None
+
+
+def _outcome(status):
+    """Map a task status to ok, warning or error."""
+    if status == 'OK':
+        return 'ok'
+    if status.startswith('WARNINGS'):
+        return 'warning'
+    return 'error'
+
+
+def _task_log_path(upid, task):
+    # Task logs are spread over 16 directories by the last hex digit of the start time
+    return os.path.join(get_config().task_log_dir, task['starttime_hex'][-1].upper(), upid)
+
+
+def _backup_results_from_log(upid, task):
+    """Per-guest (vmid, outcome, duration) of a multi-guest backup job, from its task log."""
+    results = []
+    try:
+        with open(_task_log_path(upid, task), errors='replace') as f:
+            for line in f:
+                match = _FINISHED_BACKUP_RE.search(line)
+                if match:
+                    hours, minutes, seconds = (int(value) for value in match.group(2, 3, 4))
+                    results.append((match.group(1), 'ok', hours * 3600 + minutes * 60 + seconds))
+                    continue
+                match = _FAILED_BACKUP_RE.search(line)
+                if match:
+                    results.append((match.group(1), 'error', None))
+    except OSError as e:
+        logger.debug("No task log for %s: %s", upid, e)
+    return results
+
+
+def _new_state():
+    # last: [UPID, end time] of the last index line read
+    return {'inode': None, 'offset': 0, 'last': None, 'recent': [], 'guests': {}, 'runs': {}}
+
+
+def _load_state():
+    path = get_config().task_state_file
+    try:
+        with open(path) as f:
+            state = json.load(f)
+        return dict(_new_state(), **state)
+    except FileNotFoundError:
+        return _new_state()
+    except (OSError, ValueError) as e:
+        logger.error("Could not read task state %s, starting from the end of the index: %s", path, e)
+        return _new_state()
+
+
+def _save_state(state):
+    path = get_config().task_state_file
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump(state, f)
+        os.replace(tmp_path, path)
+    except OSError as e:
+        logger.error("Could not write task state %s: %s", path, e)
+
+
+def _record(state, upid, task, endtime, status):
+    """Apply one finished task to the per-guest results. Returns False if already seen."""
+    if upid in state['recent']:
+        return False
+    state['recent'].append(upid)
+    del state['recent'][:-_RECENT_UPIDS]
+
+    task_type = task['type']
+    if task_type == 'vzdump' and not task['id']:
+        # Multi-guest backup job: one result per guest from the task log
+        results = _backup_results_from_log(upid, task)
+    else:
+        # Replication job ids are <vmid>-<job number>
+        vmid = task['id'].split('-', 1)[0] if task_type == 'pvesr' else task['id']
+        results = [(vmid, _outcome(status), endtime - task['starttime'])]
+
+    for vmid, outcome, duration in results:
+        key = f"{task['node']}:{task_type}:{vmid}"
+        guest = state['guests'].setdefault(key, {'endtime': 0})
+        # An older task read after a newer one (index rewrite) is counted but does not replace the result
+        if endtime >= guest['endtime']:
+            guest.update(endtime=endtime, outcome=outcome, duration=duration)
+        if outcome != 'error':
+            guest['last_success'] = max(guest.get('last_success') or 0, endtime)
+        run_key = f"{key}:{outcome}"
+        state['runs'][run_key] = state['runs'].get(run_key, 0) + 1
+    return True
+
+
+def _read_from(path, offset):
+    """Read complete lines of a file from an offset. Returns (lines, new offset)."""
+    with open(path, 'rb') as f:
+        f.seek(offset)
+        data = f.read()
+    end = data.rfind(b'\n') + 1
+    # A partially written last line is read again next cycle
+    return data[:end].decode(errors='replace').splitlines(), offset + end
+
+
+def _read_tail(path, size):
+    """Read the complete lines of the last INDEX_SEED_BYTES of a file. Returns (lines, new offset)."""
+    offset = max(size - INDEX_SEED_BYTES, 0)
+    lines, end = _read_from(path, offset)
+    # The first line is partial unless the window starts at the beginning of the file
+    return (lines[1:] if offset else lines), end
+
+
+def _lines_after(lines, last):
+    """Drop the lines up to the last processed task from a rewritten index window."""
+    if last is None:
+        return lines
+    upid, endtime = last
+    for position in range(len(lines) - 1, -1, -1):
+        if lines[position].split(' ', 1)[0] == upid:
+            return lines[position + 1:]
+    # The task was trimmed away: keep what ended since; already seen UPIDs are skipped
+    kept = []
+    for line in lines:
+        parsed = parse_index_line(line)
+        if parsed and parsed[2] is not None and parsed[2] >= endtime:
+            kept.append(line)
+    return kept
+
+
+def _tail_index(state):
+    """Return the index lines appended since the last call and advance the persisted position."""
+    index_path = os.path.join(get_config().task_log_dir, "index")
+    try:
+        stat = os.stat(index_path)
+    except OSError as e:
+        logger.debug("No task index at %s: %s", index_path, e)
+        return []
+
+    if state['inode'] is None:
+        # First run: seed the per-guest results from the recent end of the index only
+        lines, state['offset'] = _read_tail(index_path, stat.st_size)
+    elif state['inode'] == stat.st_ino and stat.st_size < state['offset']:
+        # Rewritten in place: resume after the last processed task instead of rescanning the history
+        lines, state['offset'] = _read_tail(index_path, stat.st_size)
+        lines = _lines_after(lines, state['last'])
+    else:
+        lines = []
+        if state['inode'] != stat.st_ino:
+            # Rotated: finish the previous file (now index.1), then read the new one from the start
+            rotated_path = f"{index_path}.1"
+            try:
+                if os.stat(rotated_path).st_ino == state['inode']:
+                    lines, _ = _read_from(rotated_path, state['offset'])
+            except OSError:
+                pass
+            state['offset'] = 0
+        new_lines, state['offset'] = _read_from(index_path, state['offset'])
+        lines += new_lines
+    state['inode'] = stat.st_ino
+    for line in reversed(lines):
+        parsed = parse_index_line(line)
+        if parsed and parsed[2] is not None:
+            state['last'] = [parsed[0], parsed[2]]
+            break
+    return lines
+
+
+def collect_task_metrics(backup_status=None, task_duration=None, task_last_success=None,
+                         task_runs=None, tasks_running=None):
+    """Collect backup and replication task results from the PVE task index.
+
+    task_runs counts the tasks that finished since the previous call, so the
+    counter restarts from zero with the agent like any other OTel counter.
+    Tasks seeded from the index without a state file are not counted.
+
+    Returns:
+        list: Sample objects keyed 'backup_status', 'task_duration',
+              'task_last_success', 'task_runs' and 'tasks_running'
+    """
+    global _state
+
+    logger.debug("Collecting PVE task metrics")
+    if _state is None:
+        _state = _load_state()
+    state = _state
+    seeding = state['inode'] is None
+    position_before = (state['inode'], state['offset'])
+    runs_before = dict(state['runs'])
+
+    finished = 0
+    try:
+        for line in _tail_index(state):
+            parsed = parse_index_line(line)
+            if parsed and parsed[1]['type'] in TRACKED_TASK_TYPES and parsed[2] is not None:
+                finished += _record(state, *parsed)
+    except OSError as e:
+        logger.error("Error reading PVE task index: %s", e)
+
+    # Tasks that finished but are not in the index yet, and the running ones
+    running = {}
+    try:
+        with open(os.path.join(get_config().task_log_dir, "active"), errors='replace') as f:
+            for line in f:
+                parsed = parse_index_line(line.rstrip('\n'), active=True)
+                if not parsed or parsed[1]['type'] not in TRACKED_TASK_TYPES:
+                    continue
+                upid, task, endtime, status = parsed
+                if endtime is None:
+                    key = (task['node'], task['type'])
+                    running[key] = running.get(key, 0) + 1
+                else:
+                    finished += _record(state, upid, task, endtime, status)
+    except OSError as e:
+        logger.debug("Could not read active tasks: %s", e)
+
+    # Most cycles see no new task; only rewrite the state file when it changed
+    if finished or (state['inode'], state['offset']) != position_before:
+        _save_state(state)
+    if seeding:
+        # The seed window's backlog is history, not tasks finished this cycle
+        runs_before = dict(state['runs'])
+
+    samples = []
+    for key, guest in state['guests'].items():
+        node, task_type, vmid = key.split(':', 2)
+        labels = _task_labels.get(node, TRACKED_TASK_TYPES[task_type], vmid)
+        if guest['duration'] is not None:
+            samples.append(Sample('task_duration', guest['duration'], labels))
+        if guest.get('last_success'):
+            samples.append(Sample('task_last_success', guest['last_success'], labels))
+        if task_type == 'vzdump':
+            samples.append(Sample('backup_status', 0 if guest['outcome'] == 'error' else 1,
+                                  _backup_labels.get(node, vmid)))
+
+    for run_key, count in state['runs'].items():
+        node, task_type, vmid, outcome = run_key.split(':', 3)
+        increment = count - runs_before.get(run_key, 0)
+        if increment:
+            samples.append(Sample('task_runs', increment,
+                                  _run_labels.get(node, TRACKED_TASK_TYPES[task_type], vmid, outcome)))
+
+    for task_type, label in TRACKED_TASK_TYPES.items():
+        nodes = {node for node, running_type in running if running_type == task_type} or {get_config().node_name}
+        for node in nodes:
+            samples.append(Sample('tasks_running', running.get((node, task_type), 0),
+                                  _running_labels.get(node, label)))
+
+    instruments = {
+        'backup_status': backup_status, 'task_duration': task_duration,
+        'task_last_success': task_last_success, 'task_runs': task_runs, 'tasks_running': tasks_running,
+    }
+    for sample in samples:
+        instrument = instruments[sample.metric]
+        if instrument is None:
+            continue
+        if sample.metric == 'task_runs':
+            instrument.add(sample.value, sample.labels)
+        else:
+            instrument.set(sample.value, sample.labels)
+
+    logger.debug("Processed %d finished tasks, %d guests tracked", finished, len(state['guests']))
+    return samples
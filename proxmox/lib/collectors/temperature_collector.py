@@ -10,17 +10,76 @@ This module collects temperature data from various sensors including:
 - Other miscellaneous temperature sensors
 """
 import json
-import time
-from lib.config import (
-    logger, TEMP_CRITICAL_THRESHOLD,
-    DISK_TEMP_WARNING_THRESHOLD
-)
-from lib.utils import run_command, create_log_record
+from lib.config import logger
+from lib.samples import Sample, LabelInterner
+from lib.cpu_topology import CpuTopology
+from lib.utils import run_command
 
-def collect_temperature_metrics(temperature_gauge, logger_otel):
-    """Collect comprehensive temperature metrics from all available sensors."""
-    logger.info("Collecting temperature metrics")
-    temp_metrics = {}
+
+def _cpu_core_labels(core_num, high, crit, socket_id):
+    labels = {
+        "source": "cpu",
+        "type": "core",
+        "name": f"core_{core_num}",
+        "high": str(high),
+        "critical": str(crit)
+    }
+    # Add socket information if available
+    if socket_id is not None:
+        labels["socket"] = socket_id
+    return labels
+
+
+# Attribute sets per sensor kind, built once per sensor and reused every cycle
+_cpu_package_labels = LabelInterner(build=lambda package_id, high, crit: {
+    "source": "cpu",
+    "type": "package",
+    "name": f"package_id_{package_id}",
+    "high": str(high),
+    "critical": str(crit)
+})
+_cpu_core_interner = LabelInterner(build=_cpu_core_labels)
+_nvme_composite_labels = LabelInterner(build=lambda device_name, high, crit: {
+    "source": "nvme",
+    "type": "composite",
+    "name": device_name,
+    "high": str(high),
+    "critical": str(crit)
+})
+_nvme_sensor_labels = LabelInterner(build=lambda adapter_name, sensor_num, high_attr: {
+    "source": "nvme",
+    "type": "sensor",
+    "name": f"{adapter_name.replace('-', '_')}_sensor_{sensor_num}",
+    "high": high_attr
+})
+_acpi_labels = LabelInterner(build=lambda temp_key: {
+    "source": "acpi",
+    "type": "temp",
+    "name": f"acpi_{temp_key}"
+})
+_gigabyte_labels = LabelInterner(build=lambda name: {
+    "source": "gigabyte_wmi",
+    "type": "motherboard_sensor",
+    "name": name
+})
+_other_labels = LabelInterner(build=lambda adapter_name, key, temp_key: {
+    "source": "other",
+    "type": "temp",
+    "name": f"{adapter_name}_{key}_{temp_key}".replace('-', '_')
+})
+
+# Core-to-socket mapping of the coretemp sensors, rebuilt when CPUs are hotplugged
+_topology = CpuTopology()
+
+
+def collect_temperature_metrics(temperature_gauge):
+    """Collect comprehensive temperature metrics from all available sensors.
+
+    Returns:
+        list: Sample objects keyed 'temperature'
+    """
+    logger.debug("Collecting temperature metrics")
+    temp_metrics = []
     
     # Get sensor data using lm-sensors with JSON output
     sensors_output = run_command("sensors -j")
@@ -30,6 +89,8 @@ def collect_temperature_metrics(temperature_gauge, logger_otel):
     
     try:
         sensors_data = json.loads(sensors_output)
+        # Re-read only after CPU hotplug
+        _topology.refresh()
         
         # Process each adapter type
         for adapter_name, adapter_data in sensors_data.items():
@@ -57,7 +118,7 @@ def collect_temperature_metrics(temperature_gauge, logger_otel):
                                 
                                 # Skip reporting invalid temperatures
                                 if package_temp is None or not isinstance(package_temp, (int, float)) or package_temp <= 0:
-                                    logger.warning(f"Invalid temperature value for CPU {package_key}: {package_temp}")
+                                    logger.warning("Invalid temperature value for CPU %s: %s", package_key, package_temp)
                                     continue
                                 
                                 # Use sensible defaults only if thresholds are missing
@@ -67,44 +128,20 @@ def collect_temperature_metrics(temperature_gauge, logger_otel):
                                 if package_crit is None or not isinstance(package_crit, (int, float)) or package_crit <= 0:
                                     package_crit = 105.0  # Common critical threshold
                                 
-                                # Add socket information to the attributes for better organization in dashboards
+                                # Fallback for the core readings of this adapter if sysfs has no hwmon labels
+                                _topology.learn_adapter(adapter_name, package_id_str)
+                                
                                 # Set metric
+                                labels = _cpu_package_labels.get(package_id_str, package_high, package_crit)
                                 if temperature_gauge:
-                                    temperature_gauge.set(package_temp, {
-                                        "source": "cpu",
-                                        "type": "package",
-                                        "name": f"package_id_{package_id_str}",
-                                        "high": str(package_high),
-                                        "critical": str(package_crit)
-                                    })
-                                
-                                temp_metrics[f"cpu_package_{package_id_str}"] = {
-                                    "temperature": package_temp,
-                                    "high": package_high,
-                                    "critical": package_crit
-                                }
+                                    temperature_gauge.set(package_temp, labels)
+                                temp_metrics.append(Sample('temperature', package_temp, labels))
                                 
-                                logger.info(f"CPU Package {package_id_str}: {package_temp}°C (High: {package_high}°C, Critical: {package_crit}°C)")
-                                
-                                # Alert on critical temperature
-                                if package_temp >= package_crit - TEMP_CRITICAL_THRESHOLD:
-                                    if logger_otel:
-                                        log_record = create_log_record(
-                                            timestamp=int(time.time() * 1e9),
-                                            body=f"ALERT: CPU Package {package_id_str} temperature critical: {package_temp}°C",
-                                            severity="ERROR",
-                                            attributes={
-                                                "event.type": "alert",
-                                                "sensor": f"cpu_package_{package_id_str}",
-                                                "temperature": package_temp,
-                                                "critical": package_crit
-                                            }
-                                        )
-                                        logger_otel.emit(log_record)
+                                logger.debug("CPU Package %s: %s°C (High: %s°C, Critical: %s°C)", package_id_str, package_temp, package_high, package_crit)
                             else:
-                                logger.warning(f"No temperature input key found for CPU {package_key} in {adapter_name}")
+                                logger.warning("No temperature input key found for CPU %s in %s", package_key, adapter_name)
                         except Exception as e:
-                            logger.error(f"Error processing CPU {package_key} data in {adapter_name}: {e}")
+                            logger.error("Error processing CPU %s data in %s: %s", package_key, adapter_name, e)
                             continue  # Continue to the next package if one fails
                 
                 # Process individual CPU cores with enhanced error handling
@@ -115,7 +152,7 @@ def collect_temperature_metrics(temperature_gauge, logger_otel):
                             
                             # Ensure value is a dictionary
                             if not isinstance(value, dict):
-                                logger.warning(f"Core data for {key} is not a dictionary in {adapter_name}. Skipping.")
+                                logger.warning("Core data for %s is not a dictionary in %s. Skipping.", key, adapter_name)
                                 continue
                             
                             # Find any temperature input key (may be temp2_input, temp6_input, etc.)
@@ -133,7 +170,7 @@ def collect_temperature_metrics(temperature_gauge, logger_otel):
                                 
                                 # Skip reporting invalid temperatures
                                 if temp is None or not isinstance(temp, (int, float)) or temp <= 0:
-                                    logger.warning(f"Invalid temperature value for CPU {key}: {temp}")
+                                    logger.warning("Invalid temperature value for CPU %s: %s", key, temp)
                                     continue
                                 
                                 # Use sensible defaults only if thresholds are missing
@@ -143,85 +180,22 @@ def collect_temperature_metrics(temperature_gauge, logger_otel):
                                 if crit is None or not isinstance(crit, (int, float)) or crit <= 0:
                                     crit = 105.0  # Common critical threshold
                                 
-                                # Add socket identifier if available
-                                # This is more robust for multi-socket systems where the same core number
-                                # might appear in different sockets
-                                socket_id = None
-                                
-                                # Try to determine which socket/package this core belongs to
-                                # This approach is based on common core numbering in multi-socket systems
-                                # where cores are numbered sequentially across all sockets
-                                try:
-                                    core_int = int(core_num)
-                                    # Look for all Package id entries to determine core-to-socket mapping
-                                    package_count = sum(1 for k in adapter_data.keys() if k.startswith("Package id "))
-                                    if package_count > 1:
-                                        # Simple heuristic: in dual-socket systems, first half of cores belong to socket 0
-                                        # This is a simplification and may need adjustment for specific systems
-                                        cores_per_socket = len([k for k in adapter_data.keys() if k.startswith("Core ")]) // package_count
-                                        if cores_per_socket > 0:
-                                            socket_id = str(core_int // cores_per_socket)
-                                except (ValueError, ZeroDivisionError):
-                                    # If we can't determine the socket, don't add socket information
-                                    pass
+                                # Exact socket from the sysfs topology; core ids restart on every socket
+                                socket_id = _topology.socket(adapter_name, core_num)
                                 
                                 # Set metric with enhanced attributes
+                                labels = _cpu_core_interner.get(core_num, high, crit, socket_id)
                                 if temperature_gauge:
-                                    attributes = {
-                                        "source": "cpu",
-                                        "type": "core",
-                                        "name": f"core_{core_num}",
-                                        "high": str(high),
-                                        "critical": str(crit)
-                                    }
-                                    
-                                    # Add socket information if available
-                                    if socket_id is not None:
-                                        attributes["socket"] = socket_id
-                                        
-                                    temperature_gauge.set(temp, attributes)
-                                
-                                core_metrics = {
-                                    "temperature": temp,
-                                    "high": high,
-                                    "critical": crit
-                                }
-                                
-                                # Add socket information if available
-                                if socket_id is not None:
-                                    core_metrics["socket"] = socket_id
-                                    
-                                temp_metrics[f"cpu_core_{core_num}"] = core_metrics
+                                    temperature_gauge.set(temp, labels)
+                                temp_metrics.append(Sample('temperature', temp, labels))
                                 
                                 # Log all core temperatures with socket info if available
                                 socket_info = f" (Socket {socket_id})" if socket_id is not None else ""
-                                logger.info(f"CPU Core {core_num}{socket_info}: {temp}°C (High: {high}°C, Critical: {crit}°C)")
-                                
-                                # Alert on critical temperature
-                                if temp >= crit - TEMP_CRITICAL_THRESHOLD:
-                                    if logger_otel:
-                                        alert_attributes = {
-                                            "event.type": "alert",
-                                            "sensor": f"cpu_core_{core_num}",
-                                            "temperature": temp,
-                                            "critical": crit
-                                        }
-                                        
-                                        # Add socket information to alert if available
-                                        if socket_id is not None:
-                                            alert_attributes["socket"] = socket_id
-                                            
-                                        log_record = create_log_record(
-                                            timestamp=int(time.time() * 1e9),
-                                            body=f"ALERT: CPU Core {core_num}{socket_info} temperature critical: {temp}°C",
-                                            severity="ERROR",
-                                            attributes=alert_attributes
-                                        )
-                                        logger_otel.emit(log_record)
+                                logger.debug("CPU Core %s%s: %s°C (High: %s°C, Critical: %s°C)", core_num, socket_info, temp, high, crit)
                             else:
-                                logger.warning(f"No temperature input key found for CPU {key} in {adapter_name}")
+                                logger.warning("No temperature input key found for CPU %s in %s", key, adapter_name)
                         except Exception as e:
-                            logger.error(f"Error processing CPU {key} data in {adapter_name}: {e}")
+                            logger.error("Error processing CPU %s data in %s: %s", key, adapter_name, e)
                             continue  # Continue to the next core if one fails
             
             # NVMe drive temperature
@@ -235,11 +209,9 @@ def collect_temperature_metrics(temperature_gauge, logger_otel):
                     if temp_key:
                         temp = nvme_data.get(temp_key, 0)
                         # Find related thresholds
-                        low_key = temp_key.replace("_input", "_min") if temp_key.replace("_input", "_min") in nvme_data else temp_key.replace("_input", "_low")
                         high_key = temp_key.replace("_input", "_max") if temp_key.replace("_input", "_max") in nvme_data else temp_key.replace("_input", "_high")
                         crit_key = temp_key.replace("_input", "_crit")
                         
-                        low = nvme_data.get(low_key, -273.1)
                         high = nvme_data.get(high_key, 85.0)
                         crit = nvme_data.get(crit_key, 85.0)
                         
@@ -247,39 +219,12 @@ def collect_temperature_metrics(temperature_gauge, logger_otel):
                         device_name = adapter_name.replace('-', '_')
                         
                         # Set metric
+                        labels = _nvme_composite_labels.get(device_name, high, crit)
                         if temperature_gauge:
-                            temperature_gauge.set(temp, {
-                                "source": "nvme",
-                                "type": "composite",
-                                "name": device_name,
-                                "high": str(high),
-                                "critical": str(crit)
-                            })
-                        
-                        temp_metrics[f"nvme_{device_name}_composite"] = {
-                            "temperature": temp,
-                            "low": low,
-                            "high": high,
-                            "critical": crit
-                        }
-                        
-                        logger.info(f"NVMe {device_name} Composite: {temp}°C (High: {high}°C, Critical: {crit}°C)")
+                            temperature_gauge.set(temp, labels)
+                        temp_metrics.append(Sample('temperature', temp, labels))
                         
-                        # Alert on high temperature
-                        if temp >= crit - DISK_TEMP_WARNING_THRESHOLD:
-                            if logger_otel:
-                                log_record = create_log_record(
-                                    timestamp=int(time.time() * 1e9),
-                                    body=f"ALERT: NVMe {device_name} temperature high: {temp}°C",
-                                    severity="ERROR",
-                                    attributes={
-                                        "event.type": "alert",
-                                        "sensor": f"nvme_{device_name}",
-                                        "temperature": temp,
-                                        "critical": crit
-                                    }
-                                )
-                                logger_otel.emit(log_record)
+                        logger.debug("NVMe %s Composite: %s°C (High: %s°C, Critical: %s°C)", device_name, temp, high, crit)
                 
                 # Process individual NVMe sensors
                 for sensor_name, sensor_data in adapter_data.items():
@@ -292,39 +237,22 @@ def collect_temperature_metrics(temperature_gauge, logger_otel):
                             if temp_key:
                                 temp = sensor_data.get(temp_key, 0)
                                 # Find thresholds
-                                low_key = temp_key.replace("_input", "_min") if temp_key.replace("_input", "_min") in sensor_data else temp_key.replace("_input", "_low")
                                 high_key = temp_key.replace("_input", "_max") if temp_key.replace("_input", "_max") in sensor_data else temp_key.replace("_input", "_high")
-                                
-                                low = sensor_data.get(low_key, -273.1)
                                 high_val = sensor_data.get(high_key)
                                 
                                 # Handle unrealistic high threshold values (like 65261.8)
                                 if high_val is None or high_val > 200:
-                                    high = 85.0  # Use sensible default instead of unrealistic value
                                     high_attr = "N/A"  # Mark as not available in attributes
                                 else:
-                                    high = high_val
-                                    high_attr = str(high)
-                                
-                                # Device name formatting
-                                device_name = adapter_name.replace('-', '_')
+                                    high_attr = str(high_val)
                                 
                                 # Set metric
+                                labels = _nvme_sensor_labels.get(adapter_name, sensor_num, high_attr)
                                 if temperature_gauge:
-                                    temperature_gauge.set(temp, {
-                                        "source": "nvme",
-                                        "type": "sensor",
-                                        "name": f"{device_name}_sensor_{sensor_num}",
-                                        "high": high_attr
-                                    })
-                                
-                                temp_metrics[f"nvme_{device_name}_sensor_{sensor_num}"] = {
-                                    "temperature": temp,
-                                    "low": low,
-                                    "high": high
-                                }
+                                    temperature_gauge.set(temp, labels)
+                                temp_metrics.append(Sample('temperature', temp, labels))
                                 
-                                logger.info(f"NVMe {device_name} Sensor {sensor_num}: {temp}°C")
+                                logger.debug("NVMe %s Sensor %s: %s°C", adapter_name, sensor_num, temp)
             
             # ACPI temperature sensors
             elif "acpitz" in adapter_name:
@@ -339,9 +267,9 @@ def collect_temperature_metrics(temperature_gauge, logger_otel):
                 _collect_other_temps(adapter_name, adapter_data, temperature_gauge, temp_metrics)
     
     except json.JSONDecodeError as e:
-        logger.error(f"Error parsing sensors JSON output: {e}")
+        logger.error("Error parsing sensors JSON output: %s", e)
     except Exception as e:
-        logger.error(f"Unexpected error while collecting temperature metrics: {e}")
+        logger.error("Unexpected error while collecting temperature metrics: %s", e)
     
     return temp_metrics
 
@@ -357,23 +285,17 @@ def _collect_acpi_temps(adapter_name, adapter_data, temperature_gauge, temp_metr
                 temp = temp_data.get(input_key, 0)
                 
                 # Set metric
+                labels = _acpi_labels.get(temp_key)
                 if temperature_gauge:
-                    temperature_gauge.set(temp, {
-                        "source": "acpi",
-                        "type": "temp",
-                        "name": f"acpi_{temp_key}"
-                    })
+                    temperature_gauge.set(temp, labels)
+                temp_metrics.append(Sample('temperature', temp, labels))
                 
-                temp_metrics[f"acpi_{temp_key}"] = {
-                    "temperature": temp
-                }
-                
-                logger.info(f"ACPI {temp_key}: {temp}°C")
+                logger.debug("ACPI %s: %s°C", temp_key, temp)
 
 
 def _collect_gigabyte_temps(adapter_name, adapter_data, temperature_gauge, temp_metrics):
     """Helper function to collect Gigabyte WMI temperature sensors with known mapping."""
-    logger.info(f"Processing Gigabyte WMI: {adapter_name}")
+    logger.debug("Processing Gigabyte WMI: %s", adapter_name)
     
     # Mapping from WMI tempX key to descriptive BIOS/Smart Fan name
     wmi_temp_mapping = {
@@ -405,25 +327,19 @@ def _collect_gigabyte_temps(adapter_name, adapter_data, temperature_gauge, temp_
                         else:
                             # Fallback if tempX is not in our map
                             descriptive_name_metric = f"unknown_wmi_{sensor_outer_key}"
-                            logger.warning(f"Gigabyte WMI sensor {sensor_outer_key} not found in mapping. Using default name.")
+                            logger.warning("Gigabyte WMI sensor %s not found in mapping. Using default name.", sensor_outer_key)
 
+                        labels = _gigabyte_labels.get(descriptive_name_metric)
                         if temperature_gauge:
-                            temperature_gauge.set(temp, {
-                                "source": "gigabyte_wmi",
-                                "type": "motherboard_sensor",
-                                "name": descriptive_name_metric
-                            })
-                        
-                        temp_metrics[f"gigabyte_wmi_{descriptive_name_metric}"] = {
-                            "temperature": temp
-                        }
-                        logger.info(f"Gigabyte WMI - {descriptive_name_raw} ({sensor_outer_key}): {temp}°C")
+                            temperature_gauge.set(temp, labels)
+                        temp_metrics.append(Sample('temperature', temp, labels))
+                        logger.debug("Gigabyte WMI - %s (%s): %s°C", descriptive_name_raw, sensor_outer_key, temp)
                     else:
-                        logger.warning(f"Invalid or missing temperature value for Gigabyte WMI {sensor_outer_key} (key: {input_key})")
+                        logger.warning("Invalid or missing temperature value for Gigabyte WMI %s (key: %s)", sensor_outer_key, input_key)
                 else:
-                    logger.warning(f"No input key found for Gigabyte WMI sensor {sensor_outer_key}")
+                    logger.warning("No input key found for Gigabyte WMI sensor %s", sensor_outer_key)
             except Exception as e:
-                logger.error(f"Error processing Gigabyte WMI sensor {sensor_outer_key}: {e}")
+                logger.error("Error processing Gigabyte WMI sensor %s: %s", sensor_outer_key, e)
                 continue
 
 
@@ -436,20 +352,13 @@ def _collect_other_temps(adapter_name, adapter_data, temperature_gauge, temp_met
             temp_keys = [k for k in value.keys() if "temp" in k.lower() and "input" in k.lower()]
             
             for temp_key in temp_keys:
-                sensor_name = f"{adapter_name}_{key}_{temp_key}"
                 temp = value.get(temp_key)
                 
                 if isinstance(temp, (int, float)):
                     # Set metric
+                    labels = _other_labels.get(adapter_name, key, temp_key)
                     if temperature_gauge:
-                        temperature_gauge.set(temp, {
-                            "source": "other",
-                            "type": "temp",
-                            "name": sensor_name.replace('-', '_')
-                        })
-                    
-                    temp_metrics[sensor_name.replace('-', '_')] = {
-                        "temperature": temp
-                    }
+                        temperature_gauge.set(temp, labels)
+                    temp_metrics.append(Sample('temperature', temp, labels))
                     
-                    logger.info(f"Other sensor {sensor_name}: {temp}°C")
\ No newline at end of file
+                    logger.debug("Other sensor %s: %s°C", labels["name"], temp)
\ No newline at end of file
@@ -4,78 +4,76 @@ VM metrics collector for Proxmox OpenTelemetry Monitoring
 """
 import json
 from lib.config import logger
+from lib.samples import Sample, LabelInterner
 from lib.utils import run_command
 
+# Same attributes as the per-guest cgroup metrics
+_vm_labels = LabelInterner("vmid", "name", "type")
+
 def collect_vm_metrics(vm_status=None, vm_cpu_usage=None, vm_memory_usage=None):
-    """Collect metrics from Proxmox VMs."""
-    logger.info("Collecting VM metrics")
-    vm_metrics = []
+    """Collect metrics from Proxmox VMs.
+
+    Returns:
+        list: Sample objects keyed 'vm_status', 'vm_cpu_usage' and 'vm_memory_usage'
+    """
+    logger.debug("Collecting VM metrics")
     
     # Get list of all VMs using the Proxmox API
     vm_list = run_command("pvesh get /cluster/resources --type vm -output-format json")
     if vm_list:
         try:
-            vms = json.loads(vm_list)
-            for vm in vms:
-                try:
-                    vm_id = vm.get('vmid')
-                    vm_name = vm.get('name', f"vm-{vm_id}")
-                    vm_status_val = vm.get('status', 'unknown')
-                    
-                    if not vm_id:
-                        continue
-                    
-                    # Create labels for this VM
-                    vm_labels = {
-                        "vmid": str(vm_id),
-                        "name": vm_name,
-                        "type": vm.get('type', 'unknown')
-                    }
-                    
-                    vm_data = {
-                        'id': vm_id,
-                        'name': vm_name,
-                        'status': vm_status_val,
-                        'labels': vm_labels,
-                        'running': vm_status_val == 'running'
-                    }
-                    
-                    # Send VM status metric (1=running, 0=stopped)
-                    if vm_status:
-                        status_value = 1 if vm_status_val == 'running' else 0
-                        vm_status.set(status_value, vm_labels)
-                    
-                    # Skip detailed metrics for non-running VMs
-                    if vm_status_val == 'running':
-                        # Get CPU usage
-                        cpu_val = vm.get('cpu', 0)
-                        vm_data['cpu'] = cpu_val
-                        
-                        # Send VM CPU usage metric
-                        if vm_cpu_usage:
-                            vm_cpu_usage.set(cpu_val * 100, vm_labels)  # Convert to percentage
-                        
-                        # Get memory usage
-                        if 'mem' in vm and 'maxmem' in vm and vm.get('maxmem', 0) > 0:
-                            mem_used = vm.get('mem', 0)
-                            mem_total = vm.get('maxmem', 1)
-                            mem_percent = (mem_used / mem_total) * 100
-                            vm_data['memory'] = {
-                                'used': mem_used,
-                                'total': mem_total,
-                                'percent': mem_percent
-                            }
-                            
-                            # Send VM memory usage metric
-                            if vm_memory_usage:
-                                vm_memory_usage.set(mem_percent, vm_labels)
-                    
-                    vm_metrics.append(vm_data)
-                    logger.info(f"VM {vm_name} (ID: {vm_id}): status={vm_status_val}, CPU={vm.get('cpu', 0):.2f}")
-                    
-                except Exception as e:
-                    logger.error(f"Error processing VM data: {e}")
+            return record_vm_metrics(json.loads(vm_list), vm_status, vm_cpu_usage, vm_memory_usage)
         except json.JSONDecodeError as e:
-            logger.error(f"Error parsing VM list JSON: {e}")
+            logger.error("Error parsing VM list JSON: %s", e)
+    
+    return []
+
+def record_vm_metrics(vms, vm_status=None, vm_cpu_usage=None, vm_memory_usage=None):
+    """Set the VM metrics from a guest list (/cluster/resources or /nodes/{node}/qemu|lxc entries with 'type').
+
+    Returns:
+        list: Sample objects keyed 'vm_status', 'vm_cpu_usage' and 'vm_memory_usage'
+    """
+    vm_metrics = []
+    for vm in vms:
+        try:
+            vm_id = vm.get('vmid')
+            vm_status_val = vm.get('status', 'unknown')
+            
+            if not vm_id:
+                continue
+            
+            # Labels for this VM, shared across cycles
+            vm_name = vm['name'] if 'name' in vm else f"vm-{vm_id}"
+            vm_labels = _vm_labels.get(str(vm_id), vm_name, vm.get('type', 'unknown'))
+            
+            # Send VM status metric (1=running, 0=stopped)
+            status_value = 1 if vm_status_val == 'running' else 0
+            vm_metrics.append(Sample('vm_status', status_value, vm_labels))
+            if vm_status:
+                vm_status.set(status_value, vm_labels)
+            
+            # Skip detailed metrics for non-running VMs
+            if vm_status_val == 'running':
+                # Send VM CPU usage metric
+                cpu_percent = vm.get('cpu', 0) * 100  # Convert to percentage
+                vm_metrics.append(Sample('vm_cpu_usage', cpu_percent, vm_labels))
+                if vm_cpu_usage:
+                    vm_cpu_usage.set(cpu_percent, vm_labels)
+                
+                # Get memory usage
+                mem_total = vm.get('maxmem', 0)
+                if 'mem' in vm and mem_total > 0:
+                    mem_percent = (vm['mem'] / mem_total) * 100
+                    vm_metrics.append(Sample('vm_memory_usage', mem_percent, vm_labels))
+                    
+                    # Send VM memory usage metric
+                    if vm_memory_usage:
+                        vm_memory_usage.set(mem_percent, vm_labels)
+            
+            logger.debug("VM %s (ID: %s): status=%s, CPU=%.2f", vm_name, vm_id, vm_status_val, vm.get('cpu', 0))
+            
+        except Exception as e:
+            logger.error("Error processing VM data: %s", e)
     
-    return vm_metrics
\ No newline at end of file
+    return vm_metrics
@@ -1,116 +1,474 @@
 #!/usr/bin/env python3
 """
-ZFS pool metrics collector for Proxmox OpenTelemetry Monitoring
+ZFS pool and dataset metrics collector for Proxmox OpenTelemetry Monitoring
+
+Pool health, capacity, per-vdev error counters and scrub/resilver progress
+come from one `zpool list` and one `zpool status` call for all pools.
+Dataset and zvol properties for all pools come from a single `zfs get` call
+whose output is parsed as it streams in, and are reused for
+ZFS_DATASET_INTERVAL seconds: space accounting changes slowly and a node can
+have hundreds of datasets.
+
+Pool wait latencies and queue depths come from one long-lived
+`zpool iostat -Hpl -q <interval>` child process. A supervisor thread
+restarts it when it exits and parses each report line into a latest-sample
+table, so exports read memory instead of spawning a process.
 """
 import json
 import re
-from lib.config import logger
-from lib.utils import run_command
+import subprocess
+import threading
+import time
+from lib.config import logger, get_config
+from lib.samples import LabelInterner
+from lib.utils import run_command, stream_command, drain_stream, vmid_from_volume_name
 
-def collect_zfs_pool_metrics():
-    """Collect ZFS pool metrics including health, capacity, fragmentation, and I/O statistics."""
-    logger.info("Collecting ZFS pool metrics")
-    zfs_metrics = {}
-    pools_output = run_command("zpool list -H -o name")
-    if not pools_output:
-        logger.error("Failed to get ZFS pool list")
-        return zfs_metrics
-    pools = pools_output.strip().split('\n')
-    for pool in pools:
-        pool = pool.strip()
-        if not pool:
+# Properties read for every filesystem and volume
+ZFS_DATASET_PROPERTIES = ("type", "used", "referenced", "logicalused", "compressratio", "quota")
+
+
+def _build_dataset_labels(name, dataset_type):
+    labels = {"dataset": name, "pool": name.split('/', 1)[0], "type": dataset_type}
+    # VM disks are zvols named vm-<vmid>-disk-N, container disks subvol-<vmid>-disk-N
+    vmid = vmid_from_volume_name(name)
+    if vmid:
+        labels["vmid"] = vmid
+    return labels
+
+
+_dataset_labels = LabelInterner(build=_build_dataset_labels)
+
+# (monotonic time of the last `zfs get`, {dataset: metrics})
+_dataset_cache = (None, {})
+
+# zpool health -> zfs_pool_health_status value
+POOL_HEALTH_VALUES = {"ONLINE": 0, "DEGRADED": 1, "FAULTED": 2, "OFFLINE": 3, "UNAVAIL": 4, "REMOVED": 5}
+
+# Pool metrics are read by several observable callbacks per export
+_POOL_CACHE_TTL_SECONDS = 5.0
+_pool_cache = (None, {})
+
+# Whether `zpool status -j` works on this system (None until tried)
+_status_json_supported = None
+
+# Finished resilvers read 'resilvered <bytes> in ...', so no word boundary after the function
+_SCAN_RE = re.compile(r'\b(scrub|resilver)')
+_SCAN_PERCENT_RE = re.compile(r'([\d.]+)% done')
+_SCAN_ERRORS_RE = re.compile(r'with (\d+) errors')
+
+
+def _parse_pool_list(output):
+    """Parse `zpool list -Hp -o name,health,cap,frag,size,alloc,free` for all pools."""
+    pools = {}
+    for line in output.splitlines():
+        parts = line.split('\t')
+        if len(parts) < 7:
             continue
-        logger.info(f"Processing ZFS pool: {pool}")
-        zfs_metrics[pool] = {
-            'health': 'UNKNOWN',
-            'health_value': 0,
-            'capacity': 0,
-            'fragmentation': 0,
+        name, health = parts[0], parts[1]
+        pools[name] = {
+            'health': health,
+            'health_value': POOL_HEALTH_VALUES.get(health, 0),
+            'capacity': _parse_zfs_number(parts[2].rstrip('%')) or 0,
+            # Pools without spacemap histograms report '-'
+            'fragmentation': _parse_zfs_number(parts[3].rstrip('%')) or 0,
+            'size': _parse_zfs_number(parts[4]) or 0,
+            'allocated': _parse_zfs_number(parts[5]) or 0,
+            'free': _parse_zfs_number(parts[6]) or 0,
             'checksum_errors': 0,
+            'read_errors': 0,
+            'write_errors': 0,
+            'vdevs': [],
+            'scan': None,
             'read_bytes': 0,
             'write_bytes': 0,
             'read_ops': 0,
-            'write_ops': 0
+            'write_ops': 0,
         }
-        pool_info_cmd = f"zpool list -H -o health,capacity,fragmentation {pool}"
-        pool_info = run_command(pool_info_cmd)
-        if pool_info:
-            parts = pool_info.strip().split('\t')
-            if len(parts) >= 3:
-                health = parts[0].strip()
-                zfs_metrics[pool]['health'] = health
-                health_value = 0
-                if health == "DEGRADED":
-                    health_value = 1
-                elif health == "FAULTED":
-                    health_value = 2
-                elif health == "OFFLINE":
-                    health_value = 3
-                elif health == "UNAVAIL":
-                    health_value = 4
-                elif health == "REMOVED":
-                    health_value = 5
-                zfs_metrics[pool]['health_value'] = health_value
-                capacity_str = parts[1].strip()
-                capacity_match = re.search(r'(\d+)%', capacity_str)
-                if capacity_match:
-                    capacity = float(capacity_match.group(1))
-                    zfs_metrics[pool]['capacity'] = capacity
-                frag_str = parts[2].strip()
-                frag_match = re.search(r'(\d+)%', frag_str)
-                if frag_match:
-                    fragmentation = float(frag_match.group(1))
-                    zfs_metrics[pool]['fragmentation'] = fragmentation
-        else:
-            logger.error(f"Failed to get pool info for {pool} using command: {pool_info_cmd}")
-        cksum_output = run_command(f"zpool status {pool} | grep CKSUM | awk '{{print $5}}' | grep -v '-'")
-        if cksum_output:
-            total_cksum = 0
-            for line in cksum_output.strip().split('\n'):
+    return pools
+
+
+def _parse_scan_text(text):
+    """Parse the 'scan:' section of `zpool status` into function/state/percent/errors."""
+    match = _SCAN_RE.search(text)
+    if not match:
+        return None
+    scan = {'function': match.group(1), 'state': 'finished', 'percent': 100.0, 'errors': 0}
+    if 'in progress' in text:
+        scan['state'] = 'scanning'
+        percent = _SCAN_PERCENT_RE.search(text)
+        scan['percent'] = float(percent.group(1)) if percent else 0.0
+    elif 'canceled' in text:
+        scan['state'] = 'canceled'
+        scan['percent'] = 0.0
+    errors = _SCAN_ERRORS_RE.search(text)
+    if errors:
+        scan['errors'] = int(errors.group(1))
+    return scan
+
+
+def _parse_pool_status_text(output):
+    """Parse `zpool status -p` for all pools.
+
+    Returns:
+        dict: pool -> {'vdevs': [{'name', 'state', 'read', 'write', 'cksum', 'leaf'}], 'scan': dict or None}
+    """
+    status = {}
+    pool = None
+    section = None
+    scan_lines = []
+    rows = []
+
+    def finish_pool():
+        if pool is None:
+            return
+        # A row is a leaf device when the next row is not indented deeper
+        vdevs = []
+        for index, (indent, name, state, counters) in enumerate(rows):
+            next_indent = rows[index + 1][0] if index + 1 < len(rows) else -1
+            vdevs.append({
+                'name': name, 'state': state,
+                'read': counters[0], 'write': counters[1], 'cksum': counters[2],
+                'leaf': index > 0 and next_indent <= indent,
+            })
+        status[pool] = {'vdevs': vdevs, 'scan': _parse_scan_text(' '.join(scan_lines))}
+
+    for line in output.splitlines():
+        stripped = line.strip()
+        if stripped.startswith('pool:'):
+            finish_pool()
+            pool = stripped[5:].strip()
+            section, scan_lines, rows = None, [], []
+        elif pool is None:
+            continue
+        elif stripped.startswith('scan:'):
+            section = 'scan'
+            scan_lines.append(stripped[5:])
+        elif stripped.startswith(('config:', 'errors:', 'state:', 'status:', 'action:', 'see:')):
+            section = 'config' if stripped.startswith('config:') else None
+        elif section == 'scan' and stripped:
+            scan_lines.append(stripped)
+        elif section == 'config' and stripped and not stripped.startswith('NAME'):
+            parts = stripped.split()
+            # logs/cache/spares headings and spares (no counters) are skipped
+            if len(parts) >= 5 and parts[2].isdigit() and parts[3].isdigit() and parts[4].isdigit():
+                indent = len(line) - len(line.lstrip())
+                rows.append((indent, parts[0], parts[1], (int(parts[2]), int(parts[3]), int(parts[4]))))
+    finish_pool()
+    return status
+
+
+def _parse_pool_status_json(output):
+    """Parse `zpool status -j --json-int` (OpenZFS 2.3+) into the same shape as the text parser."""
+    status = {}
+    for pool, pool_data in json.loads(output).get('pools', {}).items():
+        vdevs = []
+
+        def walk(vdev, depth):
+            children = vdev.get('vdevs') or {}
+            vdevs.append({
+                'name': vdev.get('name', ''), 'state': vdev.get('state', 'UNKNOWN'),
+                'read': int(vdev.get('read_errors', 0)),
+                'write': int(vdev.get('write_errors', 0)),
+                'cksum': int(vdev.get('checksum_errors', 0)),
+                'leaf': depth > 0 and not children,
+            })
+            for child in children.values():
+                walk(child, depth + 1)
+
+        for root in (pool_data.get('vdevs') or {}).values():
+            walk(root, 0)
+
+        scan = None
+        scan_stats = pool_data.get('scan_stats')
+        if scan_stats and scan_stats.get('function') not in (None, 'NONE'):
+            to_examine = int(scan_stats.get('to_examine', 0))
+            issued = int(scan_stats.get('issued', scan_stats.get('examined', 0)))
+            state = {'SCANNING': 'scanning', 'FINISHED': 'finished', 'CANCELED': 'canceled'}.get(
+                scan_stats.get('state'), str(scan_stats.get('state', 'unknown')).lower())
+            scan = {
+                'function': scan_stats['function'].lower(),
+                'state': state,
+                'percent': 100.0 if state == 'finished' else (issued / to_examine * 100 if to_examine else 0.0),
+                'errors': int(scan_stats.get('errors', 0)),
+            }
+        status[pool] = {'vdevs': vdevs, 'scan': scan}
+    return status
+
+
+def _read_pool_status():
+    """Run one `zpool status` for all pools, preferring JSON output where supported."""
+    global _status_json_supported
+
+    if _status_json_supported is not False:
+        output = run_command("zpool status -j --json-int -p 2>/dev/null || true")
+        if output:
+            try:
+                status = _parse_pool_status_json(output)
+                _status_json_supported = True
+                return status
+            except (ValueError, KeyError, TypeError, AttributeError) as e:
+                logger.debug("Could not parse zpool status JSON, using text output: %s", e)
+        if _status_json_supported is None:
+            # Older OpenZFS without -j; don't try again
+            _status_json_supported = False
+
+    output = run_command("zpool status -p")
+    return _parse_pool_status_text(output) if output else {}
+
+
+def collect_zfs_pool_metrics():
+    """Collect ZFS pool health, capacity, fragmentation, per-vdev errors, scan progress and I/O statistics.
+
+    Three commands cover all pools: `zpool list`, `zpool status` and
+    `zpool iostat`. The result is reused for a few seconds so the observable
+    callbacks of one export share a single collection.
+
+    Returns:
+        dict: Pool names as keys
+    """
+    global _pool_cache
+
+    now = time.monotonic()
+    if _pool_cache[0] is not None and now - _pool_cache[0] < _POOL_CACHE_TTL_SECONDS:
+        return _pool_cache[1]
+
+    logger.debug("Collecting ZFS pool metrics")
+    list_output = run_command("zpool list -Hp -o name,health,cap,frag,size,alloc,free")
+    if not list_output:
+        logger.error("Failed to get ZFS pool list")
+        _pool_cache = (now, {})
+        return {}
+    zfs_metrics = _parse_pool_list(list_output)
+
+    for pool, pool_status in _read_pool_status().items():
+        metrics = zfs_metrics.get(pool)
+        if metrics is None:
+            continue
+        metrics['vdevs'] = pool_status['vdevs']
+        metrics['scan'] = pool_status['scan']
+        # Pool totals are the sum over leaf devices, so mirror/raidz rows aren't counted twice
+        for vdev in pool_status['vdevs']:
+            if vdev['leaf']:
+                metrics['read_errors'] += vdev['read']
+                metrics['write_errors'] += vdev['write']
+                metrics['checksum_errors'] += vdev['cksum']
+
+    # One iostat for all pools: name, alloc, free, read ops, write ops, read bytes, write bytes
+    io_output = run_command("zpool iostat -Hp")
+    if io_output:
+        for line in io_output.splitlines():
+            parts = line.split('\t')
+            if len(parts) >= 7 and parts[0] in zfs_metrics:
                 try:
-                    if line.strip():
-                        total_cksum += int(line.strip())
-                except ValueError:
-                    continue
-            zfs_metrics[pool]['checksum_errors'] = total_cksum
-        io_cmd = f"zpool iostat -Hp {pool} 1 1"
-        io_output = run_command(io_cmd)
-        if io_output:
-            lines = io_output.strip().split('\n')
-            if lines:
-                parts = lines[0].strip().split('\t')
-                if len(parts) >= 7 and parts[0] == pool:
-                    try:
-                        read_ops_val = int(parts[3])
-                        write_ops_val = int(parts[4])
-                        read_bytes_val = int(parts[5])
-                        write_bytes_val = int(parts[6])
-                        zfs_metrics[pool]['read_ops'] = read_ops_val
-                        zfs_metrics[pool]['write_ops'] = write_ops_val
-                        zfs_metrics[pool]['read_bytes'] = read_bytes_val
-                        zfs_metrics[pool]['write_bytes'] = write_bytes_val
-                    except (ValueError, IndexError) as e:
-                        logger.error(f"Error parsing ZFS I/O statistics for pool {pool} from '{io_cmd}': {e}, output: '{io_output}'")
-                else:
-                    logger.error(f"Unexpected output format from '{io_cmd}' for pool {pool}: '{io_output}'")
-            else:
-                logger.error(f"No output from '{io_cmd}' for pool {pool}")
-        else:
-            logger.error(f"Failed to get I/O stats for {pool} using command: {io_cmd}")
+                    zfs_metrics[parts[0]].update(
+                        read_ops=int(parts[3]), write_ops=int(parts[4]),
+                        read_bytes=int(parts[5]), write_bytes=int(parts[6]))
+                except ValueError as e:
+                    logger.error("Error parsing ZFS I/O statistics for pool %s: %s, output: '%s'", parts[0], e, line)
+    else:
+        logger.error("Failed to get ZFS pool I/O statistics")
+
+    _pool_cache = (now, zfs_metrics)
     return zfs_metrics
 
-def _convert_to_bytes(size_str):
-    """Convert size string (like '1.2K', '3M', '5G') to bytes."""
+def _parse_zfs_number(value):
+    """Parse a `zfs get -p` value: bytes, or a ratio such as '1.52x'; '-' and 'none' are None."""
+    if value in ('-', 'none', ''):
+        return None
     try:
-        if 'K' in size_str:
-            return float(size_str.replace('K', '')) * 1024
-        elif 'M' in size_str:
-            return float(size_str.replace('M', '')) * 1024 * 1024
-        elif 'G' in size_str:
-            return float(size_str.replace('G', '')) * 1024 * 1024 * 1024
-        elif 'T' in size_str:
-            return float(size_str.replace('T', '')) * 1024 * 1024 * 1024 * 1024
-        else:
-            return float(size_str)
+        return int(value)
     except ValueError:
-        return 0
\ No newline at end of file
+        pass
+    try:
+        return float(value.rstrip('x'))
+    except ValueError:
+        return None
+
+
+def collect_zfs_dataset_metrics():
+    """Collect space accounting for every ZFS filesystem and volume.
+
+    Returns:
+        dict: Dataset names as keys; each value holds interned 'labels' (dataset,
+              pool, type and the vmid of vm-<id>-disk-N zvols) and the
+              used/referenced/logicalused/quota bytes and compressratio.
+    """
+    global _dataset_cache
+
+    now = time.monotonic()
+    cached_at, datasets = _dataset_cache
+    if cached_at is not None and now - cached_at < get_config().zfs_dataset_interval_seconds:
+        return datasets
+
+    logger.debug("Collecting ZFS dataset metrics")
+    datasets = {}
+    current_name = None
+    current = None
+    # -H: tab separated, no header; -p: exact numbers. Lines for one dataset are consecutive.
+    for line in stream_command(["zfs", "get", "-Hp", "-o", "name,property,value",
+                                ",".join(ZFS_DATASET_PROPERTIES), "-t", "filesystem,volume"]):
+        name, _, rest = line.partition('\t')
+        prop, _, value = rest.partition('\t')
+        if not prop:
+            continue
+        if name != current_name:
+            current_name = name
+            current = datasets[name] = {}
+        if prop == "type":
+            current['type'] = value
+        else:
+            current[prop] = _parse_zfs_number(value)
+
+    for name, metrics in datasets.items():
+        metrics['labels'] = _dataset_labels.get(name, metrics.get('type', 'unknown'))
+        # quota=0 means no quota
+        if not metrics.get('quota'):
+            metrics['quota'] = None
+
+    # Keep the previous result if zfs failed, so a transient error does not blank the series
+    if datasets or cached_at is None:
+        _dataset_cache = (now, datasets)
+    else:
+        _dataset_cache = (now, _dataset_cache[1])
+    logger.debug("Collected %d ZFS datasets", len(datasets))
+    return _dataset_cache[1]
+
+
+# `zpool iostat -l` latency columns (nanoseconds), read/write pairs unless noted
+IOSTAT_LATENCY_COLUMNS = (
+    ("total", "read"), ("total", "write"), ("disk", "read"), ("disk", "write"),
+    ("syncq", "read"), ("syncq", "write"), ("asyncq", "read"), ("asyncq", "write"),
+    ("scrub", "read"), ("trim", "write"), ("rebuild", "write"),
+)
+
+# `zpool iostat -q` queue columns, pending/active pairs
+IOSTAT_QUEUE_COLUMNS = (
+    ("syncq", "read"), ("syncq", "write"), ("asyncq", "read"), ("asyncq", "write"),
+    ("scrubq", "read"), ("trimq", "write"), ("rebuildq", "write"),
+)
+
+# Column count -> (latency columns, queue pairs); older OpenZFS lacks trim/rebuild
+_IOSTAT_LAYOUTS = {
+    7 + 9 + 2 * 5: (9, 5),
+    7 + 10 + 2 * 6: (10, 6),
+    7 + 10 + 2 * 7: (10, 7),
+    7 + 11 + 2 * 7: (11, 7),
+}
+
+
+def _parse_iostat_line(line):
+    """Parse one `zpool iostat -Hpl -q` line.
+
+    Returns:
+        tuple: (pool, latencies, queues) where latencies maps (wait, direction)
+               to seconds and queues maps (queue, direction, state) to I/Os,
+               or None if the line has an unknown layout
+    """
+    parts = line.split('\t')
+    layout = _IOSTAT_LAYOUTS.get(len(parts))
+    if layout is None:
+        return None
+    latency_count, queue_count = layout
+
+    latencies = {}
+    for column, value in zip(IOSTAT_LATENCY_COLUMNS[:latency_count], parts[7:7 + latency_count]):
+        # '-' when there was no I/O of that kind in the interval
+        nanoseconds = _parse_zfs_number(value)
+        if nanoseconds is not None:
+            latencies[column] = nanoseconds / 1e9
+
+    queues = {}
+    offset = 7 + latency_count
+    for index, (queue, direction) in enumerate(IOSTAT_QUEUE_COLUMNS[:queue_count]):
+        for state, value in zip(("pending", "active"), parts[offset + 2 * index:offset + 2 * index + 2]):
+            depth = _parse_zfs_number(value)
+            if depth is not None:
+                queues[(queue, direction, state)] = depth
+    return parts[0], latencies, queues
+
+
+class ZpoolIostatSampler(threading.Thread):
+    """Supervises a streaming `zpool iostat -Hpl -q` process and keeps the latest report per pool."""
+
+    # Seconds to wait before restarting the child, doubled after each quick exit
+    MIN_RESTART_DELAY = 1
+    MAX_RESTART_DELAY = 300
+
+    def __init__(self, interval=None):
+        super().__init__(name="zpool-iostat", daemon=True)
+        self.interval = interval or get_config().zpool_iostat_interval_seconds
+        self._lock = threading.Lock()
+        self._stop_event = threading.Event()
+        self._process = None
+        # pool -> (monotonic time, latencies, queues)
+        self._latest = {}
+        self._warned_layout = False
+
+    def stop(self):
+        self._stop_event.set()
+        process = self._process
+        if process is not None and process.poll() is None:
+            process.kill()
+
+    def _command(self):
+        # -y skips the first report, which averages over the time since import
+        return ["zpool", "iostat", "-Hpl", "-q", "-y", str(self.interval)]
+
+    def _read_reports(self, process):
+        for line in process.stdout:
+            parsed = _parse_iostat_line(line.rstrip('\n'))
+            if parsed is None:
+                if not self._warned_layout:
+                    logger.warning("Unrecognised zpool iostat output, ignoring: '%s'", line.strip())
+                    self._warned_layout = True
+                continue
+            pool, latencies, queues = parsed
+            with self._lock:
+                self._latest[pool] = (time.monotonic(), latencies, queues)
+
+    def run(self):
+        logger.info("%s started (%ss interval)", self.name, self.interval)
+        delay = self.MIN_RESTART_DELAY
+        while not self._stop_event.is_set():
+            started = time.monotonic()
+            try:
+                self._process = subprocess.Popen(
+                    self._command(), stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True
+                )
+            except OSError as e:
+                logger.error("Command '%s' could not be started: %s", ' '.join(self._command()), e)
+            else:
+                stderr_thread, stderr_lines = drain_stream(self._process.stderr)
+                try:
+                    self._read_reports(self._process)
+                except Exception as e:
+                    logger.error("Error in %s: %s", self.name, e)
+                finally:
+                    if self._process.poll() is None:
+                        self._process.kill()
+                    returncode = self._process.wait()
+                    stderr_thread.join(1)
+                    self._process.stdout.close()
+                    self._process.stderr.close()
+                if not self._stop_event.is_set():
+                    logger.error("Command '%s' exited with code %s: %s", ' '.join(self._command()), returncode,
+                                 '\n'.join(stderr_lines).strip())
+
+            if self._stop_event.is_set():
+                break
+            # A child that ran for a while restarts quickly; one that keeps failing backs off
+            if time.monotonic() - started > self.MAX_RESTART_DELAY:
+                delay = self.MIN_RESTART_DELAY
+            self._stop_event.wait(delay)
+            delay = min(delay * 2, self.MAX_RESTART_DELAY)
+
+    def snapshot(self):
+        """Return the latest report of every pool seen in the last three intervals.
+
+        Returns:
+            list: (pool, latencies, queues) tuples
+        """
+        cutoff = time.monotonic() - 3 * self.interval
+        with self._lock:
+            return [(pool, latencies, queues)
+                    for pool, (updated, latencies, queues) in self._latest.items() if updated >= cutoff]
@@ -1,92 +1,414 @@
 #!/usr/bin/env python3
 """
 Configuration settings for Proxmox OpenTelemetry Monitoring
+
+Importing this module has no side effects: settings are read from the
+environment by load_config(), logging handlers are attached by
+setup_logging() and the OpenTelemetry resource is built on first use by
+get_resource(). Code that needs a setting calls get_config() at run time, so
+a configuration swapped in by reload_config() (on SIGHUP) takes effect on the
+next call.
 """
 import glob
 import os
 import logging
-from datetime import datetime
-from logging.handlers import RotatingFileHandler
-from opentelemetry.sdk.resources import Resource
-
-# Log file configuration
-LOG_FILE_PATH = '/var/log/proxmox-otel.log'
-MAX_LOG_SIZE_BYTES = 10 * 1024 * 1024  # 10 MB
-BACKUP_COUNT = 5
-
-# Configure logging with rotation
-LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO")
-logging.basicConfig(
-    level=LOG_LEVEL,
-    format="%(asctime)s %(levelname)s %(name)s %(message)s",
-)
+import re
+import threading
+import time
+from collections import namedtuple
+from urllib.parse import urlsplit
 
 logger = logging.getLogger("proxmox-otel")
-logger.setLevel(logging.INFO)  # Set to INFO for normal operation
 
-formatter = logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+# Environment file read by systemd at start and re-read by reload_config()
+DEFAULT_ENV_FILE = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "proxmox-otel.env")
 
-# Add rotating file handler
-file_handler = RotatingFileHandler(
-    LOG_FILE_PATH,
-    maxBytes=MAX_LOG_SIZE_BYTES,
-    backupCount=BACKUP_COUNT
-)
-file_handler.setFormatter(formatter)
-logger.addHandler(file_handler)
-
-# Optional: Uncomment to add console logging during development
-# console_handler = logging.StreamHandler()
-# console_handler.setFormatter(formatter)
-# logger.addHandler(console_handler)
-
-# OpenTelemetry server configuration - Environment variables with fallbacks
-OTEL_COLLECTOR_HOST = os.getenv("OTEL_COLLECTOR_HOST", "192.168.0.185")
-OTEL_COLLECTOR_PORT = os.getenv("OTEL_COLLECTOR_PORT", "4318")
-
-OTEL_METRICS_ENDPOINT = f"http://{OTEL_COLLECTOR_HOST}:{OTEL_COLLECTOR_PORT}/v1/metrics"
-OTEL_LOGS_ENDPOINT = f"http://{OTEL_COLLECTOR_HOST}:{OTEL_COLLECTOR_PORT}/v1/logs"
-OTEL_TRACES_ENDPOINT = f"http://{OTEL_COLLECTOR_HOST}:{OTEL_COLLECTOR_PORT}/v1/traces"  # Endpoint for Tempo tracing
-COLLECTION_INTERVAL_SECONDS = int(os.getenv("OTEL_COLLECTION_INTERVAL", "30"))  # How often to collect and send metrics
-LOG_COLLECTION_INTERVAL_SECONDS = int(os.getenv("OTEL_LOG_COLLECTION_INTERVAL", "60"))  # How often to collect and send logs
-
-# Feature toggles
-ENABLE_TRACES = os.getenv("ENABLE_TRACES", "false").lower() in ("true", "1", "yes")  # Disabled by default
-
-# Proxmox log files to monitor - Reduced list to focus on critical logs
-LOG_FILES = [
-    "/var/log/syslog",
-    "/var/log/kern.log",
-    "/var/log/auth.log"
-]
-
-# Add only critical Proxmox logs
-PVE_LOGS = glob.glob("/var/log/pve/cluster*.log")  # Only cluster-related logs
-LOG_FILES.extend(PVE_LOGS)
-
-# Systemd journal services to monitor
-JOURNAL_SERVICES = [
-    "pvedaemon.service",
-    "pvestatd.service", 
-    "qemu-server.service",
-    "systemd-journald.service",
-    "sshd.service",
-    "pvescheduler.service"
-]
-
-# Time to remember the last journal timestamp we processed
-last_journal_timestamp = datetime.now().timestamp() * 1000000  # microseconds
-
-# Resource attributes
-resource = Resource.create(
-    {
-        "service.name": "proxmox-server",
-        "service.namespace": "infrastructure",
-        "host.name": os.uname().nodename,
-    }
+# Collectors that can be switched on and off with ENABLED_COLLECTORS
+ALL_COLLECTORS = (
+    "system", "cluster", "storage", "smart", "vm", "guest_cgroup", "temperature",
+    "zfs", "zfs_datasets", "zpool_iostat", "lvm", "tasks", "disk_io", "network", "psi", "hf_sampler",
 )
 
-# Alert thresholds
-TEMP_CRITICAL_THRESHOLD = 5  # Degrees below critical temperature to start alerting
-DISK_TEMP_WARNING_THRESHOLD = 10  # Degrees below critical to start alerting for disks
-CPU_THROTTLE_THRESHOLD = 1500  # MHz, alert if CPU frequency drops below this value
\ No newline at end of file
+
+def _env_bool(environ, name, default):
+    return environ.get(name, default).lower() in ("true", "1", "yes")
+
+
+def _env_list(environ, name, default):
+    value = environ.get(name)
+    if value is None:
+        return list(default)
+    return [item.strip() for item in value.split(",") if item.strip()]
+
+
+# One OTLP/HTTP export target of a signal; every destination gets its own
+# exporter, reader or batch processor and therefore its own queue and thread
+Destination = namedtuple("Destination", (
+    "name", "endpoint", "compression", "timeout", "max_queue_size", "max_export_batch_size"
+))
+
+EXPORT_COMPRESSIONS = ("none", "gzip", "deflate")
+
+_SIGNAL_PATH_RE = re.compile(r'/v1/[^/]+/?$')
+
+
+def _parse_destinations(specs, signal, defaults):
+    """Build the destinations of a signal from URL[;option=value...] entries.
+
+    /v1/<signal> is appended unless the URL already ends in /v1/<path>, so a
+    base URL or prefix can be shared by all signals. Options (compression,
+    timeout, max_queue_size, max_export_batch_size) override the defaults for
+    that destination only.
+    """
+    destinations = []
+    for spec in specs:
+        url, *options = [part.strip() for part in spec.split(';')]
+        settings = dict(defaults)
+        for option in options:
+            key, _, value = option.partition('=')
+            if key not in settings:
+                logger.warning("Ignoring unknown option %r for export destination %s", key, url)
+                continue
+            settings[key] = value if key == "compression" else int(value)
+        if settings["compression"] not in EXPORT_COMPRESSIONS:
+            logger.warning("Unknown compression %r for export destination %s, using 'none'", settings["compression"], url)
+            settings["compression"] = "none"
+        endpoint = url if _SIGNAL_PATH_RE.search(url) else f"{url.rstrip('/')}/v1/{signal}"
+        destinations.append(Destination(name=urlsplit(url).netloc or url, endpoint=endpoint, **settings))
+    return destinations
+
+
+class Config:
+    """Settings for the monitoring agent. Build instances with load_config()."""
+
+    def __init__(self, environ):
+        # Log file configuration
+        self.log_file_path = environ.get("LOG_FILE_PATH", "/var/log/proxmox-otel.log")
+        self.max_log_size_bytes = 10 * 1024 * 1024  # 10 MB
+        self.backup_count = 5
+        self.log_level = environ.get("LOG_LEVEL", "INFO")
+
+        # OpenTelemetry server configuration - Environment variables with fallbacks
+        self.otel_collector_host = environ.get("OTEL_COLLECTOR_HOST", "192.168.0.185")
+        self.otel_collector_port = environ.get("OTEL_COLLECTOR_PORT", "4318")
+        base_url = f"http://{self.otel_collector_host}:{self.otel_collector_port}"
+        self.otel_metrics_endpoint = f"{base_url}/v1/metrics"
+        self.otel_logs_endpoint = f"{base_url}/v1/logs"
+        self.otel_traces_endpoint = f"{base_url}/v1/traces"  # Endpoint for Tempo tracing
+
+        # Export destinations - several per signal, e.g. old and new stack during a migration
+        export_defaults = {
+            "compression": environ.get("OTEL_EXPORT_COMPRESSION", "none").lower(),  # none, gzip or deflate
+            "timeout": int(environ.get("OTEL_EXPORT_TIMEOUT", "10")),  # Seconds per export request
+            "max_queue_size": int(environ.get("OTEL_EXPORT_MAX_QUEUE_SIZE", "2048")),  # Log records/spans buffered per destination
+            "max_export_batch_size": int(environ.get("OTEL_EXPORT_MAX_BATCH_SIZE", "512")),  # Log records/spans per request
+        }
+        destinations = _env_list(environ, "OTEL_DESTINATIONS", [base_url])
+        self.metrics_destinations = _parse_destinations(
+            _env_list(environ, "OTEL_METRICS_DESTINATIONS", destinations), "metrics", export_defaults)
+        self.logs_destinations = _parse_destinations(
+            _env_list(environ, "OTEL_LOGS_DESTINATIONS", destinations), "logs", export_defaults)
+        self.traces_destinations = _parse_destinations(
+            _env_list(environ, "OTEL_TRACES_DESTINATIONS", destinations), "traces", export_defaults)
+        self.prometheus_port = int(environ.get("PROMETHEUS_PORT", "0"))  # Serve /metrics for scraping on this port (0 = disabled)
+        self.prometheus_address = environ.get("PROMETHEUS_ADDRESS", "")  # Listen address of the /metrics endpoint (empty = all)
+        self.ringstore_path = environ.get("RINGSTORE_PATH", "")  # Local history file, e.g. /var/lib/proxmox-otel/metrics.ring (empty = disabled)
+        self.ringstore_resolution_seconds = int(environ.get("RINGSTORE_RESOLUTION", "60"))  # One value per series per this many seconds
+        self.ringstore_retention_seconds = int(environ.get("RINGSTORE_RETENTION", "86400"))  # History kept before slots are reused
+        self.ringstore_max_series = int(environ.get("RINGSTORE_MAX_SERIES", "4096"))  # Series the file has room for
+        self.collection_interval_seconds = int(environ.get("OTEL_COLLECTION_INTERVAL", "30"))  # How often to collect and send metrics
+        self.log_collection_interval_seconds = int(environ.get("OTEL_LOG_COLLECTION_INTERVAL", "60"))  # How often to collect and send logs
+        self.psi_sample_interval_seconds = float(environ.get("PSI_SAMPLE_INTERVAL", "1"))  # How often to sample /proc/pressure between exports
+        self.hf_sample_interval_seconds = float(environ.get("HF_SAMPLE_INTERVAL", "1"))  # How often to sample /proc/stat and /proc/diskstats between exports
+        self.zfs_dataset_interval_seconds = int(environ.get("ZFS_DATASET_INTERVAL", "300"))  # How long `zfs get` results are reused
+        self.zpool_iostat_interval_seconds = int(environ.get("ZPOOL_IOSTAT_INTERVAL", "10"))  # Reporting interval of the streaming `zpool iostat`
+        self.lvm_interval_seconds = int(environ.get("LVM_INTERVAL", "60"))  # How long `lvs`/`vgs` results are reused
+        self.task_log_dir = environ.get("TASK_LOG_DIR", "/var/log/pve/tasks")  # PVE task index, active list and task logs
+        self.task_state_file = environ.get("TASK_STATE_FILE", "/var/lib/proxmox-otel/tasks.json")  # Task index offset and per-guest results
+        self.cycle_overrun_policy = environ.get("CYCLE_OVERRUN_POLICY", "skip").lower()  # skip, immediate or stretch when a cycle overruns
+        self.cycle_align = _env_bool(environ, "CYCLE_ALIGN", "true")  # Start cycles on wall-clock multiples of the interval
+        if self.cycle_overrun_policy not in ("skip", "immediate", "stretch"):
+            logger.warning("Unknown CYCLE_OVERRUN_POLICY %r, using 'skip'", self.cycle_overrun_policy)
+            self.cycle_overrun_policy = "skip"
+
+        # Feature toggles
+        self.enable_traces = _env_bool(environ, "ENABLE_TRACES", "false")  # Disabled by default
+        self.trace_tail_sampling = _env_bool(environ, "TRACE_TAIL_SAMPLING", "true")  # Export only slow, failed and baseline cycles
+        self.trace_slow_cycle_seconds = float(environ.get("TRACE_SLOW_CYCLE_SECONDS", "10"))  # Cycles at least this long are always exported
+        self.trace_baseline_percent = float(environ.get("TRACE_BASELINE_PERCENT", "1"))  # Share of normal cycles exported anyway
+        self.enabled_collectors = set(_env_list(environ, "ENABLED_COLLECTORS", ALL_COLLECTORS))
+        if not _env_bool(environ, "ENABLE_HF_SAMPLER", "true"):
+            self.enabled_collectors.discard("hf_sampler")
+        unknown = self.enabled_collectors - set(ALL_COLLECTORS)
+        if unknown:
+            logger.warning("Ignoring unknown collectors in ENABLED_COLLECTORS: %s", ', '.join(sorted(unknown)))
+            self.enabled_collectors -= unknown
+
+        # Cluster mode - cluster-scope collectors (VM list, cluster status, shared storage)
+        # run only on one elected reporter node; node-local collectors run everywhere
+        self.node_name = os.uname().nodename
+        self.cluster_mode = _env_bool(environ, "CLUSTER_MODE", "false")  # Disabled by default
+        self.cluster_election = environ.get("CLUSTER_ELECTION", "lock").lower()  # "lock" (pmxcfs lock) or "members" (lowest online node)
+        self.cluster_lock_dir = environ.get("CLUSTER_LOCK_DIR", "/etc/pve/priv/lock")  # Any local directory works as a stand-in
+        self.cluster_lock_name = environ.get("CLUSTER_LOCK_NAME", "proxmox-otel-reporter")
+        self.cluster_lease_seconds = int(environ.get("CLUSTER_LEASE_SECONDS", "120"))  # Matches the pmxcfs lock timeout
+        self.pve_members_file = environ.get("PVE_MEMBERS_FILE", "/etc/pve/.members")
+        self.cluster_status_interval_seconds = int(environ.get("CLUSTER_STATUS_INTERVAL", "60"))  # Max age of the cached cluster status (.members or the pvesh fallback)
+
+        # Central poller (main.py poll) - reads other nodes over the Proxmox API instead of pvesh
+        self.poller_targets = _env_list(environ, "POLLER_TARGETS", [])  # host or host:port of each node (port defaults to 8006)
+        self.pve_api_token = environ.get("PVE_API_TOKEN", "")  # user@realm!tokenid=secret, needs PVEAuditor
+        self.poller_verify_tls = _env_bool(environ, "POLLER_VERIFY_TLS", "true")  # false for self-signed pveproxy certificates
+        self.poller_ca_file = environ.get("POLLER_CA_FILE", "")  # CA bundle for the node certificates (e.g. the cluster's pve-root-ca.pem)
+        self.poller_concurrency = int(environ.get("POLLER_CONCURRENCY", "8"))  # Nodes polled at the same time
+        self.poller_connections_per_host = int(environ.get("POLLER_CONNECTIONS_PER_HOST", "2"))  # Keep-alive connections per node
+        self.poller_timeout_seconds = float(environ.get("POLLER_TIMEOUT", "10"))  # Per API request
+        self.poller_max_backoff_seconds = int(environ.get("POLLER_MAX_BACKOFF", "600"))  # Longest wait before retrying an unreachable node
+
+        # cgroup v2 hierarchy used for per-guest resource metrics
+        self.cgroup_root = environ.get("CGROUP_ROOT", "/sys/fs/cgroup")
+
+        # Proxmox log files to monitor - Reduced list to focus on critical logs
+        log_files = _env_list(environ, "LOG_FILES", [
+            "/var/log/syslog",
+            "/var/log/kern.log",
+            "/var/log/auth.log",
+            "/var/log/pve/cluster*.log",  # Only cluster-related Proxmox logs
+        ])
+        self.log_files = []
+        for pattern in log_files:
+            if glob.has_magic(pattern):
+                self.log_files.extend(sorted(glob.glob(pattern)))
+            else:
+                self.log_files.append(pattern)
+
+        # Systemd journal services to monitor
+        self.journal_services = _env_list(environ, "JOURNAL_SERVICES", [
+            "pvedaemon.service",
+            "pvestatd.service",
+            "qemu-server.service",
+            "systemd-journald.service",
+            "sshd.service",
+            "pvescheduler.service"
+        ])
+
+        # Alert thresholds
+        self.temp_critical_threshold = float(environ.get("TEMP_CRITICAL_THRESHOLD", "5"))  # Degrees below critical temperature to start alerting
+        self.disk_temp_warning_threshold = float(environ.get("DISK_TEMP_WARNING_THRESHOLD", "10"))  # Degrees below critical to start alerting for disks
+        self.cpu_throttle_threshold = float(environ.get("CPU_THROTTLE_THRESHOLD", "1500"))  # MHz, alert if CPU frequency drops below this value
+        self.temp_alert_hysteresis = float(environ.get("TEMP_ALERT_HYSTERESIS", "3"))  # Degrees a temperature must fall below the alert threshold to resolve
+        self.alert_for_seconds = int(environ.get("ALERT_FOR_SECONDS", "60"))  # How long a temperature must stay above the threshold before the alert fires
+        self.alert_max_notifications_per_hour = int(environ.get("ALERT_MAX_NOTIFICATIONS_PER_HOUR", "20"))  # Firing notifications per rule and hour (0 = unlimited)
+
+        # Environment file re-read on SIGHUP
+        self.env_file = environ.get("PROXMOX_OTEL_ENV_FILE", DEFAULT_ENV_FILE)
+
+    def collector_enabled(self, name):
+        return name in self.enabled_collectors
+
+    def changed_settings(self, other):
+        """Return the names of the settings that differ from another Config."""
+        return {name for name, value in vars(self).items() if vars(other).get(name) != value}
+
+
+def read_env_file(path):
+    """Parse a systemd EnvironmentFile (KEY=VALUE lines, # comments).
+
+    Returns:
+        dict: The variables defined in the file (empty if it does not exist)
+    """
+    values = {}
+    try:
+        with open(path, 'r') as f:
+            for line in f:
+                line = line.strip()
+                if not line or line.startswith(('#', ';')) or '=' not in line:
+                    continue
+                key, _, value = line.partition('=')
+                value = value.strip()
+                if len(value) >= 2 and value[0] == value[-1] and value[0] in ('"', "'"):
+                    value = value[1:-1]
+                values[key.strip()] = value
+    except FileNotFoundError:
+        pass
+    return values
+
+
+_config = None
+_resource = None
+# Environment at load_config() without the values systemd took from the env file
+_base_environ = None
+
+
+def _without_env_file(environ):
+    env_file = read_env_file(environ.get("PROXMOX_OTEL_ENV_FILE", DEFAULT_ENV_FILE))
+    return {key: value for key, value in environ.items() if env_file.get(key) != value}
+
+
+def load_config(environ=None):
+    """Read the agent settings from the environment and make them current.
+
+    Args:
+        environ (dict): Environment mapping to read from (defaults to os.environ)
+
+    Returns:
+        Config: The loaded configuration
+    """
+    global _config, _base_environ
+    environ = os.environ if environ is None else environ
+    _base_environ = _without_env_file(environ)
+    _config = Config(environ)
+    return _config
+
+
+def get_config():
+    """Return the current configuration, loading it on first use."""
+    if _config is None:
+        return load_config()
+    return _config
+
+
+def reload_config():
+    """Re-read the environment file and swap in a new configuration.
+
+    A running process never sees changes to the systemd EnvironmentFile, so
+    the file is parsed again and layered onto the environment the agent
+    started with, minus the values that came from the file then. A setting
+    removed from the file therefore returns to its default (or to a value
+    set outside the file, unless the file had the same value).
+
+    Returns:
+        tuple: (old Config, new Config, set of changed setting names)
+    """
+    global _config
+    old_config = get_config()
+    environ = dict(_base_environ)
+    environ.update(read_env_file(old_config.env_file))
+    new_config = Config(environ)
+    _config = new_config
+    return old_config, new_config, new_config.changed_settings(old_config)
+
+
+class RateLimitFilter(logging.Filter):
+    """Pass the first of each repeated WARNING/ERROR message per interval and drop the rest.
+
+    The next message let through after the interval reports how many
+    identical messages were suppressed. Records below WARNING are not limited.
+    """
+
+    def __init__(self, interval_seconds=300, max_keys=1000):
+        super().__init__()
+        self.interval_seconds = interval_seconds
+        self.max_keys = max_keys
+        # (logger name, level, message) -> [time let through, suppressed count]
+        self._seen = {}
+        self._lock = threading.Lock()
+
+    def filter(self, record):
+        if record.levelno < logging.WARNING:
+            return True
+
+        message = record.getMessage()
+        key = (record.name, record.levelno, message)
+        now = time.monotonic()
+        with self._lock:
+            entry = self._seen.get(key)
+            if entry is not None and now - entry[0] < self.interval_seconds:
+                entry[1] += 1
+                return False
+
+            suppressed = entry[1] if entry is not None else 0
+            self._seen[key] = [now, 0]
+            if len(self._seen) > self.max_keys:
+                self._prune(now)
+
+        if suppressed:
+            record.msg = "%s (repeated %d times in the last %ds)"
+            record.args = (message, suppressed, self.interval_seconds)
+        return True
+
+    def _prune(self, now):
+        for key in [key for key, entry in self._seen.items() if now - entry[0] >= self.interval_seconds]:
+            del self._seen[key]
+
+
+_log_listener = None
+
+
+def setup_logging(config=None):
+    """Route agent logging through a queue to a background writer thread.
+
+    Callers only enqueue records; the QueueListener thread formats them and
+    writes to stderr (journald) and, for the agent logger, to the rotating
+    log file. Repeated warnings and errors are rate limited before enqueueing.
+    """
+    import atexit
+    import queue
+    from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+
+    global _log_listener
+    config = config or get_config()
+    if _log_listener is not None:
+        return
+
+    formatter = logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    handlers = []
+
+    console_handler = logging.StreamHandler()
+    console_handler.setFormatter(logging.Formatter("%(asctime)s %(levelname)s %(name)s %(message)s"))
+    handlers.append(console_handler)
+
+    # Add rotating file handler - agent messages only, as before
+    try:
+        file_handler = RotatingFileHandler(
+            config.log_file_path,
+            maxBytes=config.max_log_size_bytes,
+            backupCount=config.backup_count
+        )
+        file_handler.setFormatter(formatter)
+        file_handler.addFilter(logging.Filter(logger.name))
+        handlers.append(file_handler)
+    except OSError as e:
+        file_handler = None
+        file_error = e
+
+    log_queue = queue.SimpleQueue()
+    queue_handler = QueueHandler(log_queue)
+    queue_handler.addFilter(RateLimitFilter())
+
+    root_logger = logging.getLogger()
+    root_logger.setLevel(config.log_level)
+    root_logger.addHandler(queue_handler)
+    # Per-item detail is logged at DEBUG; LOG_LEVEL=DEBUG shows it
+    logger.setLevel(config.log_level)
+
+    _log_listener = QueueListener(log_queue, *handlers)
+    _log_listener.start()
+    atexit.register(stop_logging)
+
+    if file_handler is None:
+        logger.error("Cannot open log file %s: %s", config.log_file_path, file_error)
+
+
+def stop_logging():
+    """Flush queued log records and stop the background writer thread."""
+    global _log_listener
+    if _log_listener is not None:
+        _log_listener.stop()
+        _log_listener = None
+
+
+def get_resource():
+    """Return the OpenTelemetry resource describing this node, built on first use."""
+    global _resource
+    if _resource is None:
+        from opentelemetry.sdk.resources import Resource
+
+        _resource = Resource.create(
+            {
+                "service.name": "proxmox-server",
+                "service.namespace": "infrastructure",
+                "host.name": get_config().node_name,
+            }
+        )
+    return _resource
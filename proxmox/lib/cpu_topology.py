@@ -0,0 +1,129 @@
+#!/usr/bin/env python3
+"""
+CPU topology for Proxmox OpenTelemetry Monitoring
+
+coretemp registers one hwmon device per physical package. lm-sensors names it
+coretemp-isa-<platform device id>, and its 'Core N' readings carry the
+core_id within that package, which restarts at 0 (and may have gaps) on every
+socket. Which socket a core reading belongs to is therefore a property of the
+hwmon device, not of the core number.
+
+The mapping is read once from sysfs - the 'Package id'/'Core' temp*_label
+files of each coretemp hwmon device and the physical_package_id/core_id of
+every online CPU - and kept until CPUs are hotplugged, which is detected by a
+change of /sys/devices/system/cpu/online.
+"""
+import glob
+import os
+import re
+from lib.config import logger
+
+SYS_CPU = "/sys/devices/system/cpu"
+SYS_HWMON = "/sys/class/hwmon"
+
+_PLATFORM_DEVICE_RE = re.compile(r'^coretemp\.(\d+)$')
+
+
+def _read(path):
+    try:
+        with open(path) as f:
+            return f.read().strip()
+    except OSError:
+        return None
+
+
+def read_cpu_topology(sys_cpu=SYS_CPU):
+    """Read the package and core of every online CPU.
+
+    Returns:
+        dict: {package id: {core id: [cpu numbers]}}, ids as strings
+    """
+    packages = {}
+    for cpu_dir in glob.glob(os.path.join(sys_cpu, "cpu[0-9]*")):
+        # Offline CPUs have no topology directory
+        package_id = _read(os.path.join(cpu_dir, "topology", "physical_package_id"))
+        core_id = _read(os.path.join(cpu_dir, "topology", "core_id"))
+        if package_id is None or core_id is None:
+            continue
+        cpu = int(os.path.basename(cpu_dir)[3:])
+        packages.setdefault(package_id, {}).setdefault(core_id, []).append(cpu)
+    for cores in packages.values():
+        for cpus in cores.values():
+            cpus.sort()
+    return packages
+
+
+def read_coretemp_adapters(sys_hwmon=SYS_HWMON):
+    """Read the package and core ids of every coretemp hwmon device.
+
+    Returns:
+        dict: {lm-sensors adapter name: (package id or None, {core ids})}
+    """
+    adapters = {}
+    for hwmon_dir in glob.glob(os.path.join(sys_hwmon, "hwmon*")):
+        # Older kernels keep the attributes in the device directory
+        base = hwmon_dir if os.path.exists(os.path.join(hwmon_dir, "name")) else os.path.join(hwmon_dir, "device")
+        if _read(os.path.join(base, "name")) != "coretemp":
+            continue
+        match = _PLATFORM_DEVICE_RE.match(os.path.basename(os.path.realpath(os.path.join(hwmon_dir, "device"))))
+        if not match:
+            continue
+        package_id, cores = None, set()
+        for label_path in glob.glob(os.path.join(base, "temp*_label")):
+            label = _read(label_path) or ""
+            if label.startswith("Package id "):
+                package_id = label[len("Package id "):]
+            elif label.startswith("Core "):
+                cores.add(label[len("Core "):])
+        # libsensors prints platform device ids as a 4-digit hex ISA address
+        adapters[f"coretemp-isa-{int(match.group(1)):04x}"] = (package_id, cores)
+    return adapters
+
+
+class CpuTopology:
+    """Core-to-socket mapping of the coretemp sensors, rebuilt on CPU hotplug."""
+
+    def __init__(self, sys_cpu=SYS_CPU, sys_hwmon=SYS_HWMON):
+        self.sys_cpu = sys_cpu
+        self.sys_hwmon = sys_hwmon
+        self._online = None
+        self._built = False
+        self.packages = {}
+        # (adapter name, core id) -> package id
+        self._core_sockets = {}
+        # adapter name -> package id, for cores missing from the hwmon labels
+        self._adapter_sockets = {}
+
+    def refresh(self):
+        """Rebuild the mapping if the set of online CPUs changed since the last call."""
+        online = _read(os.path.join(self.sys_cpu, "online"))
+        if self._built and online == self._online:
+            return
+        self._online = online
+        self._built = True
+        self.packages = read_cpu_topology(self.sys_cpu)
+        self._core_sockets = {}
+        self._adapter_sockets = {}
+        for adapter_name, (package_id, cores) in read_coretemp_adapters(self.sys_hwmon).items():
+            if package_id is None and len(self.packages) == 1:
+                # No package label (very old kernels); unambiguous on single-socket hosts
+                package_id = next(iter(self.packages))
+            if package_id is None:
+                continue
+            self._adapter_sockets[adapter_name] = package_id
+            for core_id in cores:
+                self._core_sockets[(adapter_name, core_id)] = package_id
+        logger.info("CPU topology: %d packages, %d cores, %d coretemp sensors (online CPUs %s)",
+                    len(self.packages), sum(len(cores) for cores in self.packages.values()),
+                    len(self._core_sockets), online)
+
+    def socket(self, adapter_name, core_id):
+        """Return the package id of a coretemp core reading, or None if unknown."""
+        socket_id = self._core_sockets.get((adapter_name, core_id))
+        if socket_id is None:
+            socket_id = self._adapter_sockets.get(adapter_name)
+        return socket_id
+
+    def learn_adapter(self, adapter_name, package_id):
+        """Record the package of an adapter from its 'Package id' reading when sysfs had none."""
+        self._adapter_sockets.setdefault(adapter_name, package_id)
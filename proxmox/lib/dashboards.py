@@ -0,0 +1,468 @@
+#!/usr/bin/env python3
+"""
+Grafana dashboards and Prometheus recording rules for Proxmox OpenTelemetry Monitoring
+
+The dashboards in ../dashboards and the recording rules next to them are
+generated from the definitions below by `main.py dashboards`; edit them here,
+not in the JSON. Every query is checked against the instrument registry
+(lib/instruments.py) first: a metric or label the agent does not export fails
+the generation instead of producing an empty panel.
+
+Aggregations over many series - rates over every disk, interface and guest,
+and the SMART error counters of every attribute of every drive - are
+recording rules, evaluated once per minute by the ruler, so a panel refresh
+reads a handful of precomputed series instead of recomputing rate() over the
+raw ones.
+"""
+import json
+import os
+import re
+from collections import namedtuple
+
+from lib.instruments import INSTRUMENTS, series_name
+
+DASHBOARD_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))), "dashboards")
+RECORDING_RULES_FILE = "recording_rules.yml"
+
+# Labels every series gets from the OTLP ingestion (service.namespace/service.name and instance)
+COMMON_LABELS = ("job", "instance")
+
+# Series that exist without an agent instrument; None accepts any label
+BUILTIN_SERIES = {
+    "ALERTS": None,
+    "target_info": ("service_name", "service_namespace", "host_name"),
+}
+
+RecordingRule = namedtuple("RecordingRule", "record expr labels")
+
+_SMART_ERROR_ATTRIBUTES = (
+    "reallocated_sector_ct", "current_pending_sector", "offline_uncorrectable",
+    "reported_uncorrect", "udma_crc_error_count", "nvme_media_errors",
+)
+
+RECORDING_RULES = (
+    RecordingRule(
+        "proxmox:disk_io_read_megabytes:rate5m",
+        "sum by (job, instance, device) (rate(proxmox_disk_io_read_megabytes_total[5m]))",
+        ("job", "instance", "device"),
+    ),
+    RecordingRule(
+        "proxmox:disk_io_write_megabytes:rate5m",
+        "sum by (job, instance, device) (rate(proxmox_disk_io_write_megabytes_total[5m]))",
+        ("job", "instance", "device"),
+    ),
+    RecordingRule(
+        "proxmox:network_bytes:rate5m",
+        "sum by (job, instance, node, interface, kind, direction) (rate(proxmox_network_bytes_total[5m]))",
+        ("job", "instance", "node", "interface", "kind", "direction"),
+    ),
+    RecordingRule(
+        "proxmox:guest_io_bytes:rate5m",
+        "sum by (job, instance, vmid, name, type, direction) (rate(proxmox_guest_io_bytes_total[5m]))",
+        ("job", "instance", "vmid", "name", "type", "direction"),
+    ),
+    RecordingRule(
+        "proxmox:guest_io_ops:rate5m",
+        "sum by (job, instance, vmid, name, type, direction) (rate(proxmox_guest_io_ops_total[5m]))",
+        ("job", "instance", "vmid", "name", "type", "direction"),
+    ),
+    # SMART raw values are gauges; growth of the error counters over the last hour
+    RecordingRule(
+        "proxmox:smart_error_counters:delta1h",
+        "sum by (job, instance, device, model, serial, attribute_name) "
+        f"(delta(proxmox_smart_attributes{{type=\"raw\",attribute_name=~\"{'|'.join(_SMART_ERROR_ATTRIBUTES)}\"}}[1h]))",
+        ("job", "instance", "device", "model", "serial", "attribute_name"),
+    ),
+    RecordingRule(
+        "proxmox:zfs_vdev_errors:increase1h",
+        "sum by (job, instance, pool, type) (increase(zfs_vdev_errors_total[1h]))",
+        ("job", "instance", "pool", "type"),
+    ),
+)
+
+
+def _target(expr, legend=None, **extra):
+    target = {"expr": expr}
+    if legend is not None:
+        target["legendFormat"] = legend
+    target.update(extra)
+    return target
+
+
+def _panel(panel_type, title, targets=(), description=None, fieldConfig=None, **extra):
+    panel = {"type": panel_type, "title": title}
+    if description:
+        panel["description"] = description
+    if fieldConfig:
+        panel["fieldConfig"] = fieldConfig
+    if targets:
+        panel["targets"] = list(targets)
+    panel.update(extra)
+    return panel
+
+
+def _thresholds(*steps):
+    return {"mode": "absolute", "steps": [{"color": color, "value": value} for color, value in steps]}
+
+
+def _alert(expr, threshold, evaluator="gt", duration="5m"):
+    return {
+        "conditions": [{
+            "evaluator": {"type": evaluator, "params": [threshold]},
+            "query": {"model": {"expr": expr}},
+        }],
+        "for": duration,
+    }
+
+
+def _variable(name, query, multi=True):
+    variable = {"name": name, "type": "query", "datasource": "prometheus", "query": query, "refresh": 1}
+    if multi:
+        variable.update(multi=True, includeAll=True)
+    return variable
+
+
+def _link(title, uid):
+    return {"title": title, "url": f"/d/{uid}"}
+
+
+# (uid, title) of every dashboard, in navigation order
+_NAVIGATION = (
+    ("proxmox-overview", "Proxmox Overview"),
+    ("node-details", "Node Details"),
+    ("vm-dashboard", "VM Dashboard"),
+    ("storage-disk", "Storage & Disk"),
+    ("temperature-sensors", "Temperature Sensors"),
+    ("logs-alerts", "Logs & Alerts"),
+)
+
+
+def _dashboard(uid, panels, variables=()):
+    dashboard = {"title": dict(_NAVIGATION)[uid], "uid": uid, "time": {"from": "now-6h", "to": "now"}}
+    if variables:
+        dashboard["templating"] = {"list": list(variables)}
+    dashboard["panels"] = list(panels)
+    dashboard["links"] = [dict(_link(title, link_uid), type="dashboard") for link_uid, title in _NAVIGATION]
+    dashboard["schemaVersion"] = 41
+    dashboard["version"] = 1
+    return dashboard
+
+
+def _overview():
+    return _dashboard("proxmox-overview", [
+        _panel("gauge", "Cluster CPU Usage", description="Cluster CPU usage (%) averaged across nodes.",
+               fieldConfig={"unit": "percent", "thresholds": _thresholds(("green", 0), ("red", 90))},
+               targets=[_target("avg(proxmox_cpu_usage_percent)", "CPU Usage")],
+               links=[_link("Node Details", "node-details")]),
+        _panel("gauge", "Cluster Memory Usage", description="Average memory usage across cluster (%).",
+               fieldConfig={"unit": "percent", "thresholds": _thresholds(("green", 0), ("yellow", 70), ("red", 90))},
+               targets=[_target("avg(proxmox_memory_usage)", "Memory Usage")],
+               links=[_link("Node Details", "node-details")]),
+        _panel("stat", "Cluster Uptime", description="Uptime of the cluster (seconds).",
+               fieldConfig={"thresholds": _thresholds(("green", 0), ("yellow", 100000), ("red", 10000))},
+               targets=[_target("proxmox_node_uptime", "Uptime")],
+               links=[_link("Node Details", "node-details")]),
+        _panel("stat", "Cluster Quorum", description="Current cluster quorum status (1=quorum, 0=no quorum).",
+               fieldConfig={"thresholds": _thresholds(("red", 0), ("green", 1))},
+               targets=[_target("min(proxmox_cluster_quorate)", "Quorum")],
+               links=[_link("Logs & Alerts", "logs-alerts")]),
+    ])
+
+
+def _node_details():
+    return _dashboard("node-details", [
+        _panel("row", "Node Metrics", collapsed=False, panels=[
+            _panel("timeseries", "CPU Usage", description="CPU usage (%) for selected node.",
+                   targets=[_target('proxmox_cpu_usage_percent{node=~"$node"}', "{{node}}")],
+                   alert=_alert('proxmox_cpu_usage_percent{node=~"$node"}', 90)),
+            _panel("timeseries", "Memory Usage", description="Memory usage (%) for selected node.",
+                   targets=[_target('proxmox_memory_usage{node=~"$node"}', "Memory Usage")]),
+            _panel("stat", "Uptime", description="Node uptime in seconds.",
+                   targets=[_target('proxmox_node_uptime{node=~"$node"}', "Uptime")]),
+            _panel("stat", "Cluster Quorum", description="Cluster quorum status (1 = quorum, 0 = no quorum).",
+                   targets=[_target("min(proxmox_cluster_quorate)", "Quorum")]),
+        ]),
+        _panel("timeseries", "Network Usage (rate)",
+               description="Network bytes per second for selected node (rate over 5m).",
+               targets=[_target('proxmox:network_bytes:rate5m{node=~"$node",kind=~"bridge|bond|physical"}',
+                                "{{interface}} {{direction}}")]),
+    ], variables=[_variable("node", "label_values(proxmox_node_uptime, node)", multi=False)])
+
+
+def _vm_dashboard():
+    view_logs = [_link("View Logs", "logs-alerts")]
+    return _dashboard("vm-dashboard", [
+        _panel("gauge", "VM Status", description="Current status of selected VMs (1=running, 0=stopped).",
+               targets=[_target('proxmox_vm_status{vmid=~"$vmid"}', "{{name}}")], links=view_logs),
+        _panel("gauge", "VM CPU Usage", description="CPU usage for selected VMs (%).",
+               fieldConfig={"unit": "percent"},
+               targets=[_target('proxmox_vm_cpu_usage{vmid=~"$vmid"}', "{{name}}")], links=view_logs),
+        _panel("timeseries", "VM Memory Usage", description="Memory usage for selected VMs (%).",
+               targets=[_target('proxmox_vm_memory_usage{vmid=~"$vmid"}', "{{name}}")]),
+        _panel("timeseries", "VM Disk I/O (Bytes)",
+               description="Disk I/O of selected guests from cgroup io.stat (read/write, 5m rate).",
+               fieldConfig={"unit": "Bps"},
+               targets=[_target('proxmox:guest_io_bytes:rate5m{vmid=~"$vmid",direction="read"}', "Read: {{name}}"),
+                        _target('proxmox:guest_io_bytes:rate5m{vmid=~"$vmid",direction="write"}', "Write: {{name}}")]),
+        _panel("timeseries", "VM Disk IOPS", description="Read/write operations per second of selected guests.",
+               targets=[_target('proxmox:guest_io_ops:rate5m{vmid=~"$vmid"}', "{{name}} {{direction}}")]),
+    ], variables=[
+        _variable("vmid", "label_values(proxmox_vm_status, vmid)"),
+        _variable("name", "label_values(proxmox_vm_status, name)"),
+        _variable("type", "label_values(proxmox_vm_status, type)"),
+    ])
+
+
+def _storage_disk():
+    return _dashboard("storage-disk", [
+        _panel("row", "ZFS Metrics", collapsed=False),
+        _panel("stat", "ZFS Pool Health",
+               targets=[_target('zfs_pool_health_status{pool=~"$pool"}', "Pool: {{pool}} ({{health_text}})")]),
+        _panel("timeseries", "ZFS Pool Capacity %",
+               targets=[_target('zfs_pool_capacity_ratio{pool=~"$pool"}', "Pool: {{pool}}")],
+               alert=_alert('zfs_pool_capacity_ratio{pool=~"$pool"}', 90)),
+        _panel("timeseries", "ZFS Pool Fragmentation %",
+               targets=[_target('zfs_pool_fragmentation_ratio{pool=~"$pool"}', "Pool: {{pool}}")]),
+        _panel("timeseries", "ZFS vdev Errors (1h)",
+               description="READ/WRITE/CKSUM errors counted by the pool's vdevs over the last hour.",
+               targets=[_target('proxmox:zfs_vdev_errors:increase1h{pool=~"$pool"}', "Pool: {{pool}} {{type}}")],
+               alert=_alert('proxmox:zfs_vdev_errors:increase1h{pool=~"$pool"}', 0)),
+        _panel("timeseries", "Disk I/O (MB/s)",
+               targets=[_target('proxmox:disk_io_read_megabytes:rate5m{device=~"$device"}', "Read: {{device}}"),
+                        _target('proxmox:disk_io_write_megabytes:rate5m{device=~"$device"}', "Write: {{device}}")]),
+        _panel("timeseries", "SMART Error Counters (1h)",
+               description="Growth of reallocated/pending/uncorrectable sector, CRC and NVMe media error counts.",
+               targets=[_target('proxmox:smart_error_counters:delta1h{device=~"$device"}', "{{device}} {{attribute_name}}")],
+               alert=_alert("proxmox:smart_error_counters:delta1h", 0)),
+        _panel("table", "SMART Attributes",
+               targets=[_target('proxmox_smart_attributes{device=~"$device"}', "{{attribute_name}} ({{type}})")],
+               sort={"col": 0, "desc": True},
+               styles=[{"pattern": "Value", "thresholds": ["100"], "colors": ["red"]}]),
+    ], variables=[
+        _variable("pool", "label_values(zfs_pool_health_status, pool)"),
+        _variable("device", "label_values(proxmox_disk_io_read_megabytes_total, device)"),
+    ])
+
+
+def _temperature_sensors():
+    def sensors(matchers, legend=None):
+        return [_target(f'proxmox_temperature{{{matchers}name=~"$sensor"}}', legend, maxDataPoints=500)]
+
+    return _dashboard("temperature-sensors", [
+        _panel("timeseries", "All Sensor Temperatures", description="All temperature sensors (multi-select enabled).",
+               targets=sensors("", "{{name}}")),
+        _panel("timeseries", "CPU Core Temperatures", description="CPU core temperatures in Celsius.",
+               targets=sensors('source="cpu",type="core",', "Core {{name}}"),
+               alert=_alert('proxmox_temperature{source="cpu"}', 85)),
+        _panel("timeseries", "NVMe Temperatures", description="NVMe drive temperatures in Celsius.",
+               targets=sensors('source="nvme",', "NVMe {{name}}")),
+        _panel("timeseries", "Gigabyte WMI Sensors", description="Motherboard sensor temperatures (Gigabyte WMI).",
+               targets=sensors('source="gigabyte_wmi",', "WMI {{name}}")),
+        _panel("timeseries", "ACPI/Other Sensors", description="ACPI and other miscellaneous sensor temperatures.",
+               targets=sensors('source=~"acpi|other",', "{{source}} {{name}}")),
+        _panel("heatmap", "Temperature Sensor Heatmap", description="Heatmap of all temperature sensors.",
+               targets=[_target('proxmox_temperature{name=~"$sensor"}')]),
+        _panel("heatmap", "CPU Core Temperature Heatmap", description="CPU core temperatures (\u00b0C).",
+               targets=[_target('proxmox_temperature{source="cpu",type="core",name=~"$sensor"}')]),
+    ], variables=[_variable("sensor", "label_values(proxmox_temperature, name)")])
+
+
+def _logs_alerts():
+    return _dashboard("logs-alerts", [
+        _panel("logs", "System Logs",
+               targets=[{"expr": '{service_name="proxmox-server",service_namespace="infrastructure",level=~"error|warn"}',
+                         "refId": "A"}],
+               links=[{"title": "Proxmox UI", "url": "https://192.168.0.110:8006/#v1:0:18:4:::::::"}]),
+        _panel("logs", "Exporter Logs (Errors/Warnings)",
+               targets=[{"expr": '{service_name="proxmox-otel-monitor",level=~"error|warn"}', "refId": "A"}]),
+        _panel("table", "Active Alerts", targets=[{"expr": 'ALERTS{alertstate="firing"}', "refId": "A"}],
+               links=[{"title": "Source", "url": "{{ grafana_dashboard_url }}"}]),
+        _panel("table", "Agent Alerts", targets=[_target("proxmox_alert_active == 1", "{{alertname}}")]),
+        _panel("stat", "Failed Backups (Count)",
+               targets=[_target("count(proxmox_backup_status == 0) or vector(0)", "Failed Backups")]),
+        _panel("stat", "Sensors Over 80\u00b0C (Count)",
+               targets=[_target("count(proxmox_temperature > 80) or vector(0)", "Sensors >80\u00b0C")]),
+        _panel("stat", "Unhealthy ZFS Pools (Count)",
+               targets=[_target('count(zfs_pool_health_status{health_text!="ONLINE"}) or vector(0)',
+                                "Unhealthy ZFS Pools")]),
+        _panel("stat", "VMs Not Running (Count)",
+               targets=[_target("count(proxmox_vm_status == 0) or vector(0)", "VMs Not Running")]),
+    ])
+
+
+# File name (without .json) -> dashboard builder
+DASHBOARDS = {
+    "overview": _overview,
+    "node_details": _node_details,
+    "vm_dashboard": _vm_dashboard,
+    "storage_disk": _storage_disk,
+    "temperature_sensors": _temperature_sensors,
+    "logs_alerts": _logs_alerts,
+}
+
+
+def known_series():
+    """Return {series name: allowed labels (None: any)} for the instruments, rules and built-in series."""
+    series = {series_name(instrument): set(instrument.attributes) | set(COMMON_LABELS) for instrument in INSTRUMENTS}
+    series.update((rule.record, set(rule.labels)) for rule in RECORDING_RULES)
+    series.update((name, None if labels is None else set(labels) | set(COMMON_LABELS))
+                  for name, labels in BUILTIN_SERIES.items())
+    return series
+
+
+# A light PromQL tokenizer: enough to find the selectors and label names of a query
+_TOKEN_RE = re.compile(r'"(?:\\.|[^"\\])*"|\{(?:"(?:\\.|[^"\\])*"|[^}"])*\}|\[[^\]]*\]|\d[\w.]*|[a-zA-Z_:][\w:]*|\S')
+_MATCHER_RE = re.compile(r'([a-zA-Z_]\w*)\s*(?:=~|!~|!=|=)')
+_LEGEND_RE = re.compile(r'\{\{\s*(\w+)\s*\}\}')
+_LABEL_LIST_KEYWORDS = {"by", "without", "on", "ignoring", "group_left", "group_right"}
+_AGGREGATIONS = {
+    "sum", "min", "max", "avg", "group", "stddev", "stdvar", "count", "count_values",
+    "bottomk", "topk", "quantile", "limitk", "limit_ratio",
+}
+_KEYWORDS = {"bool", "and", "or", "unless", "offset", "atan2", "inf", "nan"}
+
+
+def parse_query(expr):
+    """Find the selectors and grouping labels of a PromQL expression.
+
+    Returns:
+        tuple: ([(metric name or None, [matcher labels])], [grouping labels])
+    """
+    tokens = _TOKEN_RE.findall(expr)
+    selectors, grouping = [], []
+    i = 0
+    while i < len(tokens):
+        token = tokens[i]
+        following = tokens[i + 1] if i + 1 < len(tokens) else ""
+        if token in _LABEL_LIST_KEYWORDS and following == "(":
+            i += 2
+            while i < len(tokens) and tokens[i] != ")":
+                if tokens[i] != ",":
+                    grouping.append(tokens[i])
+                i += 1
+        elif token.startswith("{"):
+            selectors.append((None, _MATCHER_RE.findall(token)))
+        elif re.match(r'[a-zA-Z_:]', token) and following != "(" and token not in _AGGREGATIONS | _KEYWORDS:
+            labels = []
+            if following.startswith("{"):
+                labels = _MATCHER_RE.findall(following)
+                i += 1
+            selectors.append((token, labels))
+        i += 1
+    return selectors, grouping
+
+
+def validate_query(expr, legend=None, series=None):
+    """Check a query's metrics and labels against the known series.
+
+    Returns:
+        list: Problems found, empty if the query is valid
+    """
+    series = known_series() if series is None else series
+    problems = []
+    available = set(COMMON_LABELS)
+    selectors, grouping = parse_query(expr)
+    for name, labels in selectors:
+        if name is None:
+            problems.append(f"selector without a metric name in {expr!r}")
+            continue
+        if name not in series:
+            problems.append(f"unknown series {name} in {expr!r}")
+            available = None
+            continue
+        allowed = series[name]
+        if allowed is None:
+            # Labels unknown: grouping and legend labels cannot be checked
+            available = None
+            continue
+        if available is not None:
+            available |= allowed
+        problems.extend(f"{name} has no label {label} ({expr!r})" for label in labels if label not in allowed)
+    if available is not None:
+        problems.extend(f"no series in {expr!r} has label {label}" for label in grouping if label not in available)
+        for label in _LEGEND_RE.findall(legend or ""):
+            if label not in available:
+                problems.append(f"legend {legend!r} uses label {label}, which {expr!r} does not have")
+    return problems
+
+
+def _validate_variable(query, series):
+    match = re.fullmatch(r'label_values\((?:\s*([a-zA-Z_:][\w:]*)\s*,)?\s*(\w+)\s*\)', query)
+    if not match:
+        return [f"unsupported variable query {query!r}"]
+    name, label = match.groups()
+    if name is None:
+        return [f"variable query {query!r} should name a metric"]
+    if name not in series:
+        return [f"unknown series {name} in {query!r}"]
+    if series[name] is not None and label not in series[name]:
+        return [f"{name} has no label {label} ({query!r})"]
+    return []
+
+
+def _panels(panels):
+    for panel in panels:
+        yield panel
+        yield from _panels(panel.get("panels", []))
+
+
+def validate_dashboard(name, dashboard):
+    """Return the problems of a dashboard's queries, prefixed with the dashboard and panel."""
+    series = known_series()
+    problems = []
+    for variable in dashboard.get("templating", {}).get("list", []):
+        problems.extend(f"{name}: variable ${variable['name']}: {problem}"
+                        for problem in _validate_variable(variable["query"], series))
+    for panel in _panels(dashboard["panels"]):
+        # Log panels query Loki, not Prometheus
+        if panel["type"] == "logs":
+            continue
+        queries = [(target["expr"], target.get("legendFormat")) for target in panel.get("targets", [])]
+        for condition in panel.get("alert", {}).get("conditions", []):
+            queries.append((condition["query"]["model"]["expr"], None))
+        for expr, legend in queries:
+            problems.extend(f"{name}: {panel['title']}: {problem}" for problem in validate_query(expr, legend, series))
+    return problems
+
+
+def validate_recording_rules():
+    """Return the problems of the recording rule expressions."""
+    series = known_series()
+    problems = []
+    for rule in RECORDING_RULES:
+        problems.extend(f"{rule.record}: {problem}" for problem in validate_query(rule.expr, series=series))
+        _, grouping = parse_query(rule.expr)
+        if set(grouping) != set(rule.labels):
+            problems.append(f"{rule.record}: declared labels {sorted(rule.labels)} differ from {sorted(grouping)}")
+    return problems
+
+
+def render_recording_rules():
+    """Render the recording rules as a Prometheus/Mimir rule file."""
+    lines = [
+        "# Generated by `main.py dashboards` from proxmox/lib/dashboards.py - do not edit.",
+        "groups:",
+        "  - name: proxmox",
+        "    interval: 1m",
+        "    rules:",
+    ]
+    for rule in RECORDING_RULES:
+        lines.append(f"      - record: {rule.record}")
+        # A JSON string is a valid double-quoted YAML scalar
+        lines.append(f"        expr: {json.dumps(rule.expr)}")
+    return "\n".join(lines) + "\n"
+
+
+def generate():
+    """Build every dashboard and the recording rules.
+
+    Returns:
+        tuple: ({file name: content}, [problems])
+    """
+    files, problems = {}, validate_recording_rules()
+    for name, build in DASHBOARDS.items():
+        dashboard = build()
+        problems.extend(validate_dashboard(name, dashboard))
+        files[f"{name}.json"] = json.dumps({"dashboard": dashboard, "folderId": 0, "overwrite": True}, indent=4) + "\n"
+    files[RECORDING_RULES_FILE] = render_recording_rules()
+    return files, problems
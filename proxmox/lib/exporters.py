@@ -0,0 +1,236 @@
+#!/usr/bin/env python3
+"""
+Export destinations for Proxmox OpenTelemetry Monitoring
+
+Every configured destination of a signal gets its own OTLP/HTTP exporter
+behind its own periodic reader (metrics) or batch processor (logs, traces),
+so each has its own thread, queue, compression and timeout: a slow or
+unreachable destination fills and drops from its own queue while the others
+keep exporting. The exporters are wrapped to record per-destination export
+latency and the number of items exported, failed and dropped, which are
+exported as proxmox_agent_export_* metrics.
+"""
+import threading
+import time
+
+from opentelemetry.sdk._logs.export import BatchLogRecordProcessor, LogExporter, LogExportResult
+from opentelemetry.sdk.metrics.export import MetricExporter, MetricExportResult, PeriodicExportingMetricReader
+from opentelemetry.sdk.trace.export import BatchSpanProcessor, SpanExporter, SpanExportResult
+
+from lib.config import logger
+
+# Per-destination statistics, in the order the exporters were created
+export_stats = []
+
+
+class ExportStats:
+    """Counters of one destination of one signal."""
+
+    def __init__(self, signal, destination):
+        self.signal = signal
+        self.destination = destination
+        self.labels = {"signal": signal, "destination": destination}
+        self._lock = threading.Lock()
+        self.last_duration = None
+        self.exported = 0
+        self.failed = 0
+        self.dropped = 0
+
+    def record_export(self, duration, items, success):
+        with self._lock:
+            self.last_duration = duration
+            if success:
+                self.exported += items
+            else:
+                self.failed += items
+
+    def record_drop(self, items=1):
+        with self._lock:
+            self.dropped += items
+
+
+def _compression(name):
+    from opentelemetry.exporter.otlp.proto.http import Compression
+    return {"gzip": Compression.Gzip, "deflate": Compression.Deflate}.get(name, Compression.NoCompression)
+
+
+def _timed_export(stats, export, items, success_result):
+    started = time.monotonic()
+    try:
+        result = export()
+    except Exception as e:
+        logger.error("Export of %s to %s failed: %s", stats.signal, stats.destination, e)
+        stats.record_export(time.monotonic() - started, items, False)
+        raise
+    stats.record_export(time.monotonic() - started, items, result == success_result)
+    return result
+
+
+class InstrumentedMetricExporter(MetricExporter):
+    """Metric exporter wrapper recording latency and exported/failed data points."""
+
+    def __init__(self, exporter, stats):
+        super().__init__(
+            preferred_temporality=exporter._preferred_temporality,
+            preferred_aggregation=exporter._preferred_aggregation,
+        )
+        self._exporter = exporter
+        self._stats = stats
+
+    def export(self, metrics_data, timeout_millis=10_000, **kwargs):
+        points = sum(
+            len(metric.data.data_points)
+            for resource_metrics in metrics_data.resource_metrics
+            for scope_metrics in resource_metrics.scope_metrics
+            for metric in scope_metrics.metrics
+        )
+        return _timed_export(self._stats, lambda: self._exporter.export(metrics_data, timeout_millis=timeout_millis, **kwargs),
+                             points, MetricExportResult.SUCCESS)
+
+    def force_flush(self, timeout_millis=10_000):
+        return self._exporter.force_flush(timeout_millis)
+
+    def shutdown(self, timeout_millis=30_000, **kwargs):
+        self._exporter.shutdown(timeout_millis=timeout_millis, **kwargs)
+
+
+class InstrumentedLogExporter(LogExporter):
+    """Log exporter wrapper recording latency and exported/failed log records."""
+
+    def __init__(self, exporter, stats):
+        self._exporter = exporter
+        self._stats = stats
+
+    def export(self, batch):
+        return _timed_export(self._stats, lambda: self._exporter.export(batch), len(batch), LogExportResult.SUCCESS)
+
+    def shutdown(self):
+        self._exporter.shutdown()
+
+
+class InstrumentedSpanExporter(SpanExporter):
+    """Span exporter wrapper recording latency and exported/failed spans."""
+
+    def __init__(self, exporter, stats):
+        self._exporter = exporter
+        self._stats = stats
+
+    def export(self, spans):
+        return _timed_export(self._stats, lambda: self._exporter.export(spans), len(spans), SpanExportResult.SUCCESS)
+
+    def shutdown(self):
+        self._exporter.shutdown()
+
+    def force_flush(self, timeout_millis=30_000):
+        return self._exporter.force_flush(timeout_millis)
+
+
+class _CountingBatchLogRecordProcessor(BatchLogRecordProcessor):
+    """Batch processor that counts the records pushed out of its full queue."""
+
+    def __init__(self, exporter, stats, **kwargs):
+        super().__init__(exporter, **kwargs)
+        self._stats = stats
+
+    def emit(self, log_data):
+        # The queue is a bounded deque: appending to a full one drops the oldest record
+        if len(self._queue) >= self._max_queue_size:
+            self._stats.record_drop()
+        super().emit(log_data)
+
+
+class _CountingBatchSpanProcessor(BatchSpanProcessor):
+    """Batch processor that counts the spans pushed out of its full queue."""
+
+    def __init__(self, exporter, stats, **kwargs):
+        super().__init__(exporter, **kwargs)
+        self._stats = stats
+
+    def on_end(self, span):
+        if span.context.trace_flags.sampled and len(self.queue) >= self.max_queue_size:
+            self._stats.record_drop()
+        super().on_end(span)
+
+
+def create_metric_readers(destinations, export_interval_millis):
+    """Return one periodic reader per metrics destination."""
+    from opentelemetry.exporter.otlp.proto.http.metric_exporter import OTLPMetricExporter
+
+    readers = []
+    for destination in destinations:
+        stats = ExportStats("metrics", destination.name)
+        export_stats.append(stats)
+        exporter = OTLPMetricExporter(
+            endpoint=destination.endpoint,
+            timeout=destination.timeout,
+            compression=_compression(destination.compression),
+        )
+        readers.append(PeriodicExportingMetricReader(
+            InstrumentedMetricExporter(exporter, stats),
+            export_interval_millis=export_interval_millis,
+            export_timeout_millis=destination.timeout * 1000,
+        ))
+        logger.info("Exporting metrics to %s", destination.endpoint)
+    return readers
+
+
+def add_log_processors(log_provider, destinations):
+    """Add one batch processor per logs destination to a LoggerProvider."""
+    from opentelemetry.exporter.otlp.proto.http._log_exporter import OTLPLogExporter
+
+    for destination in destinations:
+        stats = ExportStats("logs", destination.name)
+        export_stats.append(stats)
+        exporter = OTLPLogExporter(
+            endpoint=destination.endpoint,
+            timeout=destination.timeout,
+            compression=_compression(destination.compression),
+        )
+        log_provider.add_log_record_processor(_CountingBatchLogRecordProcessor(
+            InstrumentedLogExporter(exporter, stats), stats,
+            max_queue_size=destination.max_queue_size,
+            max_export_batch_size=min(destination.max_export_batch_size, destination.max_queue_size),
+            export_timeout_millis=destination.timeout * 1000,
+        ))
+        logger.info("Exporting logs to %s", destination.endpoint)
+
+
+def add_span_processors(tracer_provider, destinations):
+    """Add one batch processor per traces destination to a TracerProvider."""
+    from opentelemetry.exporter.otlp.proto.http.trace_exporter import OTLPSpanExporter
+
+    for destination in destinations:
+        stats = ExportStats("traces", destination.name)
+        export_stats.append(stats)
+        exporter = OTLPSpanExporter(
+            endpoint=destination.endpoint,
+            timeout=destination.timeout,
+            compression=_compression(destination.compression),
+        )
+        tracer_provider.add_span_processor(_CountingBatchSpanProcessor(
+            InstrumentedSpanExporter(exporter, stats), stats,
+            max_queue_size=destination.max_queue_size,
+            max_export_batch_size=min(destination.max_export_batch_size, destination.max_queue_size),
+            export_timeout_millis=destination.timeout * 1000,
+        ))
+        logger.info("Exporting traces to %s", destination.endpoint)
+
+
+def register_export_metrics(meter):
+    """Register the per-destination export latency and item counters."""
+    from opentelemetry.metrics import Observation
+    from lib.instruments import create_instrument
+
+    def export_latency_callback(options):
+        for stats in export_stats:
+            if stats.last_duration is not None:
+                yield Observation(stats.last_duration, stats.labels)
+
+    def export_items_callback(options):
+        for stats in export_stats:
+            yield Observation(stats.exported, dict(stats.labels, result="exported"))
+            yield Observation(stats.failed, dict(stats.labels, result="failed"))
+            yield Observation(stats.dropped, dict(stats.labels, result="dropped"))
+
+    create_instrument(meter, "proxmox_agent_export_latency_seconds", export_latency_callback)
+    create_instrument(meter, "proxmox_agent_export_items_total", export_items_callback)
@@ -0,0 +1,271 @@
+#!/usr/bin/env python3
+"""
+Instrument registry for Proxmox OpenTelemetry Monitoring
+
+Every metric the agent exports is declared here once: its name, instrument
+kind, unit, the collector group it belongs to and the attributes it carries.
+main.py creates the instruments from these entries, and lib/dashboards.py
+checks the dashboard queries and recording rules against them, so a renamed
+metric or attribute shows up in `main.py dashboards --check` instead of as an
+empty Grafana panel.
+"""
+from collections import namedtuple
+
+# key:         name the instrument is stored under in metrics_dict
+# kind:        gauge, counter, observable_gauge or observable_counter
+# group:       collector whose enablement gates the observable callback (None: always on)
+# attributes:  attribute names the collector sets (not all on every data point)
+Instrument = namedtuple("Instrument", "key name kind unit group attributes description")
+
+_NODE = ("node", "hostname")
+_GUEST = ("vmid", "name", "type")
+_SMART = ("device", "model", "serial", "attribute_id", "attribute_name", "type", "legend", "metric")
+_STORAGE = ("storage", "type", "content")
+_NETWORK = ("node", "interface", "kind", "guest_type", "vmid", "net", "direction")
+_ZFS_DATASET = ("dataset", "pool", "type", "vmid")
+
+INSTRUMENTS = (
+    # Synchronous gauges and counters set by the per-cycle collectors
+    Instrument("temperature", "proxmox_temperature", "gauge", "celsius", "temperature",
+               ("source", "type", "name", "high", "critical", "socket"),
+               "Temperature in degrees Celsius from various sensors"),
+    Instrument("cpu_usage", "proxmox_cpu_usage_percent", "gauge", "%", "system", _NODE,
+               "CPU usage percentage"),
+    Instrument("memory_used", "proxmox_memory_used", "gauge", "bytes", "system", _NODE,
+               "Memory used in bytes"),
+    Instrument("memory_total", "proxmox_memory_total", "gauge", "bytes", "system", _NODE,
+               "Total memory in bytes"),
+    Instrument("memory_usage", "proxmox_memory_usage", "gauge", "%", "system", _NODE,
+               "Memory usage percentage"),
+    Instrument("node_uptime", "proxmox_node_uptime", "gauge", "s", "system", _NODE,
+               "Node uptime in seconds"),
+    Instrument("cluster_quorate", "proxmox_cluster_quorate", "gauge", "state", "cluster", ("node",),
+               "Cluster quorum status (1=quorate, 0=not quorate)"),
+    Instrument("cluster_nodes", "proxmox_cluster_node_online", "gauge", "state", "cluster", ("node",),
+               "Cluster node online status (1=online, 0=offline)"),
+    Instrument("cluster_reporter", "proxmox_cluster_reporter", "gauge", "state", None, ("node",),
+               "Whether this node runs the cluster-scope collectors (1=reporter, 0=standby)"),
+    Instrument("storage_status", "proxmox_storage_status", "gauge", "state", "storage", _STORAGE,
+               "Storage status (1=active, 0=inactive)"),
+    Instrument("storage_usage", "proxmox_storage_usage", "gauge", "%", "storage", _STORAGE + ("unit",),
+               "Storage usage percentage"),
+    Instrument("storage_used", "proxmox_storage_used", "gauge", "bytes", "storage", _STORAGE + ("unit",),
+               "Storage used in bytes"),
+    Instrument("storage_total", "proxmox_storage_total", "gauge", "bytes", "storage", _STORAGE + ("unit",),
+               "Total storage in bytes"),
+    Instrument("smart_metrics", "proxmox_smart_attributes", "gauge", "value", "smart", _SMART,
+               "SMART disk attributes"),
+    Instrument("vm_status", "proxmox_vm_status", "gauge", "state", "vm", _GUEST,
+               "VM status (1=running, 0=stopped)"),
+    Instrument("vm_cpu_usage", "proxmox_vm_cpu_usage", "gauge", "%", "vm", _GUEST,
+               "VM CPU usage percentage"),
+    Instrument("vm_memory_usage", "proxmox_vm_memory_usage", "gauge", "%", "vm", _GUEST,
+               "VM memory usage percentage"),
+    Instrument("guest_cpu_usage", "proxmox_guest_cpu_usage_percent", "gauge", "%", "guest_cgroup", _GUEST,
+               "Guest CPU usage from cgroup cpu.stat (100 = one host CPU)"),
+    Instrument("guest_memory", "proxmox_guest_memory_bytes", "gauge", "bytes", "guest_cgroup", _GUEST + ("kind",),
+               "Guest memory from cgroup memory.current and memory.stat"),
+    Instrument("guest_cpu_pressure", "proxmox_guest_cpu_pressure", "gauge", "%", "guest_cgroup",
+               _GUEST + ("scope", "window"),
+               "Guest CPU pressure stall percentage from cgroup cpu.pressure"),
+    Instrument("backup_status", "proxmox_backup_status", "gauge", "state", "tasks", ("node", "vmid"),
+               "Result of the last backup of a guest (1=OK or warnings, 0=failed)"),
+    Instrument("task_duration", "proxmox_task_duration_seconds", "gauge", "s", "tasks", ("node", "type", "vmid"),
+               "Duration of the last backup (vzdump) or replication (pvesr) task of a guest"),
+    Instrument("task_last_success", "proxmox_task_last_success_timestamp_seconds", "gauge", "s", "tasks",
+               ("node", "type", "vmid"),
+               "End time of the last successful backup or replication of a guest"),
+    Instrument("task_runs", "proxmox_task_runs_total", "counter", "tasks", "tasks", ("node", "type", "vmid", "status"),
+               "Finished backup and replication tasks by outcome (ok, warning, error)"),
+    Instrument("tasks_running", "proxmox_tasks_running", "gauge", "tasks", "tasks", ("node", "type"),
+               "Backup and replication tasks currently running"),
+    Instrument("poller_up", "proxmox_poller_up", "gauge", "state", None, ("target",),
+               "Whether the last poll of a node over the Proxmox API succeeded (main.py poll)"),
+    Instrument("poller_duration", "proxmox_poller_duration_seconds", "gauge", "s", None, ("target",),
+               "Duration of the last successful poll of a node over the Proxmox API (main.py poll)"),
+    Instrument("cycle_lag", "proxmox_agent_cycle_lag_seconds", "gauge", "s", None, (),
+               "How late the last collection cycle started relative to its schedule"),
+    Instrument("cycles_skipped", "proxmox_agent_cycles_skipped_total", "counter", "cycles", None, (),
+               "Collection cycles dropped because the previous cycle overran"),
+
+    # ZFS pools: one `zpool list`/`zpool status`/`zpool iostat` per export, see zfs_collector
+    Instrument("zfs_pool_health_status", "zfs_pool_health_status", "observable_gauge", "state", "zfs",
+               ("pool", "legend", "health_text", "metric"),
+               "ZFS pool health status (0=ONLINE, 1=DEGRADED, 2=FAULTED, 3=OFFLINE, 4=UNAVAIL, 5=REMOVED)"),
+    Instrument("zfs_pool_capacity_ratio", "zfs_pool_capacity_ratio", "observable_gauge", "%", "zfs",
+               ("pool", "metric"),
+               "ZFS pool capacity usage percentage"),
+    Instrument("zfs_pool_fragmentation_ratio", "zfs_pool_fragmentation_ratio", "observable_gauge", "%", "zfs",
+               ("pool", "metric"),
+               "ZFS pool fragmentation percentage"),
+    Instrument("zfs_pool_checksum_errors_total", "zfs_pool_checksum_errors_total", "observable_counter", "errors",
+               "zfs", ("pool", "metric"),
+               "Total ZFS pool checksum errors - use increase() or rate() in queries"),
+    Instrument("zfs_pool_read_bytes_total", "zfs_pool_read_bytes_total", "observable_counter", "bytes", "zfs",
+               ("pool", "metric"),
+               "Total bytes read from ZFS pool - use rate() in queries"),
+    Instrument("zfs_pool_write_bytes_total", "zfs_pool_write_bytes_total", "observable_counter", "bytes", "zfs",
+               ("pool", "metric"),
+               "Total bytes written to ZFS pool - use rate() in queries"),
+    Instrument("zfs_pool_read_ops_total", "zfs_pool_read_ops_total", "observable_counter", "operations", "zfs",
+               ("pool", "metric"),
+               "Total read operations on ZFS pool - use rate() in queries"),
+    Instrument("zfs_pool_write_ops_total", "zfs_pool_write_ops_total", "observable_counter", "operations", "zfs",
+               ("pool", "metric"),
+               "Total write operations on ZFS pool - use rate() in queries"),
+    Instrument("zfs_pool_size_bytes", "zfs_pool_size_bytes", "observable_gauge", "bytes", "zfs", ("pool",),
+               "ZFS pool size"),
+    Instrument("zfs_pool_allocated_bytes", "zfs_pool_allocated_bytes", "observable_gauge", "bytes", "zfs", ("pool",),
+               "ZFS pool allocated space"),
+    Instrument("zfs_pool_free_bytes", "zfs_pool_free_bytes", "observable_gauge", "bytes", "zfs", ("pool",),
+               "ZFS pool free space"),
+    Instrument("zfs_vdev_errors_total", "zfs_vdev_errors_total", "observable_counter", "errors", "zfs",
+               ("pool", "vdev", "type"),
+               "ZFS vdev READ/WRITE/CKSUM error counters from zpool status (reset by zpool clear)"),
+    Instrument("zfs_vdev_state", "zfs_vdev_state", "observable_gauge", "state", "zfs", ("pool", "vdev", "state"),
+               "ZFS vdev state (0=ONLINE, 1=DEGRADED, 2=FAULTED, 3=OFFLINE, 4=UNAVAIL, 5=REMOVED)"),
+    Instrument("zfs_pool_scan_progress_percent", "zfs_pool_scan_progress_percent", "observable_gauge", "%", "zfs",
+               ("pool", "function"),
+               "Progress of the current or last scrub/resilver"),
+    Instrument("zfs_pool_scan_active", "zfs_pool_scan_active", "observable_gauge", "state", "zfs",
+               ("pool", "function"),
+               "Whether a scrub/resilver is running (1) or not (0)"),
+    Instrument("zfs_pool_scan_errors", "zfs_pool_scan_errors", "observable_gauge", "errors", "zfs",
+               ("pool", "function"),
+               "Errors found by the current or last scrub/resilver"),
+
+    # ZFS datasets and zvols from a cached `zfs get`
+    Instrument("zfs_dataset_used_bytes", "zfs_dataset_used_bytes", "observable_gauge", "bytes", "zfs_datasets",
+               _ZFS_DATASET,
+               "Space used by a ZFS dataset or zvol and its descendants"),
+    Instrument("zfs_dataset_referenced_bytes", "zfs_dataset_referenced_bytes", "observable_gauge", "bytes",
+               "zfs_datasets", _ZFS_DATASET,
+               "Data referenced by a ZFS dataset or zvol (may be shared with snapshots)"),
+    Instrument("zfs_dataset_logical_used_bytes", "zfs_dataset_logical_used_bytes", "observable_gauge", "bytes",
+               "zfs_datasets", _ZFS_DATASET,
+               "Space used by a ZFS dataset or zvol before compression"),
+    Instrument("zfs_dataset_compress_ratio", "zfs_dataset_compress_ratio", "observable_gauge", "ratio",
+               "zfs_datasets", _ZFS_DATASET,
+               "Compression ratio achieved for a ZFS dataset or zvol"),
+    Instrument("zfs_dataset_quota_bytes", "zfs_dataset_quota_bytes", "observable_gauge", "bytes", "zfs_datasets",
+               _ZFS_DATASET,
+               "Quota of a ZFS filesystem (only reported when set)"),
+
+    # Disk and network counters from /proc
+    Instrument("proxmox_disk_io_read_megabytes_total", "proxmox_disk_io_read_megabytes_total", "observable_counter",
+               "MB", "disk_io", ("device", "legend", "metric"),
+               "Total megabytes read from disk - use rate() in queries"),
+    Instrument("proxmox_disk_io_write_megabytes_total", "proxmox_disk_io_write_megabytes_total", "observable_counter",
+               "MB", "disk_io", ("device", "legend", "metric"),
+               "Total megabytes written to disk - use rate() in queries"),
+    Instrument("proxmox_network_bytes_total", "proxmox_network_bytes_total", "observable_counter", "bytes", "network",
+               _NETWORK,
+               "Total bytes received/transmitted per interface - use rate() in queries"),
+    Instrument("proxmox_network_packets_total", "proxmox_network_packets_total", "observable_counter", "packets",
+               "network", _NETWORK,
+               "Total packets received/transmitted per interface - use rate() in queries"),
+    Instrument("proxmox_network_errors_total", "proxmox_network_errors_total", "observable_counter", "errors",
+               "network", _NETWORK,
+               "Total receive/transmit errors per interface - use increase() or rate() in queries"),
+    Instrument("proxmox_network_drops_total", "proxmox_network_drops_total", "observable_counter", "packets",
+               "network", _NETWORK,
+               "Total dropped packets per interface - use increase() or rate() in queries"),
+
+    # Background samplers
+    Instrument("proxmox_pressure_stall_percent", "proxmox_pressure_stall_percent", "observable_gauge", "%", "psi",
+               ("resource", "scope", "stat"),
+               "Share of time tasks stalled on cpu/memory/io (PSI): sampled min/max/p95 and kernel avg10/avg60/avg300"),
+    Instrument("proxmox_cpu_usage_sampled_percent", "proxmox_cpu_usage_sampled_percent", "observable_gauge", "%",
+               "hf_sampler", ("stat",),
+               "Node CPU usage sampled every second: min/max/avg/p95 over the export interval"),
+    Instrument("proxmox_disk_io_sampled_bytes_per_second", "proxmox_disk_io_sampled_bytes_per_second",
+               "observable_gauge", "bytes/s", "hf_sampler", ("device", "direction", "stat"),
+               "Disk throughput sampled every second: min/max/avg/p95 over the export interval"),
+
+    # LVM from cached `lvs`/`vgs` reports
+    Instrument("lvm_thin_pool_data_percent", "lvm_thin_pool_data_percent", "observable_gauge", "%", "lvm",
+               ("vg", "pool"),
+               "Data space used in an LVM thin pool"),
+    Instrument("lvm_thin_pool_metadata_percent", "lvm_thin_pool_metadata_percent", "observable_gauge", "%", "lvm",
+               ("vg", "pool"),
+               "Metadata space used in an LVM thin pool - the pool goes read-only when full"),
+    Instrument("lvm_thin_pool_size_bytes", "lvm_thin_pool_size_bytes", "observable_gauge", "bytes", "lvm",
+               ("vg", "pool"),
+               "Size of an LVM thin pool"),
+    Instrument("lvm_thin_volume_used_bytes", "lvm_thin_volume_used_bytes", "observable_gauge", "bytes", "lvm",
+               ("vg", "lv", "pool", "vmid"),
+               "Space allocated in its thin pool by a thin volume (vmid for guest disks)"),
+    Instrument("lvm_thin_volume_size_bytes", "lvm_thin_volume_size_bytes", "observable_gauge", "bytes", "lvm",
+               ("vg", "lv", "pool", "vmid"),
+               "Virtual size of a thin volume"),
+    Instrument("lvm_vg_size_bytes", "lvm_vg_size_bytes", "observable_gauge", "bytes", "lvm", ("vg",),
+               "Size of an LVM volume group"),
+    Instrument("lvm_vg_free_bytes", "lvm_vg_free_bytes", "observable_gauge", "bytes", "lvm", ("vg",),
+               "Unallocated space in an LVM volume group"),
+
+    # Streaming `zpool iostat`
+    Instrument("zfs_pool_wait_latency_seconds", "zfs_pool_wait_latency_seconds", "observable_gauge", "s",
+               "zpool_iostat", ("pool", "wait", "direction"),
+               "Average ZFS pool I/O wait over the last zpool iostat interval "
+               "(total, disk, syncq, asyncq, scrub, trim, rebuild)"),
+    Instrument("zfs_pool_queue_depth", "zfs_pool_queue_depth", "observable_gauge", "operations", "zpool_iostat",
+               ("pool", "queue", "direction", "state"),
+               "ZFS pool I/O queue depth (pending and active) at the last zpool iostat report"),
+
+    # Per-guest block I/O from the cgroup collector
+    Instrument("proxmox_guest_io_bytes_total", "proxmox_guest_io_bytes_total", "observable_counter", "bytes",
+               "guest_cgroup", _GUEST + ("direction",),
+               "Total bytes read/written by the guest from cgroup io.stat - use rate() in queries"),
+    Instrument("proxmox_guest_io_ops_total", "proxmox_guest_io_ops_total", "observable_counter", "operations",
+               "guest_cgroup", _GUEST + ("direction",),
+               "Total read/write operations by the guest from cgroup io.stat - use rate() in queries"),
+
+    # Alert engine, see lib/alerts.py
+    Instrument("proxmox_alert_active", "proxmox_alert_active", "observable_gauge", "state", None,
+               ("alertname", "severity", "source", "name", "socket", "pool", "device"),
+               "Alerts by series: 1 while firing, 0 while pending (condition met, for-duration not yet passed)"),
+
+    # Export pipeline, see lib/exporters.py and lib/tail_sampling.py
+    Instrument("proxmox_agent_export_latency_seconds", "proxmox_agent_export_latency_seconds", "observable_gauge",
+               "s", None, ("signal", "destination"),
+               "Duration of the last export request to a destination, including retries"),
+    Instrument("proxmox_agent_export_items_total", "proxmox_agent_export_items_total", "observable_counter",
+               "items", None, ("signal", "destination", "result"),
+               "Data points, log records or spans per destination: exported, failed (export error) "
+               "or dropped (queue full)"),
+    Instrument("proxmox_agent_traces_total", "proxmox_agent_traces_total", "observable_counter", "traces", None,
+               ("decision",),
+               "Cycle traces seen by tail sampling: kept as slow, error or baseline, or dropped"),
+)
+
+INSTRUMENTS_BY_KEY = {instrument.key: instrument for instrument in INSTRUMENTS}
+
+
+def series_name(instrument):
+    """Name of the instrument's series in Prometheus (counters get a _total suffix)."""
+    if instrument.kind.endswith("counter") and not instrument.name.endswith("_total"):
+        return f"{instrument.name}_total"
+    return instrument.name
+
+
+def create_instrument(meter, key, callback=None):
+    """Create the registered instrument `key` on a meter; observables report through `callback`."""
+    instrument = INSTRUMENTS_BY_KEY[key]
+    create = getattr(meter, f"create_{instrument.kind}")
+    kwargs = {"name": instrument.name, "description": instrument.description, "unit": instrument.unit}
+    if instrument.kind.startswith("observable_"):
+        kwargs["callbacks"] = [callback]
+    return create(**kwargs)
+
+
+def create_sync_instruments(meter):
+    """Create every synchronous gauge and counter.
+
+    Returns:
+        dict: Instruments by registry key
+    """
+    return {
+        instrument.key: create_instrument(meter, instrument.key)
+        for instrument in INSTRUMENTS
+        if not instrument.kind.startswith("observable_")
+    }
@@ -8,16 +8,18 @@ import time
 from datetime import datetime
 from pygtail import Pygtail
 
-from lib.config import (
-   logger, LOG_FILES, JOURNAL_SERVICES, last_journal_timestamp
-)
+from lib.config import logger, get_config
 from lib.utils import run_command, create_log_record
 
+# Time to remember the last journal timestamp we processed (microseconds),
+# initialised on the first journal collection
+last_journal_timestamp = None
+
 def collect_and_send_logs(logger_otel):
     """Collect system logs from Proxmox and send them via OpenTelemetry."""
-    logger.info("Collecting system logs")
+    logger.debug("Collecting system logs")
     
-    for log_file in LOG_FILES:
+    for log_file in get_config().log_files:
         if not os.path.exists(log_file):
             continue
             
@@ -54,13 +56,17 @@ def collect_and_send_logs(logger_otel):
                     )
                     logger_otel.emit(log_record)
         except Exception as e:
-            logger.error(f"Error processing log file {log_file}: {e}")
+            logger.error("Error processing log file %s: %s", log_file, e)
 
 def collect_and_send_journal_logs(logger_otel):
     """Collect systemd journal logs for specified services and send them via OpenTelemetry."""
     global last_journal_timestamp
     
-    logger.info("Collecting journal logs")
+    logger.debug("Collecting journal logs")
+    
+    if last_journal_timestamp is None:
+        last_journal_timestamp = datetime.now().timestamp() * 1000000
+    journal_services = get_config().journal_services
     
     # Build a journalctl command that gets logs since our last check
     # Convert microseconds to seconds and format as ISO timestamp
@@ -68,8 +74,8 @@ def collect_and_send_journal_logs(logger_otel):
     
     # Create a filter for the services we want to monitor
     services_filter = ""
-    if JOURNAL_SERVICES:
-        services_filter = " ".join([f"-u {service}" for service in JOURNAL_SERVICES])
+    if journal_services:
+        services_filter = " ".join([f"-u {service}" for service in journal_services])
     
     # Run journalctl with output format that matches syslog
     # We use the short-precise format which includes timestamp, hostname, service name, and pid
@@ -105,7 +111,7 @@ def collect_and_send_journal_logs(logger_otel):
                     logger_otel.emit(log_record)
                 
             except Exception as e:
-                logger.error(f"Error processing journal entry: {e}")
+                logger.error("Error processing journal entry: %s", e)
     
     # Update the timestamp so we don't get stuck
     last_journal_timestamp = int(datetime.now().timestamp() * 1000000)
\ No newline at end of file
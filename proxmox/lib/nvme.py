@@ -0,0 +1,137 @@
+#!/usr/bin/env python3
+"""
+NVMe health log reader for Proxmox OpenTelemetry Monitoring
+
+Reads the SMART / Health Information log page (log identifier 0x02) of an
+NVMe device with one Get Log Page admin command through the kernel's
+NVME_IOCTL_ADMIN_CMD passthrough, instead of running `smartctl -a -j` and
+parsing its JSON. The 512-byte page is decoded in place with struct; the
+field names match smartctl's nvme_smart_health_information_log so both
+sources are handled the same by the SMART collector.
+
+The ioctl needs CAP_SYS_ADMIN. Devices where it fails are remembered and
+read with smartctl from then on.
+"""
+import ctypes
+import errno
+import fcntl
+import os
+import struct
+from lib.config import logger
+
+# _IOWR('N', 0x41, struct nvme_passthru_cmd) from linux/nvme_ioctl.h
+NVME_IOCTL_ADMIN_CMD = 0xC0484E41
+NVME_ADMIN_GET_LOG_PAGE = 0x02
+NVME_LOG_SMART = 0x02
+NVME_NSID_ALL = 0xFFFFFFFF
+SMART_LOG_SIZE = 512
+
+# struct nvme_passthru_cmd: opcode, flags, rsvd1, nsid, cdw2, cdw3, metadata,
+# addr, metadata_len, data_len, cdw10-cdw15, timeout_ms, result
+_PASSTHRU_CMD = struct.Struct("<BBHIIIQQIIIIIIIIII")
+
+# SMART / Health Information log, NVMe Base Specification 5.16.1.3: critical
+# warning, composite temperature (K), available spare, spare threshold,
+# percentage used, endurance group summary, reserved, ten 128-bit counters
+# (as low/high 64-bit halves), warning and critical temperature time (min),
+# temperature sensors 1-8 (K)
+_SMART_LOG = struct.Struct("<BHBBBB25x20QII8H")
+
+_COUNTERS = (
+    "data_units_read", "data_units_written", "host_reads", "host_writes", "controller_busy_time",
+    "power_cycles", "power_on_hours", "unsafe_shutdowns", "media_errors", "num_err_log_entries",
+)
+
+# Devices the passthrough failed on (not NVMe, no permission, old kernel)
+_ioctl_unavailable = set()
+
+
+def _kelvin_to_celsius(kelvin):
+    # 0 means the sensor is not implemented
+    return kelvin - 273 if kelvin else None
+
+
+def decode_smart_log(page):
+    """Decode a SMART / Health Information log page.
+
+    Args:
+        page: the 512-byte log page (bytes, bytearray or memoryview); it is
+              read in place, not copied
+
+    Returns:
+        dict: Fields named like smartctl's nvme_smart_health_information_log,
+              temperatures in Celsius
+    """
+    fields = _SMART_LOG.unpack_from(page)
+    critical_warning, temperature, available_spare, spare_threshold, percentage_used = fields[:5]
+    counters = fields[6:26]
+    warning_temp_time, critical_comp_time = fields[26:28]
+    log = {
+        "critical_warning": critical_warning,
+        "temperature": _kelvin_to_celsius(temperature),
+        "available_spare": available_spare,
+        "available_spare_threshold": spare_threshold,
+        "percentage_used": percentage_used,
+    }
+    for index, name in enumerate(_COUNTERS):
+        log[name] = counters[2 * index] | counters[2 * index + 1] << 64
+    log["warning_temp_time"] = warning_temp_time
+    log["critical_comp_time"] = critical_comp_time
+    log["temperature_sensors"] = [
+        _kelvin_to_celsius(kelvin) for kelvin in fields[28:] if kelvin
+    ]
+    return log
+
+
+def read_smart_log_page(device):
+    """Issue Get Log Page (SMART / Health) on an NVMe device.
+
+    Returns:
+        bytearray: The raw 512-byte log page, or None if the command failed
+    """
+    page = bytearray(SMART_LOG_SIZE)
+    # The kernel DMAs the page straight into our buffer
+    page_address = ctypes.addressof(ctypes.c_char.from_buffer(page))
+    # Number of dwords to transfer minus one in bits 31:16, log identifier in 7:0
+    cdw10 = (SMART_LOG_SIZE // 4 - 1) << 16 | NVME_LOG_SMART
+    command = bytearray(_PASSTHRU_CMD.pack(
+        NVME_ADMIN_GET_LOG_PAGE, 0, 0, NVME_NSID_ALL, 0, 0, 0, page_address,
+        0, SMART_LOG_SIZE, cdw10, 0, 0, 0, 0, 0, 0, 0))
+    fd = os.open(device, os.O_RDONLY)
+    try:
+        status = fcntl.ioctl(fd, NVME_IOCTL_ADMIN_CMD, command)
+    finally:
+        os.close(fd)
+    if status != 0:
+        logger.error("NVMe Get Log Page on %s failed with status 0x%x", device, status)
+        return None
+    return page
+
+
+def _read_sysfs_attribute(disk, name):
+    try:
+        with open(f"/sys/block/{disk}/device/{name}") as f:
+            return f.read().strip() or "Unknown"
+    except OSError:
+        return "Unknown"
+
+
+def read_nvme_health(disk):
+    """Read model, serial and the decoded health log of an NVMe namespace through the ioctl.
+
+    Returns:
+        tuple: (model, serial, health log dict), or None to fall back to smartctl
+    """
+    if disk in _ioctl_unavailable:
+        return None
+    try:
+        page = read_smart_log_page(f"/dev/{disk}")
+    except OSError as e:
+        # ENOTTY/EINVAL: no passthrough on this device; EPERM/EACCES: not root
+        level = logger.info if e.errno in (errno.ENOTTY, errno.EINVAL, errno.EPERM, errno.EACCES) else logger.error
+        level("NVMe admin passthrough unavailable for /dev/%s, using smartctl: %s", disk, e)
+        _ioctl_unavailable.add(disk)
+        return None
+    if page is None:
+        return None
+    return _read_sysfs_attribute(disk, "model"), _read_sysfs_attribute(disk, "serial"), decode_smart_log(page)
@@ -0,0 +1,203 @@
+#!/usr/bin/env python3
+"""
+Central API poller for Proxmox OpenTelemetry Monitoring
+
+`main.py poll` monitors many nodes from one process over the Proxmox HTTP API,
+for sites where the agent is not installed on every host. The node status,
+storage and guest metrics are set by the same functions the local collectors
+use, so they have the same names and attributes plus a `node` attribute for
+the node they came from. All nodes share one MeterProvider, and so one set of
+metric readers: an exporter thread and connection per destination, however
+many nodes are polled.
+
+All nodes are polled from one asyncio event loop. Every node has its own
+PveApiClient with a small keep-alive connection pool, a semaphore bounds how
+many nodes are polled at once (POLLER_CONCURRENCY), and a node whose poll
+fails is retried after an exponentially growing, jittered delay (capped at
+POLLER_MAX_BACKOFF) while the other nodes keep their schedule.
+"""
+import asyncio
+import random
+import time
+from urllib.parse import quote
+from lib.config import logger, get_resource
+from lib.instruments import create_sync_instruments
+from lib.pve_api import PveApiClient, PveApiError, create_ssl_context
+
+DEFAULT_API_PORT = 8006
+
+
+def parse_target(target):
+    """Split host[:port] into (host, port)."""
+    host, _, port = target.rpartition(":")
+    if host and port.isdigit():
+        return host.strip("[]"), int(port)
+    return target, DEFAULT_API_PORT
+
+
+class _NodeInstrument:
+    """A shared instrument whose data points get the polled node's `node` attribute."""
+
+    def __init__(self, instrument, node):
+        self._instrument = instrument
+        self._node = node
+
+    def set(self, value, attributes=None):
+        self._instrument.set(value, dict(attributes or {}, node=self._node))
+
+    def add(self, value, attributes=None):
+        self._instrument.add(value, dict(attributes or {}, node=self._node))
+
+
+class NodePoller:
+    """Client, instruments and retry state of one polled node."""
+
+    def __init__(self, target, config, ssl_context, node_metrics):
+        self.target = target
+        self.config = config
+        host, port = parse_target(target)
+        self.client = PveApiClient(host, port, config.pve_api_token, ssl_context,
+                                   config.poller_connections_per_host, config.poller_timeout_seconds)
+        # PVE node name, read from /cluster/status on the first successful poll
+        self.node = None
+        # Instruments shared by all nodes; wrapped per node once its name is known
+        self._node_metrics = node_metrics
+        self.metrics = None
+        self.failures = 0
+        self.next_attempt = 0.0
+
+    async def _discover_node(self):
+        for entry in await self.client.get("/cluster/status"):
+            if entry.get("type") == "node" and entry.get("local"):
+                return entry["name"]
+        raise PveApiError(f"{self.target} did not report its node name in /cluster/status")
+
+    async def poll(self):
+        """Read the node's status, storages and guests and set its metrics."""
+        from lib.collectors.system_collector import record_node_status
+        from lib.collectors.storage_collector import record_storage_metrics
+        from lib.collectors.vm_collector import record_vm_metrics
+
+        if self.node is None:
+            self.node = await self._discover_node()
+            self.metrics = {key: _NodeInstrument(instrument, self.node)
+                            for key, instrument in self._node_metrics.items()}
+            logger.info("Polling node %s at %s", self.node, self.target)
+        config, metrics = self.config, self.metrics
+        node = quote(self.node)
+
+        requests = {}
+        if config.collector_enabled("system"):
+            requests["status"] = self.client.get(f"/nodes/{node}/status")
+        if config.collector_enabled("storage"):
+            requests["storage"] = self.client.get(f"/nodes/{node}/storage")
+        if config.collector_enabled("vm"):
+            requests["qemu"] = self.client.get(f"/nodes/{node}/qemu")
+            requests["lxc"] = self.client.get(f"/nodes/{node}/lxc")
+        results = dict(zip(requests, await asyncio.gather(*requests.values())))
+
+        items = 0
+        if "status" in results:
+            items += len(record_node_status(results["status"], metrics['cpu_usage'], metrics['memory_usage'],
+                                            metrics['memory_total'], metrics['memory_used'], metrics['node_uptime'],
+                                            node_name=self.node, proc_stat_fallback=False))
+        # /nodes/{node}/storage entries carry the configuration and the status in one
+        for storage in results.get("storage", ()):
+            if storage.get("storage"):
+                items += len(record_storage_metrics(storage, storage, metrics['storage_status'],
+                                                    metrics['storage_usage'], metrics['storage_used'],
+                                                    metrics['storage_total']))
+        if "qemu" in results:
+            guests = [dict(guest, type="qemu") for guest in results["qemu"]]
+            guests += [dict(guest, type="lxc") for guest in results["lxc"]]
+            items += len(record_vm_metrics(guests, metrics['vm_status'], metrics['vm_cpu_usage'],
+                                           metrics['vm_memory_usage']))
+        return items
+
+    def record_failure(self, error):
+        """Schedule the next attempt after interval * 2^failures (jittered, capped)."""
+        self.failures += 1
+        delay = min(self.config.collection_interval_seconds * 2 ** self.failures,
+                    self.config.poller_max_backoff_seconds)
+        # Jitter keeps nodes behind the same failed link from retrying in lockstep
+        delay *= random.uniform(0.8, 1.2)
+        self.next_attempt = time.monotonic() + delay
+        logger.warning("Polling %s failed (%d in a row), retrying in %.0fs: %s",
+                       self.target, self.failures, delay, error)
+
+    def record_success(self):
+        if self.failures:
+            logger.info("Polling %s succeeded again after %d failures", self.target, self.failures)
+        self.failures = 0
+        self.next_attempt = 0.0
+
+
+class Poller:
+    """Polls every node in POLLER_TARGETS once per collection interval."""
+
+    def __init__(self, config):
+        from opentelemetry.sdk.metrics import MeterProvider
+        from lib.exporters import create_metric_readers
+
+        self.config = config
+        # One provider for the poller's health series and every node's metrics, with the
+        # resource of the host the poller runs on
+        self.meter_provider = MeterProvider(
+            metric_readers=create_metric_readers(config.metrics_destinations,
+                                                 config.collection_interval_seconds * 1000),
+            resource=get_resource())
+        self.metrics = create_sync_instruments(self.meter_provider.get_meter("proxmox.poller"))
+        node_metrics = create_sync_instruments(self.meter_provider.get_meter("proxmox.metrics"))
+        ssl_context = create_ssl_context(config.poller_verify_tls, config.poller_ca_file)
+        self.nodes = [NodePoller(target, config, ssl_context, node_metrics) for target in config.poller_targets]
+        self._semaphore = None
+
+    async def run(self, once=False):
+        """Poll on a fixed schedule; with once=True, poll every node a single time."""
+        self._semaphore = asyncio.Semaphore(self.config.poller_concurrency)
+        interval = self.config.collection_interval_seconds
+        next_round = time.monotonic()
+        try:
+            while True:
+                await self.poll_round()
+                if once:
+                    return
+                next_round += interval
+                # After a round that overran, start again on the schedule instead of catching up
+                while next_round < time.monotonic():
+                    next_round += interval
+                await asyncio.sleep(next_round - time.monotonic())
+        finally:
+            for node in self.nodes:
+                await node.client.close()
+
+    async def poll_round(self):
+        """Poll the nodes that are not backing off, at most POLLER_CONCURRENCY at a time."""
+        now = time.monotonic()
+        due = [node for node in self.nodes if node.next_attempt <= now]
+        await asyncio.gather(*(self._poll_node(node) for node in due))
+
+    async def _poll_node(self, node):
+        async with self._semaphore:
+            labels = {"target": node.target}
+            started = time.perf_counter()
+            try:
+                items = await node.poll()
+            except PveApiError as e:
+                node.record_failure(e)
+                self.metrics['poller_up'].set(0, labels)
+                return
+            except Exception as e:
+                logger.error("Error polling %s: %s", node.target, e)
+                node.record_failure(e)
+                self.metrics['poller_up'].set(0, labels)
+                return
+            duration = time.perf_counter() - started
+            node.record_success()
+            self.metrics['poller_up'].set(1, labels)
+            self.metrics['poller_duration'].set(duration, labels)
+            logger.info("node=%s items=%d duration_ms=%.1f", node.node, items, duration * 1000)
+
+    def shutdown(self):
+        """Export what is pending and stop the exporters."""
+        self.meter_provider.shutdown()
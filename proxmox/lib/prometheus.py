@@ -0,0 +1,231 @@
+#!/usr/bin/env python3
+"""
+Prometheus pull endpoint for Proxmox OpenTelemetry Monitoring
+
+For sites that scrape instead of receiving OTLP, a second metric reader sits
+next to the periodic OTLP reader. Once per collection cycle it collects the
+meter provider and encodes the result in the Prometheus text format (0.0.4),
+keeping both the plain and the gzip-compressed bytes. The embedded HTTP server
+only hands out that snapshot, so any number of scrapes (e.g. from several
+Prometheus replicas) cost no collector runs and no encoding; gzip is used when
+the scrape request accepts it.
+
+No Prometheus client library is needed: the encoder covers the gauges, sums
+and histograms the OpenTelemetry SDK produces.
+"""
+import gzip
+import math
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from opentelemetry.sdk.metrics import (
+    Counter, Histogram, ObservableCounter, ObservableGauge, ObservableUpDownCounter, UpDownCounter
+)
+from opentelemetry.sdk.metrics.export import (
+    AggregationTemporality, Gauge, Histogram as HistogramData, MetricReader, Sum
+)
+
+from lib.config import logger
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+_INVALID_NAME_CHARS = re.compile(r'[^a-zA-Z0-9_:]')
+_INVALID_LABEL_CHARS = re.compile(r'[^a-zA-Z0-9_]')
+
+
+def _metric_name(name):
+    name = _INVALID_NAME_CHARS.sub('_', name)
+    return f"_{name}" if name[:1].isdigit() else name
+
+
+def _label_name(name):
+    name = _INVALID_LABEL_CHARS.sub('_', name)
+    return f"_{name}" if name[:1].isdigit() else name
+
+
+def _escape(value, quote=True):
+    value = str(value).replace('\\', '\\\\').replace('\n', '\\n')
+    return value.replace('"', '\\"') if quote else value
+
+
+def _format_value(value):
+    if isinstance(value, float):
+        if math.isnan(value):
+            return "NaN"
+        if math.isinf(value):
+            return "+Inf" if value > 0 else "-Inf"
+        return repr(value)
+    return str(value)
+
+
+def _format_labels(attributes, extra=()):
+    pairs = [f'{_label_name(key)}="{_escape(value)}"' for key, value in attributes.items()]
+    pairs.extend(f'{key}="{value}"' for key, value in extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def encode_metrics(metrics_data):
+    """Encode SDK MetricsData in the Prometheus text exposition format.
+
+    Monotonic sums become counters with a _total suffix, non-monotonic sums
+    and gauges become gauges, histograms get _bucket/_sum/_count series. The
+    resource attributes are exposed as a target_info series. Metrics with the
+    same name from several scopes are merged under one TYPE line.
+
+    Returns:
+        str: The exposition text
+    """
+    # name -> (type, help, [sample lines])
+    families = {}
+    resource_lines = []
+
+    for resource_metrics in metrics_data.resource_metrics:
+        attributes = dict(resource_metrics.resource.attributes)
+        if attributes:
+            resource_lines.append(f"target_info{_format_labels(attributes)} 1")
+
+        for scope_metrics in resource_metrics.scope_metrics:
+            for metric in scope_metrics.metrics:
+                data = metric.data
+                name = _metric_name(metric.name)
+                if isinstance(data, Sum) and data.is_monotonic:
+                    if not name.endswith("_total"):
+                        name += "_total"
+                    metric_type = "counter"
+                elif isinstance(data, (Sum, Gauge)):
+                    metric_type = "gauge"
+                elif isinstance(data, HistogramData):
+                    metric_type = "histogram"
+                else:
+                    continue
+
+                family = families.setdefault(name, (metric_type, metric.description, []))
+                lines = family[2]
+                if metric_type == "histogram":
+                    for point in data.data_points:
+                        cumulative = 0
+                        for bound, count in zip(list(point.explicit_bounds) + [math.inf], point.bucket_counts):
+                            cumulative += count
+                            le = _format_value(float(bound))
+                            lines.append(f"{name}_bucket{_format_labels(point.attributes, [('le', le)])} {cumulative}")
+                        labels = _format_labels(point.attributes)
+                        lines.append(f"{name}_sum{labels} {_format_value(point.sum)}")
+                        lines.append(f"{name}_count{labels} {point.count}")
+                else:
+                    for point in data.data_points:
+                        lines.append(f"{name}{_format_labels(point.attributes)} {_format_value(point.value)}")
+
+    output = []
+    if resource_lines:
+        output.append("# HELP target_info Target metadata")
+        output.append("# TYPE target_info gauge")
+        output.extend(resource_lines)
+    for name, (metric_type, description, lines) in families.items():
+        if description:
+            output.append(f"# HELP {name} {_escape(description, quote=False)}")
+        output.append(f"# TYPE {name} {metric_type}")
+        output.extend(lines)
+    return "\n".join(output) + "\n"
+
+
+class PrometheusSnapshotReader(MetricReader):
+    """Metric reader that keeps the last collection as encoded Prometheus text.
+
+    refresh() is called once per collection cycle; scrapes read snapshot().
+    """
+
+    def __init__(self):
+        # Prometheus expects cumulative counters
+        super().__init__(preferred_temporality={
+            instrument: AggregationTemporality.CUMULATIVE
+            for instrument in (Counter, UpDownCounter, Histogram, ObservableCounter,
+                               ObservableUpDownCounter, ObservableGauge)
+        })
+        self._lock = threading.Lock()
+        # (plain bytes, gzip bytes, monotonic time of the refresh)
+        self._snapshot = None
+
+    def refresh(self):
+        """Collect the meter provider and replace the cached snapshot."""
+        self.collect()
+
+    def _receive_metrics(self, metrics_data, timeout_millis=10_000, **kwargs):
+        if metrics_data is None:
+            return
+        body = encode_metrics(metrics_data).encode()
+        # Level 6 is the usual HTTP trade-off; the work is done once per cycle, not per scrape
+        snapshot = (body, gzip.compress(body, compresslevel=6), time.monotonic())
+        with self._lock:
+            self._snapshot = snapshot
+
+    def snapshot(self):
+        """Return (plain bytes, gzip bytes, monotonic refresh time), or None before the first refresh."""
+        with self._lock:
+            return self._snapshot
+
+    def shutdown(self, timeout_millis=30_000, **kwargs):
+        pass
+
+    def force_flush(self, timeout_millis=10_000):
+        return True
+
+
+def accepts_gzip(accept_encoding):
+    """Return True if an Accept-Encoding header allows gzip (a q=0 entry refuses it)."""
+    for entry in (accept_encoding or "").split(','):
+        coding, _, params = entry.strip().partition(';')
+        if coding.strip().lower() not in ("gzip", "*"):
+            continue
+        quality = params.strip()
+        if quality.startswith("q="):
+            try:
+                return float(quality[2:]) > 0
+            except ValueError:
+                return False
+        return True
+    return False
+
+
+class MetricsServer(threading.Thread):
+    """HTTP server on its own daemon thread serving the reader's snapshot at /metrics."""
+
+    def __init__(self, reader, address, port):
+        super().__init__(name="prometheus-http", daemon=True)
+        self.reader = reader
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split('?', 1)[0] != "/metrics":
+                    self.send_error(404)
+                    return
+                snapshot = reader.snapshot()
+                if snapshot is None:
+                    self.send_error(503, "No collection yet")
+                    return
+                plain, compressed, _ = snapshot
+                use_gzip = accepts_gzip(self.headers.get("Accept-Encoding"))
+                body = compressed if use_gzip else plain
+                self.send_response(200)
+                self.send_header("Content-Type", CONTENT_TYPE)
+                self.send_header("Content-Length", str(len(body)))
+                self.send_header("Vary", "Accept-Encoding")
+                if use_gzip:
+                    self.send_header("Content-Encoding", "gzip")
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                logger.debug("Prometheus scrape from %s: " + format, self.address_string(), *args)
+
+        self.httpd = ThreadingHTTPServer((address, port), Handler)
+        self.httpd.daemon_threads = True
+
+    def run(self):
+        logger.info("Serving Prometheus metrics on %s:%s/metrics", *self.httpd.server_address[:2])
+        self.httpd.serve_forever()
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
@@ -0,0 +1,130 @@
+#!/usr/bin/env python3
+"""
+Asynchronous Proxmox API client for Proxmox OpenTelemetry Monitoring
+
+Used by the central poller (main.py poll) to read nodes over HTTPS instead of
+running pvesh on them. Each client talks to one node and keeps a small pool
+of HTTP/1.1 keep-alive connections, so a poll round costs no TLS handshakes
+once the pool is warm. It is built on asyncio streams alone; the responses
+are small JSON documents and need nothing more than Content-Length and
+chunked transfer decoding.
+"""
+import asyncio
+import json
+import ssl
+from urllib.parse import quote
+
+
+class PveApiError(Exception):
+    """A request failed: connection error, timeout or non-200 response."""
+
+
+def create_ssl_context(verify=True, ca_file=None):
+    """TLS settings for the API; pveproxy uses a self-signed certificate unless one was installed."""
+    context = ssl.create_default_context(cafile=ca_file or None)
+    if not verify:
+        context.check_hostname = False
+        context.verify_mode = ssl.CERT_NONE
+    return context
+
+
+class PveApiClient:
+    """Pooled keep-alive connections to the API of one node."""
+
+    def __init__(self, host, port=8006, token=None, ssl_context=None, max_connections=2, timeout=10.0):
+        self.host = host
+        self.port = port
+        self.ssl_context = ssl_context
+        self.timeout = timeout
+        self._headers = f"Host: {host}:{port}\r\nAccept: application/json\r\nConnection: keep-alive\r\n"
+        if token:
+            self._headers += f"Authorization: PVEAPIToken={token}\r\n"
+        self._slots = asyncio.Semaphore(max_connections)
+        # Idle (reader, writer) pairs ready for the next request
+        self._idle = []
+
+    async def get(self, path, **params):
+        """GET /api2/json<path> and return its 'data' member."""
+        target = "/api2/json" + path
+        if params:
+            target += "?" + "&".join(f"{key}={quote(str(value))}" for key, value in params.items())
+        async with self._slots:
+            try:
+                status, body = await asyncio.wait_for(self._request(target), self.timeout)
+            except asyncio.TimeoutError:
+                raise PveApiError(f"GET {path}: no response from {self.host} within {self.timeout:g}s") from None
+            except (OSError, asyncio.IncompleteReadError, ValueError) as e:
+                raise PveApiError(f"GET {path}: {self.host}: {e}") from None
+        if status != 200:
+            raise PveApiError(f"GET {path}: HTTP {status} from {self.host}")
+        try:
+            return json.loads(body)["data"]
+        except (ValueError, KeyError) as e:
+            raise PveApiError(f"GET {path}: invalid response from {self.host}: {e}") from None
+
+    async def _request(self, target):
+        request = f"GET {target} HTTP/1.1\r\n{self._headers}\r\n".encode()
+        if self._idle:
+            connection = self._idle.pop()
+            try:
+                return await self._exchange(connection, request)
+            except (OSError, asyncio.IncompleteReadError):
+                # The node closed the idle connection; retry once on a new one
+                pass
+        connection = await asyncio.open_connection(self.host, self.port, ssl=self.ssl_context)
+        return await self._exchange(connection, request)
+
+    async def _exchange(self, connection, request):
+        reader, writer = connection
+        try:
+            writer.write(request)
+            await writer.drain()
+            status, headers = await self._read_head(reader)
+            if headers.get("transfer-encoding", "").lower() == "chunked":
+                body = await self._read_chunked(reader)
+            elif "content-length" in headers:
+                body = await reader.readexactly(int(headers["content-length"]))
+            else:
+                body = await reader.read()
+                headers["connection"] = "close"
+        except BaseException:
+            writer.close()
+            raise
+        if headers.get("connection", "").lower() == "close":
+            writer.close()
+        else:
+            self._idle.append(connection)
+        return status, body
+
+    @staticmethod
+    async def _read_head(reader):
+        status_line = await reader.readuntil(b"\r\n")
+        parts = status_line.split(None, 2)
+        if len(parts) < 2 or not parts[0].startswith(b"HTTP/"):
+            raise ValueError(f"bad status line {status_line!r}")
+        headers = {}
+        while True:
+            line = await reader.readuntil(b"\r\n")
+            if line == b"\r\n":
+                break
+            name, _, value = line.decode("latin-1").partition(":")
+            headers[name.strip().lower()] = value.strip()
+        return int(parts[1]), headers
+
+    @staticmethod
+    async def _read_chunked(reader):
+        chunks = []
+        while True:
+            size = int((await reader.readuntil(b"\r\n")).split(b";")[0], 16)
+            if size == 0:
+                # Trailers end with an empty line
+                while await reader.readuntil(b"\r\n") != b"\r\n":
+                    pass
+                return b"".join(chunks)
+            chunks.append(await reader.readexactly(size))
+            await reader.readexactly(2)
+
+    async def close(self):
+        for _, writer in self._idle:
+            writer.close()
+        self._idle = []
@@ -0,0 +1,54 @@
+#!/usr/bin/env python3
+"""
+Fixed-size ring buffer for Proxmox OpenTelemetry Monitoring
+
+Used by the high-frequency samplers to keep the last N samples in a
+preallocated array, so memory use stays constant however long the agent runs.
+"""
+import math
+from array import array
+
+
+class RingBuffer:
+    """Fixed-capacity ring buffer of floats backed by a preallocated array."""
+
+    def __init__(self, capacity):
+        if capacity < 1:
+            raise ValueError("RingBuffer capacity must be at least 1")
+        self._data = array('d', bytes(8 * capacity))
+        self._capacity = capacity
+        self._next = 0
+        self._count = 0
+
+    def __len__(self):
+        return self._count
+
+    def append(self, value):
+        """Add a sample, overwriting the oldest one when the buffer is full."""
+        self._data[self._next] = value
+        self._next = (self._next + 1) % self._capacity
+        if self._count < self._capacity:
+            self._count += 1
+
+    def values(self):
+        """Return the buffered samples, oldest first."""
+        if self._count < self._capacity:
+            return self._data[:self._count].tolist()
+        return self._data[self._next:].tolist() + self._data[:self._next].tolist()
+
+    def summary(self):
+        """Summarise the buffered samples.
+
+        Returns:
+            dict: min, max, avg and p95 (nearest rank) of the samples, or None if empty
+        """
+        if not self._count:
+            return None
+        ordered = sorted(self._data[:self._count])
+        p95_index = max(math.ceil(len(ordered) * 0.95) - 1, 0)
+        return {
+            'min': ordered[0],
+            'max': ordered[-1],
+            'avg': sum(ordered) / len(ordered),
+            'p95': ordered[p95_index],
+        }
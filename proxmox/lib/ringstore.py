@@ -0,0 +1,249 @@
+#!/usr/bin/env python3
+"""
+Local time-series ring store for Proxmox OpenTelemetry Monitoring
+
+Keeps a fixed window of history (by default 24 hours at 1-minute resolution)
+of every exported gauge and counter in one memory-mapped file on the node, so
+what happened can still be looked at when the central stack is unreachable.
+The file is allocated at full size when it is created and never grows:
+
+    header      4096 bytes   magic, version, geometry, series count
+    index       max_series x 256 bytes   series keys, name{label="value",...}
+                                         with backslash, quote and newline escaped
+    timestamps  slots x int64            start of the minute each slot holds
+    values      max_series x slots x float64, one contiguous column per series
+
+A sample for time t goes to slot (t // resolution) % slots. The first write
+into a slot for a new minute stamps it and clears that slot in every column
+to NaN, so stale values from the previous lap are never returned. Readers map
+the file read-only and read a series' column through a memoryview without
+copying it.
+"""
+import math
+import mmap
+import os
+import re
+import struct
+import time
+
+from opentelemetry.sdk.metrics.export import Gauge, MetricExporter, MetricExportResult, Sum
+
+from lib.config import logger
+
+MAGIC = b"PXRS"
+VERSION = 1
+HEADER_SIZE = 4096
+# magic, version, resolution seconds, slots, max series, series count
+_HEADER = struct.Struct("<4sIIIII")
+INDEX_ENTRY_SIZE = 256
+KEY_SIZE = INDEX_ENTRY_SIZE - 2
+# key length, then the key
+_INDEX_ENTRY = struct.Struct(f"<H{KEY_SIZE}s")
+
+# label="value" with backslash escapes inside the quotes
+_LABEL_RE = re.compile(r'([^=,{}]+)="((?:[^"\\]|\\.)*)"')
+_ESCAPE_RE = re.compile(r'\\(.)', re.DOTALL)
+
+
+def _escape(value):
+    value = str(value)
+    if '\\' in value or '"' in value or '\n' in value:
+        value = value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+    return value
+
+
+def _unescape(value):
+    return _ESCAPE_RE.sub(lambda match: '\n' if match.group(1) == 'n' else match.group(1), value)
+
+
+def series_key(name, attributes):
+    """Canonical series key: name{a="1",b="2"} with labels sorted by name."""
+    if not attributes:
+        return name
+    labels = ",".join(f'{key}="{_escape(attributes[key])}"' for key in sorted(attributes))
+    return f"{name}{{{labels}}}"
+
+
+def parse_series_key(key):
+    """Split a series key into (name, {label: value})."""
+    name, _, rest = key.partition('{')
+    labels = {label: _unescape(value) for label, value in _LABEL_RE.findall(rest)}
+    return name, labels
+
+
+class RingStore:
+    """Fixed-size memory-mapped ring of per-series values."""
+
+    def __init__(self, path, resolution=60, retention=86400, max_series=2048, readonly=False):
+        self.path = path
+        self.readonly = readonly
+        if readonly:
+            with open(path, "rb") as f:
+                self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            magic, version, self.resolution, self.slots, self.max_series, _ = _HEADER.unpack_from(self._mmap, 0)
+            if magic != MAGIC or version != VERSION:
+                self._mmap.close()
+                raise ValueError(f"{path} is not a ring store file")
+        else:
+            self.resolution = resolution
+            self.slots = max(retention // resolution, 1)
+            self.max_series = max_series
+            self._open_for_writing()
+
+        self._index_offset = HEADER_SIZE
+        self._timestamps_offset = self._index_offset + self.max_series * INDEX_ENTRY_SIZE
+        self._values_offset = self._timestamps_offset + self.slots * 8
+        view = memoryview(self._mmap)
+        self._timestamps = view[self._timestamps_offset:self._values_offset].cast('q')
+        self._values = view[self._values_offset:self._values_offset + self.max_series * self.slots * 8].cast('d')
+        view.release()
+
+        # key -> series number
+        self._series = {}
+        for number in range(self.series_count):
+            length, raw = _INDEX_ENTRY.unpack_from(self._mmap, self._index_offset + number * INDEX_ENTRY_SIZE)
+            self._series[raw[:length].decode()] = number
+        self._full_warned = False
+
+    @staticmethod
+    def file_size(slots, max_series):
+        return HEADER_SIZE + max_series * INDEX_ENTRY_SIZE + slots * 8 + max_series * slots * 8
+
+    def _open_for_writing(self):
+        size = self.file_size(self.slots, self.max_series)
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            header = os.pread(fd, _HEADER.size, 0)
+            expected = (MAGIC, VERSION, self.resolution, self.slots, self.max_series)
+            if len(header) < _HEADER.size or _HEADER.unpack(header)[:5] != expected or os.fstat(fd).st_size != size:
+                if os.fstat(fd).st_size:
+                    logger.warning("Ring store %s has a different layout, recreating it", self.path)
+                os.ftruncate(fd, 0)
+                # Allocate the whole file up front so disk usage never changes
+                os.posix_fallocate(fd, 0, size)
+                os.pwrite(fd, _HEADER.pack(MAGIC, VERSION, self.resolution, self.slots, self.max_series, 0), 0)
+                # Slot timestamp 0 marks every slot as empty
+            self._mmap = mmap.mmap(fd, size)
+        finally:
+            os.close(fd)
+
+    @property
+    def series_count(self):
+        return _HEADER.unpack_from(self._mmap, 0)[5]
+
+    def _add_series(self, key):
+        number = self.series_count
+        encoded = key.encode()
+        if number >= self.max_series or len(encoded) > KEY_SIZE:
+            if not self._full_warned:
+                logger.warning("Ring store %s: no room for series %s (max %d series, %d-byte keys)",
+                               self.path, key, self.max_series, KEY_SIZE)
+                self._full_warned = True
+            return None
+        _INDEX_ENTRY.pack_into(self._mmap, self._index_offset + number * INDEX_ENTRY_SIZE, len(encoded), encoded)
+        struct.pack_into("<I", self._mmap, _HEADER.size - 4, number + 1)
+        self._series[key] = number
+        return number
+
+    def _slot(self, timestamp):
+        start = int(timestamp) // self.resolution * self.resolution
+        slot = (start // self.resolution) % self.slots
+        if self._timestamps[slot] != start:
+            # First write of a new minute into this slot: drop what the previous lap left there
+            nan = math.nan
+            for number in range(self.max_series):
+                self._values[number * self.slots + slot] = nan
+            self._timestamps[slot] = start
+        return slot
+
+    def write(self, timestamp, samples):
+        """Store (key, value) samples for a time; a later write in the same slot overwrites."""
+        slot = self._slot(timestamp)
+        for key, value in samples:
+            number = self._series.get(key)
+            if number is None:
+                number = self._add_series(key)
+                if number is None:
+                    continue
+            self._values[number * self.slots + slot] = value
+
+    def series(self, name=None, labels=None):
+        """Return the keys of the stored series, optionally filtered by metric name and labels."""
+        keys = []
+        for key in self._series:
+            series_name, series_labels = parse_series_key(key)
+            if name is not None and series_name != name:
+                continue
+            if labels and any(series_labels.get(label) != value for label, value in labels.items()):
+                continue
+            keys.append(key)
+        return sorted(keys)
+
+    def read(self, key, since=0):
+        """Return [(timestamp, value)] of a series from `since` on, oldest first."""
+        number = self._series.get(key)
+        if number is None:
+            return []
+        # The series' column, read in place
+        column = self._values[number * self.slots:(number + 1) * self.slots]
+        points = []
+        for slot in range(self.slots):
+            timestamp = self._timestamps[slot]
+            if timestamp and timestamp >= since:
+                value = column[slot]
+                if not math.isnan(value):
+                    points.append((timestamp, value))
+        points.sort()
+        return points
+
+    def flush(self):
+        if not self.readonly:
+            self._mmap.flush()
+
+    def close(self):
+        self._timestamps.release()
+        self._values.release()
+        self._mmap.close()
+
+
+class RingStoreExporter(MetricExporter):
+    """Metric exporter writing every gauge and counter data point into a RingStore."""
+
+    def __init__(self, store):
+        super().__init__()
+        self.store = store
+
+    def export(self, metrics_data, timeout_millis=10_000, **kwargs):
+        samples = []
+        for resource_metrics in metrics_data.resource_metrics:
+            for scope_metrics in resource_metrics.scope_metrics:
+                for metric in scope_metrics.metrics:
+                    if not isinstance(metric.data, (Gauge, Sum)):
+                        continue
+                    for point in metric.data.data_points:
+                        samples.append((series_key(metric.name, point.attributes), float(point.value)))
+        try:
+            self.store.write(time.time(), samples)
+        except (OSError, ValueError) as e:
+            logger.error("Error writing ring store %s: %s", self.store.path, e)
+            return MetricExportResult.FAILURE
+        return MetricExportResult.SUCCESS
+
+    def force_flush(self, timeout_millis=10_000):
+        self.store.flush()
+        return True
+
+    def shutdown(self, timeout_millis=30_000, **kwargs):
+        self.store.flush()
+
+
+def parse_duration(text):
+    """Parse 90s, 30m, 2h or 1d (a bare number is seconds) into seconds."""
+    units = {"s": 1, "m": 60, "h": 3600, "d": 86400}
+    text = text.strip().lower()
+    if text and text[-1] in units:
+        return float(text[:-1]) * units[text[-1]]
+    return float(text)
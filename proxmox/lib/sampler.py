@@ -0,0 +1,136 @@
+#!/usr/bin/env python3
+"""
+High-frequency sampling for Proxmox OpenTelemetry Monitoring
+
+Short CPU and disk I/O spikes (2-5 seconds) disappear between 30-second
+collections. The samplers here read cheap kernel sources on their own thread
+(by default once per second) into preallocated ring buffers that hold one
+export interval of samples; at export time only min/max/avg/p95 summaries are
+sent, so the backend sees the spikes without a higher scrape rate.
+"""
+import threading
+import time
+from abc import ABC, abstractmethod
+from lib.config import logger, get_config
+from lib.ringbuffer import RingBuffer
+from lib.collectors.system_collector import read_cpu_times_proc_stat, cpu_usage_between, collect_disk_io_data_raw
+
+
+class PeriodicSampler(threading.Thread, ABC):
+    """Daemon thread that calls sample() at a fixed rate until stopped.
+
+    Subclasses implement sample() and may override setup()/teardown() to
+    acquire and release resources on the sampler thread.
+    """
+
+    def __init__(self, name, sample_interval, window_seconds):
+        super().__init__(name=name, daemon=True)
+        self.sample_interval = sample_interval
+        # Number of samples covering one export window
+        self.capacity = max(int(window_seconds / sample_interval), 1)
+        self._lock = threading.Lock()
+        self._stop_event = threading.Event()
+
+    def stop(self):
+        self._stop_event.set()
+
+    def setup(self):
+        pass
+
+    def teardown(self):
+        pass
+
+    @abstractmethod
+    def sample(self):
+        """Take one sample; called on the sampler thread every sample_interval seconds."""
+
+    def run(self):
+        logger.info("%s started (%ss interval, %s samples per window)", self.name, self.sample_interval, self.capacity)
+        self.setup()
+        next_sample = time.monotonic()
+        try:
+            while not self._stop_event.is_set():
+                try:
+                    self.sample()
+                except Exception as e:
+                    logger.error("Error in %s: %s", self.name, e)
+                next_sample += self.sample_interval
+                delay = next_sample - time.monotonic()
+                if delay < 0:
+                    # Fell behind (e.g. host suspended); resynchronise instead of bursting
+                    next_sample = time.monotonic()
+                    delay = 0
+                self._stop_event.wait(delay)
+        finally:
+            self.teardown()
+
+
+class HighFrequencySampler(PeriodicSampler):
+    """Samples node CPU usage (/proc/stat) and per-disk throughput (/proc/diskstats)."""
+
+    def __init__(self, sample_interval=None, window_seconds=None):
+        config = get_config()
+        super().__init__(
+            "hf-sampler",
+            sample_interval or config.hf_sample_interval_seconds,
+            window_seconds or config.collection_interval_seconds
+        )
+        self._cpu = RingBuffer(self.capacity)
+        # (idle, total) jiffies of the previous /proc/stat sample
+        self._prev_cpu = None
+        # device -> {'read': RingBuffer, 'write': RingBuffer} of bytes/second
+        self._disk = {}
+        # device -> (bytes_read, bytes_written, monotonic time) of the previous sample
+        self._prev_disk = {}
+
+    def setup(self):
+        # Prime the /proc/stat delta so the first stored sample is a real rate
+        self._prev_cpu = read_cpu_times_proc_stat()
+
+    def sample(self):
+        cpu_times = read_cpu_times_proc_stat()
+        now = time.monotonic()
+        disk_data = collect_disk_io_data_raw()
+
+        with self._lock:
+            if cpu_times is not None and self._prev_cpu is not None:
+                self._cpu.append(cpu_usage_between(self._prev_cpu, cpu_times))
+            if cpu_times is not None:
+                self._prev_cpu = cpu_times
+
+            for device, stats in disk_data.items():
+                prev = self._prev_disk.get(device)
+                self._prev_disk[device] = (stats['bytes_read'], stats['bytes_written'], now)
+                if prev is None or now <= prev[2]:
+                    continue
+                elapsed = now - prev[2]
+                buffers = self._disk.get(device)
+                if buffers is None:
+                    buffers = self._disk[device] = {
+                        'read': RingBuffer(self.capacity),
+                        'write': RingBuffer(self.capacity),
+                    }
+                buffers['read'].append(max(stats['bytes_read'] - prev[0], 0) / elapsed)
+                buffers['write'].append(max(stats['bytes_written'] - prev[1], 0) / elapsed)
+
+            # Drop devices that were removed so memory stays bounded
+            for device in list(self._prev_disk):
+                if device not in disk_data:
+                    del self._prev_disk[device]
+                    self._disk.pop(device, None)
+
+    def cpu_summary(self):
+        """Return min/max/avg/p95 CPU usage percent over the last window, or None."""
+        with self._lock:
+            return self._cpu.summary()
+
+    def disk_summaries(self):
+        """Return (device, direction, summary) tuples of bytes/second over the last window."""
+        results = []
+        with self._lock:
+            for device, buffers in self._disk.items():
+                for direction, buffer in buffers.items():
+                    summary = buffer.summary()
+                    if summary:
+                        results.append((device, direction, summary))
+        return results
@@ -0,0 +1,57 @@
+#!/usr/bin/env python3
+"""
+Collector sample types for Proxmox OpenTelemetry Monitoring
+
+Collectors return flat lists of Sample objects instead of nested dicts, and
+take their attribute sets from a LabelInterner so that the same series gets
+the same read-only mapping every cycle. Series labels are then built once
+per VM/disk/sensor instead of once per cycle, and the mappings handed to the
+OpenTelemetry instruments are shared rather than reallocated.
+"""
+from types import MappingProxyType
+
+
+class Sample:
+    """One observation: the metrics_dict key of its instrument, a value and interned labels."""
+
+    __slots__ = ("metric", "value", "labels")
+
+    def __init__(self, metric, value, labels):
+        self.metric = metric
+        self.value = value
+        self.labels = labels
+
+    def __repr__(self):
+        return f"Sample({self.metric!r}, {self.value!r}, {dict(self.labels)!r})"
+
+
+class LabelInterner:
+    """Cache of frozen attribute mappings keyed by the label values of a series.
+
+    With only keys, get(*values) returns {key: value} for the given values.
+    A build function receives the same values and returns the attribute dict,
+    so derived labels (legends, cleaned names, str() of thresholds) are also
+    computed once per series.
+    """
+
+    def __init__(self, *keys, build=None, max_entries=50000):
+        self.keys = keys
+        self.build = build
+        # Bounds memory when series churn (e.g. many short-lived guests)
+        self.max_entries = max_entries
+        self._cache = {}
+
+    def get(self, *values):
+        labels = self._cache.get(values)
+        if labels is None:
+            if len(self._cache) >= self.max_entries:
+                self._cache.clear()
+            attributes = self.build(*values) if self.build else dict(zip(self.keys, values))
+            labels = self._cache[values] = MappingProxyType(attributes)
+        return labels
+
+    def clear(self):
+        self._cache.clear()
+
+    def __len__(self):
+        return len(self._cache)
@@ -0,0 +1,92 @@
+#!/usr/bin/env python3
+"""
+Cycle scheduling for Proxmox OpenTelemetry Monitoring
+
+Cycles start at a fixed rate on the monotonic clock instead of sleeping for
+the interval after the work is done, so collection time does not add to the
+period. The first cycle runs immediately; the second is aligned to a
+wall-clock boundary of the interval (e.g. :00 and :30 for 30 seconds), which
+lines the nodes of a cluster up on the same timestamps. After that, clock
+steps (NTP, manual changes) do not move the schedule.
+
+When a cycle runs past the start of the next one, the overrun policy decides
+what happens:
+- skip:      drop the missed cycles and wait for the next boundary
+- immediate: start the next cycle right away, then continue on the boundaries
+- stretch:   start the next cycle right away and restart the schedule from now
+"""
+import math
+import time
+from lib.config import logger
+
+OVERRUN_POLICIES = ("skip", "immediate", "stretch")
+
+
+class CycleClock:
+    """Fixed-rate schedule that reports how late each cycle starts."""
+
+    def __init__(self, interval, policy="skip", align=True):
+        self.interval = interval
+        self.policy = policy if policy in OVERRUN_POLICIES else "skip"
+        self.align = align
+        # Seconds between the scheduled and the actual start of the last cycle
+        self.lag = 0.0
+        # Cycles dropped by the skip/immediate policies since start
+        self.skipped_total = 0
+        self._next = None
+
+    def reconfigure(self, interval, policy, align=True):
+        """Apply a new interval or policy; the next cycle runs immediately and the schedule realigns."""
+        if (interval, policy, align) != (self.interval, self.policy, self.align):
+            self.interval = interval
+            self.policy = policy if policy in OVERRUN_POLICIES else "skip"
+            self.align = align
+            self._next = None
+
+    def _aligned_deadline(self, now):
+        if not self.align:
+            return now + self.interval
+        # Next wall-clock multiple of the interval, at least half an interval away
+        offset = (-time.time()) % self.interval
+        if offset < self.interval / 2:
+            offset += self.interval
+        return now + offset
+
+    def wait(self):
+        """Sleep until the next cycle is due.
+
+        Returns:
+            int: Number of cycles skipped because the previous cycle overran
+        """
+        now = time.monotonic()
+        if self._next is None:
+            # First cycle (or first after reconfigure): run now, then align
+            self.lag = 0.0
+            self._next = self._aligned_deadline(now)
+            return 0
+
+        skipped = 0
+        if now > self._next:
+            # The previous cycle ran past this deadline
+            missed = math.floor((now - self._next) / self.interval) + 1
+            logger.warning("Collection cycle overran its %ss interval (policy: %s)", self.interval, self.policy)
+            if self.policy == "skip":
+                skipped = missed
+                self._next += missed * self.interval
+            elif self.policy == "immediate":
+                # Run the most recent overdue cycle now; older ones are dropped
+                skipped = missed - 1
+                self._next += (missed - 1) * self.interval
+
+        delay = self._next - time.monotonic()
+        if delay > 0:
+            time.sleep(delay)
+
+        started = time.monotonic()
+        self.lag = max(started - self._next, 0.0)
+        if self.policy == "stretch" and self.lag > 0:
+            # Restart the schedule from the late start
+            self._next = started
+        self._next += self.interval
+        self.skipped_total += skipped
+        return skipped
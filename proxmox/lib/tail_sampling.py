@@ -0,0 +1,107 @@
+#!/usr/bin/env python3
+"""
+Tail-based trace sampling for Proxmox OpenTelemetry Monitoring
+
+With ENABLE_TRACES every monitoring cycle produces a span tree, and almost all
+of them describe an ordinary cycle. TailSamplingSpanProcessor sits in front
+of the per-destination batch processors and holds the spans of each trace
+until its root span (monitoring_cycle) ends. The whole trace is then passed
+on if
+
+- the root span took at least TRACE_SLOW_CYCLE_SECONDS,
+- any span has an error status (an exception escaped it, or a command timed
+  out in run_command), or
+- it falls into the TRACE_BASELINE_PERCENT random sample of normal cycles,
+
+and dropped otherwise. Spans that end after their root was decided follow
+that decision. Buffers are bounded: past max_traces open traces the oldest is
+dropped unexported.
+"""
+import random
+import threading
+from collections import Counter, OrderedDict
+
+from opentelemetry.sdk.trace import SpanProcessor
+from opentelemetry.trace import StatusCode
+
+from lib.config import logger
+
+# Recently decided trace ids, for spans ending after their root
+_DECIDED_TRACES = 256
+
+
+class TailSamplingSpanProcessor(SpanProcessor):
+    """Buffer spans per trace and forward only slow, failed or baseline-sampled traces."""
+
+    def __init__(self, slow_seconds, baseline_percent, max_traces=64, max_spans_per_trace=1024):
+        self.slow_nanos = int(slow_seconds * 1e9)
+        self.baseline_percent = baseline_percent
+        self.max_traces = max_traces
+        self.max_spans_per_trace = max_spans_per_trace
+        self._processors = []
+        self._lock = threading.Lock()
+        # trace id -> ended spans, oldest trace first
+        self._traces = OrderedDict()
+        # trace id -> True (kept) or False (dropped)
+        self._decided = OrderedDict()
+        # reason (slow, error, baseline) or dropped -> traces
+        self.decisions = Counter()
+
+    def add_span_processor(self, processor):
+        """Add a processor that receives the spans of the kept traces (same call as on a TracerProvider)."""
+        self._processors.append(processor)
+
+    def on_start(self, span, parent_context=None):
+        for processor in self._processors:
+            processor.on_start(span, parent_context=parent_context)
+
+    def on_end(self, span):
+        trace_id = span.context.trace_id
+        is_root = span.parent is None or span.parent.is_remote
+        with self._lock:
+            decided = self._decided.get(trace_id)
+            if decided is not None:
+                spans = [span] if decided else []
+            else:
+                spans = self._traces.get(trace_id)
+                if spans is None:
+                    spans = self._traces[trace_id] = []
+                    if len(self._traces) > self.max_traces:
+                        self._traces.popitem(last=False)
+                        self.decisions["dropped"] += 1
+                        logger.warning("Tail sampling: more than %d open traces, dropped the oldest", self.max_traces)
+                if len(spans) < self.max_spans_per_trace:
+                    spans.append(span)
+                if not is_root:
+                    return
+                del self._traces[trace_id]
+                reason = self._reason(span, spans)
+                self.decisions[reason or "dropped"] += 1
+                self._decided[trace_id] = reason is not None
+                if len(self._decided) > _DECIDED_TRACES:
+                    self._decided.popitem(last=False)
+                if reason is None:
+                    return
+                logger.debug("Tail sampling: keeping trace %032x (%s, %d spans)", trace_id, reason, len(spans))
+        for processor in self._processors:
+            for ended in spans:
+                processor.on_end(ended)
+
+    def _reason(self, root, spans):
+        if root.end_time - root.start_time >= self.slow_nanos:
+            return "slow"
+        if any(ended.status.status_code is StatusCode.ERROR for ended in spans):
+            return "error"
+        if random.random() * 100 < self.baseline_percent:
+            return "baseline"
+        return None
+
+    def shutdown(self):
+        # Traces without an ended root are incomplete and not exported
+        with self._lock:
+            self._traces.clear()
+        for processor in self._processors:
+            processor.shutdown()
+
+    def force_flush(self, timeout_millis=30000):
+        return all(processor.force_flush(timeout_millis) for processor in self._processors)
@@ -2,13 +2,18 @@
 """
 Utility functions for Proxmox OpenTelemetry Monitoring
 """
+import re
 import subprocess
-from opentelemetry._logs import SeverityNumber  # Import SeverityNumber from the API
-from opentelemetry.sdk._logs import LogRecord
-from opentelemetry.trace import TraceFlags
-from opentelemetry.trace.span import INVALID_SPAN_ID, INVALID_TRACE_ID
+import threading
+from collections import deque
 
-from lib.config import logger, resource
+from lib.config import logger, get_resource
+
+# Proxmox guest volume names: vm-<vmid>-disk-N (zvols, LVs, images),
+# base-<vmid>-disk-N (templates), subvol-<vmid>-disk-N (LXC datasets),
+# vm-<vmid>-cloudinit and vm-<vmid>-state-<snapshot> (saved RAM); LVM-thin
+# snapshots are snap_vm-<vmid>-disk-N_<snapshot>
+_GUEST_VOLUME_RE = re.compile(r'(?:^|/|snap_)(?:vm|base|subvol)-(\d+)-(?:disk-\d+|cloudinit|state-)')
 
 def run_command(command, timeout=30, shell=True):
     """Run a shell command and return the output.
@@ -39,13 +44,99 @@ def run_command(command, timeout=30, shell=True):
         )
         return result.stdout.strip()
     except subprocess.TimeoutExpired as e:
-        logger.error(f"Command '{command}' timed out after {timeout} seconds")
+        logger.error("Command '%s' timed out after %s seconds", command, timeout)
+        # Marks the collector span, so tail sampling keeps this cycle's trace
+        from opentelemetry import trace
+        from opentelemetry.trace import Status, StatusCode
+        trace.get_current_span().set_status(Status(StatusCode.ERROR, f"'{command}' timed out after {timeout}s"))
         return None
     except subprocess.CalledProcessError as e:
-        logger.error(f"Command '{command}' failed with exit code {e.returncode}: {e}")
-        logger.error(f"Command stderr: {e.stderr}")
+        logger.error("Command '%s' failed with exit code %s: %s", command, e.returncode, e)
+        logger.error("Command stderr: %s", e.stderr)
         return None
 
+def drain_stream(stream, max_lines=20):
+    """Read a child's pipe to EOF in a background thread.
+
+    A pipe that is only read after the child exits blocks the child once the
+    pipe buffer is full; draining it while the child runs avoids that.
+
+    Returns:
+        tuple: (thread, deque of the last max_lines lines); join the thread
+               after the child exited to get the complete tail
+    """
+    lines = deque(maxlen=max_lines)
+
+    def drain():
+        try:
+            for line in stream:
+                lines.append(line.rstrip('\n'))
+        except (OSError, ValueError):
+            # Stream closed while the child was killed
+            pass
+
+    thread = threading.Thread(target=drain, name="stderr-drain", daemon=True)
+    thread.start()
+    return thread, lines
+
+
+def stream_command(args, timeout=60):
+    """Run a command without a shell and yield its output line by line.
+
+    Unlike run_command the output is never held in memory as a whole, so
+    commands that list hundreds of datasets or volumes can be parsed as
+    they produce output.
+
+    Args:
+        args (list): Command and arguments
+        timeout (int): Seconds after which the command is killed
+
+    Yields:
+        str: Output lines without the trailing newline
+    """
+    try:
+        process = subprocess.Popen(args, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
+    except OSError as e:
+        logger.error("Command '%s' could not be started: %s", ' '.join(args), e)
+        return
+
+    stderr_thread, stderr_lines = drain_stream(process.stderr)
+    timed_out = threading.Event()
+
+    def kill_on_timeout():
+        timed_out.set()
+        process.kill()
+
+    timer = threading.Timer(timeout, kill_on_timeout)
+    timer.start()
+    try:
+        for line in process.stdout:
+            yield line.rstrip('\n')
+    finally:
+        timer.cancel()
+        if process.poll() is None:
+            # Consumer stopped early; the rest of the output is not needed
+            process.kill()
+        process.stdout.close()
+        returncode = process.wait()
+        stderr_thread.join(1)
+        process.stderr.close()
+        if timed_out.is_set():
+            logger.error("Command '%s' timed out after %s seconds", ' '.join(args), timeout)
+        elif returncode > 0:
+            logger.error("Command '%s' failed with exit code %s: %s", ' '.join(args), returncode,
+                         '\n'.join(stderr_lines).strip())
+
+def vmid_from_volume_name(name):
+    """Return the VM/CT ID encoded in a Proxmox volume name, or None.
+
+    Matches vm-<vmid>-disk-N, base-<vmid>-disk-N, subvol-<vmid>-disk-N,
+    vm-<vmid>-cloudinit and vm-<vmid>-state-<snapshot>, optionally prefixed
+    by a pool/dataset or volume group path or by snap_ (LVM-thin snapshots).
+    """
+    match = _GUEST_VOLUME_RE.search(name)
+    return match.group(1) if match else None
+
 def create_log_record(timestamp, body, severity, attributes=None, observed_timestamp=None):
     """Create a properly configured LogRecord with valid trace and span IDs.
     
@@ -59,6 +150,14 @@ def create_log_record(timestamp, body, severity, attributes=None, observed_times
     Returns:
         LogRecord: Configured OpenTelemetry LogRecord object
     """
+    # Imported here so that collectors using run_command don't pay for the SDK import
+    from opentelemetry._logs import SeverityNumber  # Import SeverityNumber from the API
+    from opentelemetry.sdk._logs import LogRecord
+    from opentelemetry.trace import TraceFlags
+    from opentelemetry.trace.span import INVALID_SPAN_ID, INVALID_TRACE_ID
+    
+    resource = get_resource()
+    
     # Map text severity to SeverityNumber
     severity_map = {
         "ERROR": SeverityNumber.ERROR,
@@ -108,7 +207,7 @@ def create_log_record(timestamp, body, severity, attributes=None, observed_times
             resource=resource  # Use the resource from config
         )
     except Exception as e:
-        logger.error(f"Error creating LogRecord: {e}")
+        logger.error("Error creating LogRecord: %s", e)
         # Preserve original attributes in fallback, adding only required severity info
         fallback_attrs = dict(attributes or {})
         fallback_attrs["level"] = "INFO"
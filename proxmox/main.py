@@ -1,343 +1,892 @@
 #!/usr/bin/env python3
 """
 Main entry point for Proxmox OpenTelemetry Monitoring
+
+Exporters and collectors are imported only when they are enabled, so the
+agent starts quickly after package upgrades and can run a single collection
+cycle from cron with --once.
 """
+import argparse
 import sys
+import signal
 import time
 import threading
-import json
-import re
-
-# Add the virtual environment path
-sys.path.append('/opt/proxmox-otel/venv/lib/python3.11/site-packages')
-sys.path.append('/opt/proxmox-otel')
-
-from opentelemetry import metrics
-from opentelemetry import trace
-from opentelemetry.sdk.metrics import MeterProvider
-from opentelemetry.sdk.metrics.export import PeriodicExportingMetricReader
-from opentelemetry.exporter.otlp.proto.http.metric_exporter import OTLPMetricExporter
-from opentelemetry.sdk._logs import LoggerProvider
-from opentelemetry.sdk._logs.export import BatchLogRecordProcessor
-from opentelemetry.exporter.otlp.proto.http._log_exporter import OTLPLogExporter
-from opentelemetry._logs import set_logger_provider, get_logger
-from opentelemetry.sdk.trace import TracerProvider
-from opentelemetry.sdk.trace.export import BatchSpanProcessor
-from opentelemetry.exporter.otlp.proto.http.trace_exporter import OTLPSpanExporter
-from opentelemetry.trace.propagation.tracecontext import TraceContextTextMapPropagator
-from opentelemetry.metrics import Observation
-
-# Import our configuration and collectors
-from lib.config import (
-    logger, resource, OTEL_METRICS_ENDPOINT, OTEL_LOGS_ENDPOINT, OTEL_TRACES_ENDPOINT,
-    COLLECTION_INTERVAL_SECONDS, LOG_COLLECTION_INTERVAL_SECONDS, 
-    ENABLE_TRACES
-)
-from lib.utils import run_command
-
-# Import modular collectors
-from lib.collectors.system_collector import collect_system_metrics, collect_disk_io_data_raw
-from lib.collectors.vm_collector import collect_vm_metrics
-from lib.collectors.temperature_collector import collect_temperature_metrics
-from lib.collectors.storage_collector import collect_storage_metrics, collect_disk_smart_metrics
-from lib.collectors.zfs_collector import collect_zfs_pool_metrics
-
-from lib.log_collectors import (
-    collect_and_send_logs, collect_and_send_journal_logs
-)
+
+# Import our configuration - collectors and exporters are imported lazily
+from lib.config import logger, load_config, reload_config, get_config, setup_logging, get_resource
+from lib.cluster import ClusterElection
+from lib.scheduler import CycleClock
+from lib.instruments import INSTRUMENTS_BY_KEY, create_instrument, create_sync_instruments
+from lib.alerts import AlertEngine, build_alert_rules
 
 # Global dictionary to store created instruments for access in callbacks
 created_instruments = {}
 
-# Define global variables for ZFS collection tracking
-zfs_last_collection_timestamp = 0
-zfs_collection_lock = threading.Lock()
+# Meter used for the observable instruments, kept so collectors enabled by a
+# configuration reload can register their instruments later
+meter = None
+
+# Observable instrument groups registered so far
+registered_groups = set()
+
+# Set by the SIGHUP handler; the main loop reloads the configuration at the
+# start of the next cycle
+reload_requested = False
+
+# Settings that are only read while the exporters and logging are set up
+RESTART_REQUIRED_SETTINGS = {
+    "otel_collector_host", "otel_collector_port", "otel_metrics_endpoint",
+    "otel_logs_endpoint", "otel_traces_endpoint", "enable_traces",
+    "metrics_destinations", "logs_destinations", "traces_destinations",
+    "trace_tail_sampling", "trace_slow_cycle_seconds", "trace_baseline_percent",
+    "log_file_path", "max_log_size_bytes", "backup_count", "log_level",
+    "prometheus_port", "prometheus_address", "ringstore_path", "ringstore_resolution_seconds",
+    "ringstore_retention_seconds", "ringstore_max_series",
+}
+
+# Settings the alert rules are built from
+ALERT_SETTINGS = {
+    "temp_critical_threshold", "disk_temp_warning_threshold", "temp_alert_hysteresis",
+    "alert_for_seconds", "alert_max_notifications_per_hour",
+}
+
+# Settings read by ClusterElection when it is created
+CLUSTER_SETTINGS = {
+    "cluster_mode", "cluster_election", "cluster_lock_dir", "cluster_lock_name",
+    "cluster_lease_seconds", "pve_members_file",
+}
+
+# Settings read by each background sampler when it is created
+SAMPLER_SETTINGS = {
+    "psi": {"psi_sample_interval_seconds", "collection_interval_seconds"},
+    "hf_sampler": {"hf_sample_interval_seconds", "collection_interval_seconds"},
+    "zpool_iostat": {"zpool_iostat_interval_seconds"},
+}
+
+# Background PSI sampler, started in main() when /proc/pressure is available
+pressure_sampler = None
+
+# Background 1 Hz CPU and disk I/O sampler, started in main() when enabled
+hf_sampler = None
+
+# Supervisor of the streaming `zpool iostat` process, started in main() when enabled
+zpool_iostat_sampler = None
 
-# Define global variables for disk I/O collection tracking
-disk_io_last_collection_timestamp = 0
-disk_io_collection_lock = threading.Lock()
+# Telemetry providers, flushed and shut down after a --once run
+telemetry_providers = []
 
-def setup_opentelemetry():
+# Prometheus snapshot reader, refreshed after each cycle when PROMETHEUS_PORT is set
+prometheus_reader = None
+
+# Alert state machine fed by the collectors, created in main(); see lib/alerts.py
+alert_engine = None
+
+# Span processor deciding which cycle traces are exported, when TRACE_TAIL_SAMPLING is on
+tail_sampler = None
+
+def setup_opentelemetry(config):
     """Set up OpenTelemetry exporters for metrics, logs, and traces."""
-    # Setup OTLP HTTP exporter for metrics
-    metrics_exporter = OTLPMetricExporter(endpoint=OTEL_METRICS_ENDPOINT)
-    reader = PeriodicExportingMetricReader(
-        metrics_exporter,
-        export_interval_millis=COLLECTION_INTERVAL_SECONDS * 1000
+    from opentelemetry import metrics
+    from opentelemetry import trace
+    from opentelemetry.sdk.metrics import MeterProvider
+    from opentelemetry.sdk._logs import LoggerProvider
+    from opentelemetry._logs import set_logger_provider, get_logger
+    from lib.exporters import create_metric_readers, add_log_processors, register_export_metrics
+    
+    resource = get_resource()
+    
+    # One OTLP HTTP reader per metrics destination, each exporting on its own thread
+    metric_readers = create_metric_readers(
+        config.metrics_destinations,
+        export_interval_millis=config.collection_interval_seconds * 1000
     )
-    meter_provider = MeterProvider(metric_readers=[reader], resource=resource)
+    
+    # Optional pull endpoint: a second reader keeps an encoded snapshot for scrapes
+    global prometheus_reader
+    if config.prometheus_port:
+        from lib.prometheus import PrometheusSnapshotReader
+        prometheus_reader = PrometheusSnapshotReader()
+        metric_readers.append(prometheus_reader)
+    
+    # Local on-host history, written independently of the OTLP destinations
+    if config.ringstore_path:
+        from opentelemetry.sdk.metrics.export import PeriodicExportingMetricReader
+        from lib.ringstore import RingStore, RingStoreExporter
+        try:
+            store = RingStore(config.ringstore_path, config.ringstore_resolution_seconds,
+                              config.ringstore_retention_seconds, config.ringstore_max_series)
+            metric_readers.append(PeriodicExportingMetricReader(
+                RingStoreExporter(store),
+                export_interval_millis=config.ringstore_resolution_seconds * 1000
+            ))
+        except (OSError, ValueError) as e:
+            logger.error("Could not open ring store %s: %s", config.ringstore_path, e)
+    
+    meter_provider = MeterProvider(metric_readers=metric_readers, resource=resource)
     metrics.set_meter_provider(meter_provider)
     
-    # Setup OTLP HTTP exporter for logs
-    log_exporter = OTLPLogExporter(endpoint=OTEL_LOGS_ENDPOINT)
+    # One batch processor (queue and export thread) per logs destination
     log_provider = LoggerProvider(resource=resource)
-    log_provider.add_log_record_processor(BatchLogRecordProcessor(log_exporter))
+    add_log_processors(log_provider, config.logs_destinations)
     set_logger_provider(log_provider)
     logger_otel = get_logger("proxmox.logs")
     
+    telemetry_providers.extend([meter_provider, log_provider])
+    
     # Setup OTLP HTTP exporter for traces - only if enabled
-    if ENABLE_TRACES:
-        trace_exporter = OTLPSpanExporter(endpoint=OTEL_TRACES_ENDPOINT)
+    if config.enable_traces:
+        from opentelemetry.sdk.trace import TracerProvider
+        from lib.exporters import add_span_processors
+        
         tracer_provider = TracerProvider(resource=resource)
-        tracer_provider.add_span_processor(BatchSpanProcessor(trace_exporter))
+        if config.trace_tail_sampling:
+            # Whole cycles are kept or dropped once their monitoring_cycle span ends
+            from lib.tail_sampling import TailSamplingSpanProcessor
+            global tail_sampler
+            tail_sampler = TailSamplingSpanProcessor(config.trace_slow_cycle_seconds, config.trace_baseline_percent)
+            add_span_processors(tail_sampler, config.traces_destinations)
+            tracer_provider.add_span_processor(tail_sampler)
+        else:
+            add_span_processors(tracer_provider, config.traces_destinations)
         trace.set_tracer_provider(tracer_provider)
+        telemetry_providers.append(tracer_provider)
         tracer = trace.get_tracer("proxmox.kernel")
         logger.info("Trace exporting enabled")
     else:
-        # Set up a no-op tracer that doesn't actually send data
-        tracer_provider = TracerProvider(resource=resource)
-        trace.set_tracer_provider(tracer_provider)
+        # Without an SDK tracer provider the API returns a no-op tracer
         tracer = trace.get_tracer("proxmox.kernel")
         logger.info("Trace exporting disabled - using no-op tracer")
     
     # Create a meter and define metrics
+    global meter
     meter = metrics.get_meter("proxmox.metrics")
+    metrics_dict = create_metrics(meter, config)
+    register_export_metrics(meter)
     
-    # Define metrics - store in a dictionary for easy access
-    metrics_dict = {
-        # Temperature metrics - enhanced for comprehensive monitoring
-        'temperature': meter.create_gauge(
-            name="proxmox_temperature",
-            description="Temperature in degrees Celsius from various sensors",
-            unit="celsius"
-        ),
-        
-        # CPU metrics
-        'cpu_usage': meter.create_gauge(
-            name="proxmox_cpu_usage_percent",
-            description="CPU usage percentage",
-            unit="%"
-        ),
-        
-        # Memory metrics
-        'memory_used': meter.create_gauge(
-            name="proxmox_memory_used",
-            description="Memory used in bytes",
-            unit="bytes"
-        ),
-        'memory_total': meter.create_gauge(
-            name="proxmox_memory_total",
-            description="Total memory in bytes",
-            unit="bytes"
-        ),
-        'memory_usage': meter.create_gauge(
-            name="proxmox_memory_usage",
-            description="Memory usage percentage",
-            unit="%"
-        ),
-        
-        # Node uptime
-        'node_uptime': meter.create_gauge(
-            name="proxmox_node_uptime",
-            description="Node uptime in seconds",
-            unit="s"
-        ),
-        
-        # Cluster metrics
-        'cluster_quorate': meter.create_gauge(
-            name="proxmox_cluster_quorate",
-            description="Cluster quorum status (1=quorate, 0=not quorate)",
-            unit="state"
-        ),
-        'cluster_nodes': meter.create_gauge(
-            name="proxmox_cluster_node_online",
-            description="Cluster node online status (1=online, 0=offline)",
-            unit="state"
-        ),
-        
-        # Storage metrics
-        'storage_status': meter.create_gauge(
-            name="proxmox_storage_status",
-            description="Storage status (1=active, 0=inactive)",
-            unit="state"
-        ),
-        'storage_usage': meter.create_gauge(
-            name="proxmox_storage_usage",
-            description="Storage usage percentage",
-            unit="%"
-        ),
-        'storage_used': meter.create_gauge(
-            name="proxmox_storage_used",
-            description="Storage used in bytes",
-            unit="bytes"
-        ),
-        'storage_total': meter.create_gauge(
-            name="proxmox_storage_total",
-            description="Total storage in bytes",
-            unit="bytes"
-        ),
-        
-        # SMART metrics
-        'smart_metrics': meter.create_gauge(
-            name="proxmox_smart_attributes",
-            description="SMART disk attributes",
-            unit="value"
-        ),
+    return metrics_dict, logger_otel, tracer
+
+def _register_group(name, config):
+    """Return True if an observable instrument group is enabled and not yet registered."""
+    if not config.collector_enabled(name) or name in registered_groups:
+        return False
+    registered_groups.add(name)
+    return True
+
+def _when_enabled(name, callback):
+    """Wrap an observable callback so it reports nothing once its collector is disabled."""
+    def gated_callback(options):
+        if not get_config().collector_enabled(name):
+            return []
+        return callback(options)
+    return gated_callback
+
+def _create_observable(meter, key, callback):
+    """Create a registered observable instrument, gated on its collector group."""
+    instrument = INSTRUMENTS_BY_KEY[key]
+    if instrument.group is not None:
+        callback = _when_enabled(instrument.group, callback)
+    created_instruments[key] = create_instrument(meter, key, callback)
+
+def create_metrics(meter, config):
+    """Create the metric instruments, registering observable callbacks only for enabled collectors."""
+    # Synchronous instruments are cheap and always created; see lib/instruments.py
+    metrics_dict = create_sync_instruments(meter)
+    register_observable_metrics(meter, config)
+    
+    # Pending (0) and firing (1) alerts, see lib/alerts.py
+    from opentelemetry.metrics import Observation
+    
+    def proxmox_alert_active_callback(options):
+        if alert_engine is None:
+            return
+        for attributes, active in alert_engine.active():
+            yield Observation(active, attributes)
+    
+    _create_observable(meter, 'proxmox_alert_active', proxmox_alert_active_callback)
+    
+    if tail_sampler is not None:
+        def proxmox_agent_traces_callback(options):
+            for decision, traces in list(tail_sampler.decisions.items()):
+                yield Observation(traces, {"decision": decision})
         
-        # VM metrics
-        'vm_status': meter.create_gauge(
-            name="proxmox_vm_status",
-            description="VM status (1=running, 0=stopped)",
-            unit="state"
-        ),
-        'vm_cpu_usage': meter.create_gauge(
-            name="proxmox_vm_cpu_usage",
-            description="VM CPU usage percentage",
-            unit="%"
-        ),
-        'vm_memory_usage': meter.create_gauge(
-            name="proxmox_vm_memory_usage",
-            description="VM memory usage percentage",
-            unit="%"
-        ),
-    }
-    
-    # Dedicated ZFS metric callbacks for each metric, now with explicit 'metric' label for context
-    def zfs_pool_health_status_callback(options):
-        for pool, metrics in collect_zfs_pool_metrics().items():
-            health_value = metrics.get('health_value', 0)
-            health_text = str(metrics.get('health', 'UNKNOWN'))
-            # Add a more descriptive label for Grafana legend and Prometheus context
-            legend = f"Pool: {pool} (Health: {health_text})"
-            yield Observation(health_value, {
-                "pool": pool,
-                "legend": legend,
-                "health_text": health_text,
-                "metric": "health_status"
-            })
-
-    def zfs_pool_capacity_ratio_callback(options):
-        for pool, metrics in collect_zfs_pool_metrics().items():
-            capacity = metrics.get('capacity', 0.0)
-            yield Observation(capacity, {"pool": pool, "metric": "capacity_percent"})
-
-    def zfs_pool_fragmentation_ratio_callback(options):
-        for pool, metrics in collect_zfs_pool_metrics().items():
-            fragmentation = metrics.get('fragmentation', 0.0)
-            yield Observation(fragmentation, {"pool": pool, "metric": "fragmentation_percent"})
-
-    def zfs_pool_checksum_errors_total_callback(options):
-        for pool, metrics in collect_zfs_pool_metrics().items():
-            checksum_errors = metrics.get('checksum_errors', 0)
-            yield Observation(checksum_errors, {"pool": pool, "metric": "checksum_errors_total"})
-
-    def zfs_pool_read_bytes_total_callback(options):
-        for pool, metrics in collect_zfs_pool_metrics().items():
-            read_bytes = metrics.get('read_bytes', 0)
-            yield Observation(read_bytes, {"pool": pool, "metric": "read_bytes_total"})
-
-    def zfs_pool_write_bytes_total_callback(options):
-        for pool, metrics in collect_zfs_pool_metrics().items():
-            write_bytes = metrics.get('write_bytes', 0)
-            yield Observation(write_bytes, {"pool": pool, "metric": "write_bytes_total"})
-
-    def zfs_pool_read_ops_total_callback(options):
-        for pool, metrics in collect_zfs_pool_metrics().items():
-            read_ops = metrics.get('read_ops', 0)
-            yield Observation(read_ops, {"pool": pool, "metric": "read_ops_total"})
-
-    def zfs_pool_write_ops_total_callback(options):
-        for pool, metrics in collect_zfs_pool_metrics().items():
-            write_ops = metrics.get('write_ops', 0)
-            yield Observation(write_ops, {"pool": pool, "metric": "write_ops_total"})
-
-    # Dedicated disk I/O metric callbacks for each metric
-    def proxmox_disk_io_read_bytes_total_callback(options):
-        for device, metrics in collect_disk_io_data_raw().items():
-            mb_read = metrics['bytes_read'] / (1024 * 1024)
-            legend = f"Disk: {device} (Read MB)"
-            yield Observation(mb_read, {"device": device, "legend": legend, "metric": "read_megabytes_total"})
-
-    def proxmox_disk_io_write_bytes_total_callback(options):
-        for device, metrics in collect_disk_io_data_raw().items():
-            mb_written = metrics['bytes_written'] / (1024 * 1024)
-            legend = f"Disk: {device} (Write MB)"
-            yield Observation(mb_written, {"device": device, "legend": legend, "metric": "write_megabytes_total"})
-
-    # Register each ZFS and disk I/O metric with its own callback
-    created_instruments['zfs_pool_health_status'] = meter.create_observable_gauge(
-        name="zfs_pool_health_status",
-        description="ZFS pool health status (0=ONLINE, 1=DEGRADED, 2=FAULTED, 3=OFFLINE, 4=UNAVAIL, 5=REMOVED)",
-        callbacks=[zfs_pool_health_status_callback],
-        unit="state"
-    )
-    created_instruments['zfs_pool_capacity_ratio'] = meter.create_observable_gauge(
-        name="zfs_pool_capacity_ratio",
-        description="ZFS pool capacity usage percentage",
-        callbacks=[zfs_pool_capacity_ratio_callback],
-        unit="%"
-    )
-    created_instruments['zfs_pool_fragmentation_ratio'] = meter.create_observable_gauge(
-        name="zfs_pool_fragmentation_ratio",
-        description="ZFS pool fragmentation percentage",
-        callbacks=[zfs_pool_fragmentation_ratio_callback],
-        unit="%"
-    )
-    created_instruments['zfs_pool_checksum_errors_total'] = meter.create_observable_counter(
-        name="zfs_pool_checksum_errors_total",
-        description="Total ZFS pool checksum errors - use increase() or rate() in queries",
-        callbacks=[zfs_pool_checksum_errors_total_callback],
-        unit="errors"
-    )
-    created_instruments['zfs_pool_read_bytes_total'] = meter.create_observable_counter(
-        name="zfs_pool_read_bytes_total",
-        description="Total bytes read from ZFS pool - use rate() in queries",
-        callbacks=[zfs_pool_read_bytes_total_callback],
-        unit="bytes"
-    )
-    created_instruments['zfs_pool_write_bytes_total'] = meter.create_observable_counter(
-        name="zfs_pool_write_bytes_total",
-        description="Total bytes written to ZFS pool - use rate() in queries",
-        callbacks=[zfs_pool_write_bytes_total_callback],
-        unit="bytes"
-    )
-    created_instruments['zfs_pool_read_ops_total'] = meter.create_observable_counter(
-        name="zfs_pool_read_ops_total",
-        description="Total read operations on ZFS pool - use rate() in queries",
-        callbacks=[zfs_pool_read_ops_total_callback],
-        unit="operations"
-    )
-    created_instruments['zfs_pool_write_ops_total'] = meter.create_observable_counter(
-        name="zfs_pool_write_ops_total",
-        description="Total write operations on ZFS pool - use rate() in queries",
-        callbacks=[zfs_pool_write_ops_total_callback],
-        unit="operations"
-    )
-    created_instruments['proxmox_disk_io_read_bytes_total'] = meter.create_observable_counter(
-        name="proxmox_disk_io_read_megabytes_total",
-        description="Total megabytes read from disk - use rate() in queries",
-        callbacks=[proxmox_disk_io_read_bytes_total_callback],
-        unit="MB"
-    )
-    created_instruments['proxmox_disk_io_write_bytes_total'] = meter.create_observable_counter(
-        name="proxmox_disk_io_write_megabytes_total",
-        description="Total megabytes written to disk - use rate() in queries",
-        callbacks=[proxmox_disk_io_write_bytes_total_callback],
-        unit="MB"
-    )
+        _create_observable(meter, 'proxmox_agent_traces_total', proxmox_agent_traces_callback)
     
     # Add all observable instruments to metrics_dict for convenience
     metrics_dict.update(created_instruments)
     
-    return metrics_dict, logger_otel, tracer
+    return metrics_dict
+
+def register_observable_metrics(meter, config):
+    """Register the observable instruments of enabled collectors that are not registered yet.
+    
+    Instruments cannot be removed from a meter, so the callbacks check at
+    export time whether their collector is still enabled.
+    """
+    from opentelemetry.metrics import Observation
+    
+    # ZFS pool metrics are collected via observable instrument callbacks
+    if _register_group("zfs", config):
+        from lib.collectors.zfs_collector import collect_zfs_pool_metrics, POOL_HEALTH_VALUES
+        from lib.samples import Sample
+
+        # Dedicated ZFS metric callbacks for each metric, now with explicit 'metric' label for context
+        def zfs_pool_health_status_callback(options):
+            health_samples = []
+            for pool, metrics in collect_zfs_pool_metrics().items():
+                health_value = metrics.get('health_value', 0)
+                health_text = str(metrics.get('health', 'UNKNOWN'))
+                # Add a more descriptive label for Grafana legend and Prometheus context
+                legend = f"Pool: {pool} (Health: {health_text})"
+                labels = {
+                    "pool": pool,
+                    "legend": legend,
+                    "health_text": health_text,
+                    "metric": "health_status"
+                }
+                health_samples.append(Sample('zfs_pool_health_status', health_value, labels))
+                yield Observation(health_value, labels)
+            # Pool health is only read at export time, so its alerts are evaluated here
+            if alert_engine is not None and health_samples:
+                alert_engine.evaluate(health_samples)
+
+        def zfs_pool_capacity_ratio_callback(options):
+            for pool, metrics in collect_zfs_pool_metrics().items():
+                capacity = metrics.get('capacity', 0.0)
+                yield Observation(capacity, {"pool": pool, "metric": "capacity_percent"})
+
+        def zfs_pool_fragmentation_ratio_callback(options):
+            for pool, metrics in collect_zfs_pool_metrics().items():
+                fragmentation = metrics.get('fragmentation', 0.0)
+                yield Observation(fragmentation, {"pool": pool, "metric": "fragmentation_percent"})
+
+        def zfs_pool_checksum_errors_total_callback(options):
+            for pool, metrics in collect_zfs_pool_metrics().items():
+                checksum_errors = metrics.get('checksum_errors', 0)
+                yield Observation(checksum_errors, {"pool": pool, "metric": "checksum_errors_total"})
+
+        def zfs_pool_read_bytes_total_callback(options):
+            for pool, metrics in collect_zfs_pool_metrics().items():
+                read_bytes = metrics.get('read_bytes', 0)
+                yield Observation(read_bytes, {"pool": pool, "metric": "read_bytes_total"})
+
+        def zfs_pool_write_bytes_total_callback(options):
+            for pool, metrics in collect_zfs_pool_metrics().items():
+                write_bytes = metrics.get('write_bytes', 0)
+                yield Observation(write_bytes, {"pool": pool, "metric": "write_bytes_total"})
+
+        def zfs_pool_read_ops_total_callback(options):
+            for pool, metrics in collect_zfs_pool_metrics().items():
+                read_ops = metrics.get('read_ops', 0)
+                yield Observation(read_ops, {"pool": pool, "metric": "read_ops_total"})
+
+        def zfs_pool_write_ops_total_callback(options):
+            for pool, metrics in collect_zfs_pool_metrics().items():
+                write_ops = metrics.get('write_ops', 0)
+                yield Observation(write_ops, {"pool": pool, "metric": "write_ops_total"})
+
+        def _pool_space_observations(field):
+            for pool, metrics in collect_zfs_pool_metrics().items():
+                yield Observation(metrics.get(field, 0), {"pool": pool})
+
+        def zfs_pool_size_bytes_callback(options):
+            yield from _pool_space_observations('size')
+
+        def zfs_pool_allocated_bytes_callback(options):
+            yield from _pool_space_observations('allocated')
+
+        def zfs_pool_free_bytes_callback(options):
+            yield from _pool_space_observations('free')
+
+        def zfs_vdev_errors_total_callback(options):
+            for pool, metrics in collect_zfs_pool_metrics().items():
+                for vdev in metrics.get('vdevs', []):
+                    for error_type in ('read', 'write', 'cksum'):
+                        yield Observation(vdev[error_type], {"pool": pool, "vdev": vdev['name'], "type": error_type})
+
+        def zfs_vdev_state_callback(options):
+            for pool, metrics in collect_zfs_pool_metrics().items():
+                for vdev in metrics.get('vdevs', []):
+                    yield Observation(POOL_HEALTH_VALUES.get(vdev['state'], 0), {
+                        "pool": pool, "vdev": vdev['name'], "state": vdev['state']
+                    })
+
+        def _scan_observations(value):
+            for pool, metrics in collect_zfs_pool_metrics().items():
+                scan = metrics.get('scan')
+                if scan:
+                    yield Observation(value(scan), {"pool": pool, "function": scan['function']})
+
+        def zfs_pool_scan_progress_percent_callback(options):
+            yield from _scan_observations(lambda scan: scan['percent'])
+
+        def zfs_pool_scan_active_callback(options):
+            yield from _scan_observations(lambda scan: 1 if scan['state'] == 'scanning' else 0)
+
+        def zfs_pool_scan_errors_callback(options):
+            yield from _scan_observations(lambda scan: scan['errors'])
+
+        _create_observable(meter, 'zfs_pool_health_status', zfs_pool_health_status_callback)
+        _create_observable(meter, 'zfs_pool_capacity_ratio', zfs_pool_capacity_ratio_callback)
+        _create_observable(meter, 'zfs_pool_fragmentation_ratio', zfs_pool_fragmentation_ratio_callback)
+        _create_observable(meter, 'zfs_pool_checksum_errors_total', zfs_pool_checksum_errors_total_callback)
+        _create_observable(meter, 'zfs_pool_read_bytes_total', zfs_pool_read_bytes_total_callback)
+        _create_observable(meter, 'zfs_pool_write_bytes_total', zfs_pool_write_bytes_total_callback)
+        _create_observable(meter, 'zfs_pool_read_ops_total', zfs_pool_read_ops_total_callback)
+        _create_observable(meter, 'zfs_pool_write_ops_total', zfs_pool_write_ops_total_callback)
+        _create_observable(meter, 'zfs_pool_size_bytes', zfs_pool_size_bytes_callback)
+        _create_observable(meter, 'zfs_pool_allocated_bytes', zfs_pool_allocated_bytes_callback)
+        _create_observable(meter, 'zfs_pool_free_bytes', zfs_pool_free_bytes_callback)
+        _create_observable(meter, 'zfs_vdev_errors_total', zfs_vdev_errors_total_callback)
+        _create_observable(meter, 'zfs_vdev_state', zfs_vdev_state_callback)
+        _create_observable(meter, 'zfs_pool_scan_progress_percent', zfs_pool_scan_progress_percent_callback)
+        _create_observable(meter, 'zfs_pool_scan_active', zfs_pool_scan_active_callback)
+        _create_observable(meter, 'zfs_pool_scan_errors', zfs_pool_scan_errors_callback)
+    
+    # ZFS dataset and zvol space accounting from a cached `zfs get`
+    if _register_group("zfs_datasets", config):
+        from lib.collectors.zfs_collector import collect_zfs_dataset_metrics
+
+        def _dataset_observations(field):
+            for dataset, metrics in collect_zfs_dataset_metrics().items():
+                value = metrics.get(field)
+                if value is not None:
+                    yield Observation(value, metrics['labels'])
+
+        def zfs_dataset_used_bytes_callback(options):
+            yield from _dataset_observations('used')
+
+        def zfs_dataset_referenced_bytes_callback(options):
+            yield from _dataset_observations('referenced')
+
+        def zfs_dataset_logical_used_bytes_callback(options):
+            yield from _dataset_observations('logicalused')
+
+        def zfs_dataset_compress_ratio_callback(options):
+            yield from _dataset_observations('compressratio')
+
+        def zfs_dataset_quota_bytes_callback(options):
+            yield from _dataset_observations('quota')
+
+        _create_observable(meter, 'zfs_dataset_used_bytes', zfs_dataset_used_bytes_callback)
+        _create_observable(meter, 'zfs_dataset_referenced_bytes', zfs_dataset_referenced_bytes_callback)
+        _create_observable(meter, 'zfs_dataset_logical_used_bytes', zfs_dataset_logical_used_bytes_callback)
+        _create_observable(meter, 'zfs_dataset_compress_ratio', zfs_dataset_compress_ratio_callback)
+        _create_observable(meter, 'zfs_dataset_quota_bytes', zfs_dataset_quota_bytes_callback)
+    
+    # Disk I/O counters from /proc/diskstats
+    if _register_group("disk_io", config):
+        from lib.collectors.system_collector import collect_disk_io_data_raw
+
+        # Dedicated disk I/O metric callbacks for each metric
+        def proxmox_disk_io_read_megabytes_total_callback(options):
+            for device, metrics in collect_disk_io_data_raw().items():
+                mb_read = metrics['bytes_read'] / (1024 * 1024)
+                legend = f"Disk: {device} (Read MB)"
+                yield Observation(mb_read, {"device": device, "legend": legend, "metric": "read_megabytes_total"})
+
+        def proxmox_disk_io_write_megabytes_total_callback(options):
+            for device, metrics in collect_disk_io_data_raw().items():
+                mb_written = metrics['bytes_written'] / (1024 * 1024)
+                legend = f"Disk: {device} (Write MB)"
+                yield Observation(mb_written, {"device": device, "legend": legend, "metric": "write_megabytes_total"})
+
+        _create_observable(meter, 'proxmox_disk_io_read_megabytes_total', proxmox_disk_io_read_megabytes_total_callback)
+        _create_observable(meter, 'proxmox_disk_io_write_megabytes_total', proxmox_disk_io_write_megabytes_total_callback)
+    
+    # Network interface counters from /proc/net/dev
+    if _register_group("network", config):
+        from lib.collectors.network_collector import collect_network_data_raw
+
+        # Network interface counters, one observation per direction
+        def _network_observations(metric):
+            for iface, data in collect_network_data_raw().items():
+                yield Observation(data[f'rx_{metric}'], dict(data['labels'], direction="rx"))
+                yield Observation(data[f'tx_{metric}'], dict(data['labels'], direction="tx"))
+
+        def proxmox_network_bytes_total_callback(options):
+            yield from _network_observations('bytes')
+
+        def proxmox_network_packets_total_callback(options):
+            yield from _network_observations('packets')
+
+        def proxmox_network_errors_total_callback(options):
+            yield from _network_observations('errors')
+
+        def proxmox_network_drops_total_callback(options):
+            yield from _network_observations('drops')
+
+        _create_observable(meter, 'proxmox_network_bytes_total', proxmox_network_bytes_total_callback)
+        _create_observable(meter, 'proxmox_network_packets_total', proxmox_network_packets_total_callback)
+        _create_observable(meter, 'proxmox_network_errors_total', proxmox_network_errors_total_callback)
+        _create_observable(meter, 'proxmox_network_drops_total', proxmox_network_drops_total_callback)
+    
+    # PSI statistics from the background pressure sampler
+    if _register_group("psi", config):
+        # Host pressure stall statistics from the PSI sampler
+        def proxmox_pressure_stall_percent_callback(options):
+            if pressure_sampler is None:
+                return
+            for resource_name, scope, stats in pressure_sampler.snapshot():
+                for stat, value in stats.items():
+                    yield Observation(value, {"resource": resource_name, "scope": scope, "stat": stat})
+
+        _create_observable(meter, 'proxmox_pressure_stall_percent', proxmox_pressure_stall_percent_callback)
+    
+    # Sub-interval summaries from the background high-frequency sampler
+    if _register_group("hf_sampler", config):
+        # Sub-interval CPU and disk I/O summaries from the high-frequency sampler
+        def proxmox_cpu_usage_sampled_percent_callback(options):
+            if hf_sampler is None:
+                return
+            summary = hf_sampler.cpu_summary()
+            if summary:
+                for stat, value in summary.items():
+                    yield Observation(value, {"stat": stat})
+
+        def proxmox_disk_io_sampled_bytes_per_second_callback(options):
+            if hf_sampler is None:
+                return
+            for device, direction, summary in hf_sampler.disk_summaries():
+                for stat, value in summary.items():
+                    yield Observation(value, {"device": device, "direction": direction, "stat": stat})
+
+        _create_observable(meter, 'proxmox_cpu_usage_sampled_percent', proxmox_cpu_usage_sampled_percent_callback)
+        _create_observable(meter, 'proxmox_disk_io_sampled_bytes_per_second', proxmox_disk_io_sampled_bytes_per_second_callback)
+    
+    # LVM thin pool fill and volume group capacity from cached `lvs`/`vgs` reports
+    if _register_group("lvm", config):
+        from lib.collectors.lvm_collector import collect_lvm_metrics
+
+        def _lvm_observations(kind, field):
+            for labels, metrics in collect_lvm_metrics()[kind]:
+                value = metrics.get(field)
+                if value is not None:
+                    yield Observation(value, labels)
+
+        def lvm_thin_pool_data_percent_callback(options):
+            yield from _lvm_observations('thin_pools', 'data_percent')
+
+        def lvm_thin_pool_metadata_percent_callback(options):
+            yield from _lvm_observations('thin_pools', 'metadata_percent')
+
+        def lvm_thin_pool_size_bytes_callback(options):
+            yield from _lvm_observations('thin_pools', 'size')
+
+        def lvm_thin_volume_used_bytes_callback(options):
+            yield from _lvm_observations('thin_volumes', 'used')
+
+        def lvm_thin_volume_size_bytes_callback(options):
+            yield from _lvm_observations('thin_volumes', 'size')
+
+        def lvm_vg_size_bytes_callback(options):
+            yield from _lvm_observations('volume_groups', 'size')
+
+        def lvm_vg_free_bytes_callback(options):
+            yield from _lvm_observations('volume_groups', 'free')
+
+        _create_observable(meter, 'lvm_thin_pool_data_percent', lvm_thin_pool_data_percent_callback)
+        _create_observable(meter, 'lvm_thin_pool_metadata_percent', lvm_thin_pool_metadata_percent_callback)
+        _create_observable(meter, 'lvm_thin_pool_size_bytes', lvm_thin_pool_size_bytes_callback)
+        _create_observable(meter, 'lvm_thin_volume_used_bytes', lvm_thin_volume_used_bytes_callback)
+        _create_observable(meter, 'lvm_thin_volume_size_bytes', lvm_thin_volume_size_bytes_callback)
+        _create_observable(meter, 'lvm_vg_size_bytes', lvm_vg_size_bytes_callback)
+        _create_observable(meter, 'lvm_vg_free_bytes', lvm_vg_free_bytes_callback)
+    
+    # Pool latencies and queue depths from the streaming `zpool iostat`
+    if _register_group("zpool_iostat", config):
+        def zfs_pool_wait_latency_seconds_callback(options):
+            if zpool_iostat_sampler is None:
+                return
+            for pool, latencies, queues in zpool_iostat_sampler.snapshot():
+                for (wait, direction), seconds in latencies.items():
+                    yield Observation(seconds, {"pool": pool, "wait": wait, "direction": direction})
+
+        def zfs_pool_queue_depth_callback(options):
+            if zpool_iostat_sampler is None:
+                return
+            for pool, latencies, queues in zpool_iostat_sampler.snapshot():
+                for (queue, direction, state), depth in queues.items():
+                    yield Observation(depth, {"pool": pool, "queue": queue, "direction": direction, "state": state})
+
+        _create_observable(meter, 'zfs_pool_wait_latency_seconds', zfs_pool_wait_latency_seconds_callback)
+        _create_observable(meter, 'zfs_pool_queue_depth', zfs_pool_queue_depth_callback)
+    
+    # Per-guest block I/O counters from the cgroup collector
+    if _register_group("guest_cgroup", config):
+        from lib.collectors.cgroup_collector import get_guest_io_counters
+
+        # Per-guest block I/O counters from the last cgroup collection
+        def proxmox_guest_io_bytes_total_callback(options):
+            for labels, io_stat in get_guest_io_counters():
+                yield Observation(io_stat['rbytes'], dict(labels, direction="read"))
+                yield Observation(io_stat['wbytes'], dict(labels, direction="write"))
+
+        def proxmox_guest_io_ops_total_callback(options):
+            for labels, io_stat in get_guest_io_counters():
+                yield Observation(io_stat['rios'], dict(labels, direction="read"))
+                yield Observation(io_stat['wios'], dict(labels, direction="write"))
+
+        _create_observable(meter, 'proxmox_guest_io_bytes_total', proxmox_guest_io_bytes_total_callback)
+        _create_observable(meter, 'proxmox_guest_io_ops_total', proxmox_guest_io_ops_total_callback)
+
+def build_collectors(config, metrics_dict):
+    """Build the enabled per-cycle collectors, importing each collector module on demand.
+    
+    Returns:
+        list: (name, reporter_only, collect) tuples. collect(is_reporter) runs one
+              collection; reporter_only collectors are skipped on non-reporter nodes.
+    """
+    collectors = []
+    
+    # Collect system metrics
+    if config.collector_enabled("system"):
+        from lib.collectors.system_collector import collect_system_metrics
+        collectors.append(("system", False, lambda is_reporter: collect_system_metrics(
+            cpu_usage=metrics_dict['cpu_usage'],
+            memory_usage=metrics_dict['memory_usage'],
+            memory_total=metrics_dict['memory_total'],
+            memory_used=metrics_dict['memory_used'],
+            node_uptime=metrics_dict['node_uptime']
+        )))
+    
+    # Collect cluster quorum and node status (cached until /etc/pve/.members changes)
+    if config.collector_enabled("cluster"):
+        from lib.collectors.system_collector import collect_cluster_status
+        collectors.append(("cluster", False, lambda is_reporter: collect_cluster_status(
+            cluster_quorate=metrics_dict['cluster_quorate'],
+            cluster_nodes=metrics_dict['cluster_nodes'],
+            include_nodes=is_reporter
+        )))
+    
+    # Collect storage metrics - shared storages only on the reporter node
+    if config.collector_enabled("storage"):
+        from lib.collectors.storage_collector import collect_storage_metrics
+        collectors.append(("storage", False, lambda is_reporter: collect_storage_metrics(
+            storage_status=metrics_dict['storage_status'],
+            storage_usage=metrics_dict['storage_usage'],
+            storage_used=metrics_dict['storage_used'],
+            storage_total=metrics_dict['storage_total'],
+            include_shared=is_reporter
+        )))
+    
+    # Collect SMART disk metrics
+    if config.collector_enabled("smart"):
+        from lib.collectors.storage_collector import collect_disk_smart_metrics
+        collectors.append(("smart", False, lambda is_reporter: collect_disk_smart_metrics(
+            smart_metrics=metrics_dict['smart_metrics']
+        )))
+    
+    # Collect backup and replication results by tailing the node's task index
+    if config.collector_enabled("tasks"):
+        from lib.collectors.task_collector import collect_task_metrics
+        collectors.append(("tasks", False, lambda is_reporter: collect_task_metrics(
+            backup_status=metrics_dict['backup_status'],
+            task_duration=metrics_dict['task_duration'],
+            task_last_success=metrics_dict['task_last_success'],
+            task_runs=metrics_dict['task_runs'],
+            tasks_running=metrics_dict['tasks_running']
+        )))
+    
+    # Collect VM metrics - /cluster/resources lists every VM in the
+    # cluster, so only the reporter node exports them
+    if config.collector_enabled("vm"):
+        from lib.collectors.vm_collector import collect_vm_metrics
+        collectors.append(("vm", True, lambda is_reporter: collect_vm_metrics(
+            vm_status=metrics_dict['vm_status'],
+            vm_cpu_usage=metrics_dict['vm_cpu_usage'],
+            vm_memory_usage=metrics_dict['vm_memory_usage']
+        )))
+    
+    # Collect per-guest cgroup metrics for guests running on this node
+    if config.collector_enabled("guest_cgroup"):
+        from lib.collectors.cgroup_collector import collect_guest_cgroup_metrics
+        collectors.append(("guest_cgroup", False, lambda is_reporter: collect_guest_cgroup_metrics(
+            guest_cpu_usage=metrics_dict['guest_cpu_usage'],
+            guest_memory=metrics_dict['guest_memory'],
+            guest_cpu_pressure=metrics_dict['guest_cpu_pressure']
+        )))
+    
+    # Collect temperature metrics with enhanced temperature monitoring
+    if config.collector_enabled("temperature"):
+        from lib.collectors.temperature_collector import collect_temperature_metrics
+        collectors.append(("temperature", False, lambda is_reporter: collect_temperature_metrics(
+            metrics_dict['temperature']
+        )))
+    
+    return collectors
+
+def start_samplers(config, names=("psi", "hf_sampler", "zpool_iostat")):
+    """Start the enabled background samplers."""
+    global pressure_sampler, hf_sampler, zpool_iostat_sampler
+    
+    # Sample PSI stall counters between exports
+    if "psi" in names and config.collector_enabled("psi"):
+        from lib.collectors.pressure_collector import PressureSampler
+        if PressureSampler.available():
+            pressure_sampler = PressureSampler()
+            pressure_sampler.start()
+        else:
+            logger.info("Pressure Stall Information not available, PSI sampling disabled")
+    
+    # Sample CPU and disk I/O at high frequency to catch short spikes
+    if "hf_sampler" in names and config.collector_enabled("hf_sampler"):
+        from lib.sampler import HighFrequencySampler
+        hf_sampler = HighFrequencySampler()
+        hf_sampler.start()
+    
+    # Keep one `zpool iostat` process running for pool latencies and queue depths
+    if "zpool_iostat" in names and config.collector_enabled("zpool_iostat"):
+        from lib.collectors.zfs_collector import ZpoolIostatSampler
+        zpool_iostat_sampler = ZpoolIostatSampler()
+        zpool_iostat_sampler.start()
+
+def stop_samplers(names=("psi", "hf_sampler", "zpool_iostat")):
+    """Stop background samplers and wait for their threads to exit."""
+    global pressure_sampler, hf_sampler, zpool_iostat_sampler
+    
+    if "psi" in names and pressure_sampler is not None:
+        pressure_sampler.stop()
+        pressure_sampler.join(timeout=5)
+        pressure_sampler = None
+    
+    if "hf_sampler" in names and hf_sampler is not None:
+        hf_sampler.stop()
+        hf_sampler.join(timeout=5)
+        hf_sampler = None
+    
+    if "zpool_iostat" in names and zpool_iostat_sampler is not None:
+        zpool_iostat_sampler.stop()
+        zpool_iostat_sampler.join(timeout=5)
+        zpool_iostat_sampler = None
 
 def log_collection_thread(logger_otel):
-    """Thread function for continuous log collection."""
+    """Thread function for continuous log collection.
+    
+    The log file list, journal services and interval are read from the
+    current configuration on every pass, so a reload applies without
+    restarting the thread; Pygtail offsets and the journal cursor are kept.
+    """
+    from lib.log_collectors import collect_and_send_logs, collect_and_send_journal_logs
+    
     while True:
         try:
             collect_and_send_logs(logger_otel)
             collect_and_send_journal_logs(logger_otel)
-            time.sleep(LOG_COLLECTION_INTERVAL_SECONDS)
+            time.sleep(get_config().log_collection_interval_seconds)
         except Exception as e:
-            logger.error(f"Error in log collection thread: {e}")
+            logger.error("Error in log collection thread: %s", e)
             time.sleep(10)  # Wait a bit before retrying
 
+def _request_reload(signum, frame):
+    """SIGHUP handler: defer the reload to the main loop."""
+    global reload_requested
+    reload_requested = True
+
+def reload_configuration(metrics_dict, collectors, election):
+    """Re-read the configuration and rebuild only what the changed settings affect.
+    
+    Exporters, instruments, CPU/counter state and collector caches are kept.
+    
+    Returns:
+        tuple: (config, collectors, election) to use from now on
+    """
+    old_config, config, changed = reload_config()
+    if not changed:
+        logger.info("Configuration reloaded, no settings changed")
+        return config, collectors, election
+    logger.info("Configuration reloaded, changed settings: %s", ', '.join(sorted(changed)))
+    
+    restart_required = changed & RESTART_REQUIRED_SETTINGS
+    if restart_required:
+        logger.warning("Changes to %s take effect only after a restart", ', '.join(sorted(restart_required)))
+    if "collection_interval_seconds" in changed:
+        logger.warning("The metric export interval keeps its old value until a restart")
+    
+    # Rebuild the per-cycle collectors and register instruments for newly enabled ones
+    if "enabled_collectors" in changed:
+        register_observable_metrics(meter, config)
+        metrics_dict.update(created_instruments)
+        collectors = build_collectors(config, metrics_dict)
+    
+    if changed & ALERT_SETTINGS:
+        alert_engine.set_rules(build_alert_rules(config), config.alert_max_notifications_per_hour)
+    
+    if changed & CLUSTER_SETTINGS:
+        election.release()
+        election = ClusterElection()
+    
+    # Restart only the samplers whose settings or enablement changed
+    for name, settings in SAMPLER_SETTINGS.items():
+        if changed & settings or old_config.collector_enabled(name) != config.collector_enabled(name):
+            stop_samplers((name,))
+            start_samplers(config, (name,))
+    
+    return config, collectors, election
+
+def run_cycle(config, collectors, election, metrics_dict, tracer):
+    """Run one monitoring cycle over all enabled collectors."""
+    # Create a monitoring cycle span to track overall collection process
+    with tracer.start_as_current_span("monitoring_cycle") as monitoring_span:
+        monitoring_span.set_attribute("collection.timestamp", time.time())
+        
+        is_reporter = election.refresh()
+        monitoring_span.set_attribute("cluster.reporter", is_reporter)
+        metrics_dict['cluster_reporter'].set(1 if is_reporter else 0, {"node": election.node_name})
+        
+        for name, reporter_only, collect in collectors:
+            if reporter_only and not is_reporter:
+                continue
+            with tracer.start_as_current_span(f"{name}_metrics_collection") as span:
+                started = time.perf_counter()
+                result = collect(is_reporter)
+                duration_ms = (time.perf_counter() - started) * 1000
+                items = len(result) if result is not None else 0
+                span.set_attribute("collector.name", name)
+                span.set_attribute("collector.items", items)
+            # One summary line per collector; per-item detail is logged at DEBUG
+            logger.info("collector=%s items=%d duration_ms=%.1f reporter=%s", name, items, duration_ms, is_reporter)
+            if alert_engine is not None and result:
+                alert_engine.evaluate(result)
+        
+        # ZFS, disk I/O, network and sampler metrics are collected via
+        # observable instrument callbacks when the metric reader exports
+        
+        logger.debug("Metrics collected and sent to %s", ", ".join(d.endpoint for d in config.metrics_destinations))
+        if config.enable_traces:
+            logger.debug("Traces sent to %s", ", ".join(d.endpoint for d in config.traces_destinations))
+
+def query_ringstore(args):
+    """Print the history of a metric from the local ring store (main.py query)."""
+    from datetime import datetime
+    from lib.ringstore import RingStore, parse_duration
+    
+    config = load_config()
+    path = args.file or config.ringstore_path
+    if not path:
+        print("No ring store: set RINGSTORE_PATH or pass --file")
+        return 1
+    try:
+        store = RingStore(path, readonly=True)
+    except (OSError, ValueError) as e:
+        print(f"Cannot read ring store {path}: {e}")
+        return 1
+    
+    labels = dict(label.split("=", 1) for label in args.label)
+    since = time.time() - parse_duration(args.since)
+    keys = store.series(args.metric, labels)
+    if not keys:
+        print(f"No series for {args.metric} in {path}")
+    for key in keys:
+        print(key)
+        for timestamp, value in store.read(key, since):
+            print(f"  {datetime.fromtimestamp(timestamp):%Y-%m-%d %H:%M:%S}  {value:g}")
+    store.close()
+    return 0
+
+def run_poller(args):
+    """Monitor the nodes in POLLER_TARGETS over the Proxmox API (main.py poll)."""
+    import asyncio
+    from lib.poller import Poller
+    
+    config = load_config()
+    setup_logging(config)
+    if not config.poller_targets:
+        logger.error("POLLER_TARGETS is empty, no nodes to poll")
+        return 1
+    logger.info("Starting Proxmox API poller for %d nodes", len(config.poller_targets))
+    
+    poller = Poller(config)
+    try:
+        asyncio.run(poller.run(once=args.once))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        poller.shutdown()
+    return 0
+
+def generate_dashboards(args):
+    """Write or check the Grafana dashboards and recording rules (main.py dashboards)."""
+    import os
+    from lib.dashboards import DASHBOARD_DIR, generate
+    
+    files, problems = generate()
+    for problem in problems:
+        print(problem)
+    if problems:
+        return 1
+    
+    directory = args.output or DASHBOARD_DIR
+    stale = []
+    for name, content in files.items():
+        path = os.path.join(directory, name)
+        try:
+            with open(path) as f:
+                current = f.read()
+        except FileNotFoundError:
+            current = None
+        if current == content:
+            continue
+        if args.check:
+            stale.append(name)
+        else:
+            with open(path, "w") as f:
+                f.write(content)
+            print(f"Wrote {path}")
+    if stale:
+        print(f"Out of date in {directory}: {', '.join(stale)} - run main.py dashboards")
+        return 1
+    return 0
+
 def main():
     """Main function to run the monitoring script."""
+    parser = argparse.ArgumentParser(description="Proxmox OpenTelemetry Monitoring")
+    parser.add_argument("--once", action="store_true",
+                        help="run a single collection cycle, export it and exit (e.g. from cron)")
+    subcommands = parser.add_subparsers(dest="command")
+    query_parser = subcommands.add_parser("query", help="show a metric's history from the local ring store")
+    query_parser.add_argument("metric", help="metric name, e.g. proxmox_cpu_usage_percent")
+    query_parser.add_argument("--since", default="1h", help="how far back to show, e.g. 90m, 2h, 1d (default: 1h)")
+    query_parser.add_argument("--label", action="append", default=[], metavar="KEY=VALUE",
+                              help="only series with this label value (repeatable)")
+    query_parser.add_argument("--file", help="ring store file (default: RINGSTORE_PATH)")
+    dashboards_parser = subcommands.add_parser(
+        "dashboards", help="generate the Grafana dashboards and recording rules from the instrument registry")
+    dashboards_parser.add_argument("--check", action="store_true",
+                                   help="only validate and report files that are out of date (exit status 1)")
+    dashboards_parser.add_argument("--output", help="directory to write to (default: ../dashboards)")
+    subcommands.add_parser(
+        "poll", help="monitor the nodes in POLLER_TARGETS over the Proxmox API instead of locally "
+                     "(with --once: poll each node once)")
+    args = parser.parse_args()
+    
+    if args.command == "query":
+        return query_ringstore(args)
+    if args.command == "dashboards":
+        return generate_dashboards(args)
+    if args.command == "poll":
+        return run_poller(args)
+    
+    config = load_config()
+    setup_logging(config)
     logger.info("Starting Proxmox OpenTelemetry Monitoring")
     
     # Set up OpenTelemetry
-    metrics_dict, logger_otel, tracer = setup_opentelemetry()
+    metrics_dict, logger_otel, tracer = setup_opentelemetry(config)
+    collectors = build_collectors(config, metrics_dict)
+    
+    # Alert notifications are sent only when an alert fires or resolves
+    global alert_engine
+    alert_engine = AlertEngine(build_alert_rules(config), logger_otel, config.alert_max_notifications_per_hour)
+    
+    # Cluster-scope collectors run only on the elected reporter node
+    election = ClusterElection()
+    
+    if args.once:
+        run_cycle(config, collectors, election, metrics_dict, tracer)
+        # Shutting down the providers exports everything still pending
+        for provider in telemetry_providers:
+            provider.shutdown()
+        return
     
     # Start the log collection in a separate thread
     log_thread = threading.Thread(
@@ -347,70 +896,41 @@ def main():
     )
     log_thread.start()
     
-    # Main monitoring loop
+    start_samplers(config)
+    
+    if prometheus_reader is not None:
+        from lib.prometheus import MetricsServer
+        try:
+            MetricsServer(prometheus_reader, config.prometheus_address, config.prometheus_port).start()
+        except OSError as e:
+            logger.error("Could not serve Prometheus metrics on port %s: %s", config.prometheus_port, e)
+    
+    # Reload the configuration on SIGHUP (systemctl reload)
+    global reload_requested
+    signal.signal(signal.SIGHUP, _request_reload)
+    
+    # Main monitoring loop - cycles start at a fixed rate, see lib/scheduler.py
+    clock = CycleClock(config.collection_interval_seconds, config.cycle_overrun_policy, config.cycle_align)
     while True:
         try:
-            # Create a monitoring cycle span to track overall collection process
-            with tracer.start_as_current_span("monitoring_cycle") as monitoring_span:
-                monitoring_span.set_attribute("collection.timestamp", time.time())
-                
-                # Collect system metrics
-                with tracer.start_as_current_span("system_metrics_collection") as span:
-                    collect_system_metrics(
-                        cpu_usage=metrics_dict['cpu_usage'],
-                        memory_usage=metrics_dict['memory_usage'],
-                        memory_total=metrics_dict['memory_total'],
-                        memory_used=metrics_dict['memory_used'],
-                        node_uptime=metrics_dict['node_uptime']
-                    )
-                    span.set_attribute("collector.name", "system")
-                
-                # Collect storage metrics
-                with tracer.start_as_current_span("storage_metrics_collection") as span:
-                    collect_storage_metrics(
-                        storage_status=metrics_dict['storage_status'],
-                        storage_usage=metrics_dict['storage_usage'],
-                        storage_used=metrics_dict['storage_used'],
-                        storage_total=metrics_dict['storage_total']
-                    )
-                    span.set_attribute("collector.name", "storage")
-                
-                # Collect SMART disk metrics
-                with tracer.start_as_current_span("smart_metrics_collection") as span:
-                    collect_disk_smart_metrics(
-                        smart_metrics=metrics_dict['smart_metrics']
-                    )
-                    span.set_attribute("collector.name", "smart")
-                
-                # Collect VM metrics
-                with tracer.start_as_current_span("vm_metrics_collection") as span:
-                    collect_vm_metrics(
-                        vm_status=metrics_dict['vm_status'],
-                        vm_cpu_usage=metrics_dict['vm_cpu_usage'],
-                        vm_memory_usage=metrics_dict['vm_memory_usage']
-                    )
-                    span.set_attribute("collector.name", "vm")
-                
-                # Collect temperature metrics with enhanced temperature monitoring
-                with tracer.start_as_current_span("temperature_metrics_collection") as span:
-                    collect_temperature_metrics(
-                        metrics_dict['temperature'],
-                        logger_otel
-                    )
-                    span.set_attribute("collector.name", "temperature")
-                
-                # ZFS metrics are now collected via Observable instruments callbacks
-                # No need to call collect_zfs_pool_metrics() here
-                
-                logger.info(f"Metrics collected and sent to {OTEL_METRICS_ENDPOINT}")
-                if ENABLE_TRACES:
-                    logger.info(f"Traces sent to {OTEL_TRACES_ENDPOINT}")
+            if reload_requested:
+                reload_requested = False
+                config, collectors, election = reload_configuration(metrics_dict, collectors, election)
+                clock.reconfigure(config.collection_interval_seconds, config.cycle_overrun_policy, config.cycle_align)
+            
+            # Wait for the next cycle; a failed cycle does not delay the schedule
+            skipped = clock.wait()
+            metrics_dict['cycle_lag'].set(clock.lag)
+            if skipped:
+                metrics_dict['cycles_skipped'].add(skipped)
             
-            # Wait for the next collection interval
-            time.sleep(COLLECTION_INTERVAL_SECONDS)
+            run_cycle(config, collectors, election, metrics_dict, tracer)
+            
+            # Scrapes are served from this snapshot until the next cycle
+            if prometheus_reader is not None:
+                prometheus_reader.refresh()
         except Exception as e:
-            logger.error(f"Error in main loop: {e}")
-            time.sleep(10)  # Wait a bit before retrying
+            logger.error("Error in main loop: %s", e)
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    sys.exit(main())
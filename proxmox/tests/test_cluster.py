@@ -0,0 +1,147 @@
+"""
+Tests for the cluster reporter election (lib/cluster.py)
+
+The lock strategy runs against a tmp_path directory standing in for
+/etc/pve/priv/lock; pmxcfs lock expiry is simulated by ageing the lock's mtime.
+"""
+import json
+import os
+import time
+
+import pytest
+
+from lib.cluster import ClusterElection
+from lib.config import load_config
+
+LEASE_SECONDS = 120
+
+
+@pytest.fixture(autouse=True)
+def config():
+    return load_config({})
+
+
+def _lock_election(tmp_path, node_name):
+    return ClusterElection(enabled=True, strategy="lock", lock_dir=str(tmp_path), lock_name="reporter",
+                           lease_seconds=LEASE_SECONDS, node_name=node_name)
+
+
+def _age_lock(lock_path, seconds):
+    past = time.time() - seconds
+    os.utime(lock_path, (past, past))
+
+
+def test_disabled_election_always_reports(tmp_path):
+    election = ClusterElection(enabled=False, lock_dir=str(tmp_path), node_name="pve1")
+    assert election.refresh() is True
+    assert not os.path.exists(election.lock_path)
+
+
+def test_first_node_acquires_lock(tmp_path):
+    first, second = _lock_election(tmp_path, "pve1"), _lock_election(tmp_path, "pve2")
+
+    assert first.refresh() is True
+    assert os.path.isdir(first.lock_path)
+    assert second.refresh() is False
+
+
+def test_leader_refreshes_lease(tmp_path):
+    leader, follower = _lock_election(tmp_path, "pve1"), _lock_election(tmp_path, "pve2")
+    leader.refresh()
+    # Make the lease nearly expired; the leader's next refresh renews it
+    _age_lock(leader.lock_path, LEASE_SECONDS - 1)
+    leader._lock_stamp = leader._stamp()
+
+    assert leader.refresh() is True
+    assert time.time() - os.stat(leader.lock_path).st_mtime < 5
+    assert follower.refresh() is False
+    assert leader.refresh() is True
+
+
+def test_stale_lock_taken_over_and_old_leader_steps_down(tmp_path):
+    old_leader, new_leader = _lock_election(tmp_path, "pve1"), _lock_election(tmp_path, "pve2")
+    old_leader.refresh()
+    # pve1 stopped refreshing past the lease
+    _age_lock(old_leader.lock_path, LEASE_SECONDS + 10)
+
+    assert new_leader.refresh() is True
+    assert time.time() - os.stat(new_leader.lock_path).st_mtime < 5
+    assert old_leader.refresh() is False
+    assert old_leader.is_leader is False
+    assert new_leader.refresh() is True
+
+
+def test_takeover_backs_off_when_another_node_took_over_first(tmp_path):
+    first, second = _lock_election(tmp_path, "pve1"), _lock_election(tmp_path, "pve2")
+    third = _lock_election(tmp_path, "pve3")
+    first.refresh()
+    _age_lock(first.lock_path, LEASE_SECONDS + 10)
+
+    # pve3 takes over between pve2's staleness check and its removal of the lock
+    real_stamp = second._stamp
+
+    def stamp_after_competing_takeover():
+        assert third.refresh() is True
+        return real_stamp()
+
+    second._stamp = stamp_after_competing_takeover
+    assert second.refresh() is False
+    second._stamp = real_stamp
+
+    assert third.refresh() is True
+    assert second.refresh() is False
+
+
+def test_release_removes_own_lock(tmp_path):
+    leader, follower = _lock_election(tmp_path, "pve1"), _lock_election(tmp_path, "pve2")
+    leader.refresh()
+
+    leader.release()
+    assert not os.path.exists(leader.lock_path)
+    assert follower.refresh() is True
+
+
+def _write_members(tmp_path, quorate=1, online=("pve1", "pve2")):
+    members = {
+        "nodename": "pve2",
+        "version": 5,
+        "cluster": {"name": "lab", "version": 3, "nodes": 3, "quorate": quorate},
+        "nodelist": {
+            name: {"id": index, "online": int(name in online), "ip": f"10.0.0.{index}"}
+            for index, name in enumerate(("pve0", "pve1", "pve2"), start=1)
+        },
+    }
+    path = tmp_path / ".members"
+    path.write_text(json.dumps(members))
+    return str(path)
+
+
+def _members_election(members_file, node_name):
+    return ClusterElection(enabled=True, strategy="members", members_file=members_file, node_name=node_name)
+
+
+def test_members_lowest_online_node_reports(tmp_path):
+    # pve0 is offline, so pve1 is the lowest online node
+    members_file = _write_members(tmp_path)
+
+    assert _members_election(members_file, "pve1").refresh() is True
+    assert _members_election(members_file, "pve2").refresh() is False
+    assert _members_election(members_file, "pve0").refresh() is False
+
+
+def test_members_no_reporter_without_quorum(tmp_path):
+    members_file = _write_members(tmp_path, quorate=0)
+
+    assert _members_election(members_file, "pve1").refresh() is False
+
+
+def test_members_failover_when_leader_goes_offline(tmp_path):
+    election = _members_election(_write_members(tmp_path), "pve2")
+    assert election.refresh() is False
+
+    _write_members(tmp_path, online=("pve2",))
+    assert election.refresh() is True
+
+
+def test_members_standalone_node_reports(tmp_path):
+    assert _members_election(str(tmp_path / "missing"), "pve1").refresh() is True
@@ -0,0 +1,59 @@
+"""
+Tests for the NVMe health log decoder (lib/nvme.py)
+"""
+import struct
+
+from lib.nvme import SMART_LOG_SIZE, decode_smart_log
+
+
+def _smart_log_page():
+    """A 512-byte SMART / Health log page with known values at the spec offsets."""
+    page = bytearray(SMART_LOG_SIZE)
+    page[0] = 0x04                             # critical warning: reliability degraded
+    struct.pack_into("<H", page, 1, 318)       # composite temperature, Kelvin
+    page[3], page[4], page[5] = 97, 10, 3      # available spare, threshold, percentage used
+    # 128-bit counters: data units read at 32, written at 48, ..., error log entries at 176
+    struct.pack_into("<QQ", page, 32, 123456, 0)
+    struct.pack_into("<QQ", page, 48, 5, 1)    # 2**64 + 5, spills into the high half
+    struct.pack_into("<QQ", page, 128, 8760, 0)  # power on hours
+    struct.pack_into("<QQ", page, 160, 0xFFFFFFFFFFFFFFFF, 0xFFFFFFFFFFFFFFFF)  # media errors
+    struct.pack_into("<II", page, 192, 7, 2)   # warning / critical temperature time
+    # Sensors 1 and 3 implemented, the rest report 0
+    struct.pack_into("<8H", page, 200, 320, 0, 315, 0, 0, 0, 0, 0)
+    return page
+
+
+def test_decode_smart_log_fields():
+    log = decode_smart_log(_smart_log_page())
+
+    assert log["critical_warning"] == 0x04
+    assert log["available_spare"] == 97
+    assert log["available_spare_threshold"] == 10
+    assert log["percentage_used"] == 3
+    assert log["warning_temp_time"] == 7
+    assert log["critical_comp_time"] == 2
+
+
+def test_decode_smart_log_128bit_counters():
+    log = decode_smart_log(_smart_log_page())
+
+    assert log["data_units_read"] == 123456
+    assert log["data_units_written"] == 2 ** 64 + 5
+    assert log["power_on_hours"] == 8760
+    assert log["media_errors"] == 2 ** 128 - 1
+    assert log["host_reads"] == 0
+
+
+def test_decode_smart_log_temperatures_in_celsius():
+    log = decode_smart_log(_smart_log_page())
+
+    assert log["temperature"] == 45
+    # Unimplemented sensors (0 K) are left out
+    assert log["temperature_sensors"] == [47, 42]
+
+
+def test_decode_smart_log_unimplemented_composite_temperature():
+    page = _smart_log_page()
+    struct.pack_into("<H", page, 1, 0)
+
+    assert decode_smart_log(memoryview(page))["temperature"] is None
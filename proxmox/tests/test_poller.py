@@ -0,0 +1,249 @@
+"""
+Tests for the asyncio API client (lib/pve_api.py) and central poller (lib/poller.py)
+
+Each test runs an asyncio start_server mock of the Proxmox API on localhost
+over plain HTTP (ssl_context=None).
+"""
+import asyncio
+import json
+import socket
+import time
+
+import pytest
+from opentelemetry.sdk.metrics.export import InMemoryMetricReader
+
+import lib.exporters
+import lib.poller
+from lib.config import load_config
+from lib.poller import Poller
+from lib.pve_api import PveApiClient, PveApiError
+
+
+class MockApiServer:
+    """Answers GET /api2/json<path> with {"data": routes[path]}, keeping connections alive."""
+
+    def __init__(self, routes, chunked=False, close_after_response=False):
+        self.routes = routes
+        self.chunked = chunked
+        # Drop the connection after each response without announcing it, like an idle timeout
+        self.close_after_response = close_after_response
+        self.connections = 0
+        self.requests = []
+        self._server = None
+        self._handlers = set()
+
+    async def __aenter__(self):
+        self._server = await asyncio.start_server(self._handle, "127.0.0.1", 0)
+        self.port = self._server.sockets[0].getsockname()[1]
+        return self
+
+    async def __aexit__(self, *exc_info):
+        self._server.close()
+        # Handlers of kept-alive connections are still waiting for a request
+        for handler in self._handlers:
+            handler.cancel()
+        await asyncio.gather(*self._handlers, return_exceptions=True)
+        await self._server.wait_closed()
+
+    async def _handle(self, reader, writer):
+        self.connections += 1
+        self._handlers.add(asyncio.current_task())
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                headers = {}
+                while (line := await reader.readline()) not in (b"\r\n", b""):
+                    name, _, value = line.decode().partition(":")
+                    headers[name.strip().lower()] = value.strip()
+                target = request_line.split()[1].decode()
+                self.requests.append((target, headers))
+                path = target.removeprefix("/api2/json").partition("?")[0]
+                if path in self.routes:
+                    status, body = "200 OK", json.dumps({"data": self.routes[path]}).encode()
+                else:
+                    status, body = "404 Not Found", b"{}"
+                if self.chunked:
+                    middle = len(body) // 2
+                    writer.write(f"HTTP/1.1 {status}\r\nTransfer-Encoding: chunked\r\n\r\n".encode())
+                    for chunk in (body[:middle], body[middle:]):
+                        writer.write(b"%x;ext=1\r\n%s\r\n" % (len(chunk), chunk))
+                    writer.write(b"0\r\nX-Trailer: 1\r\n\r\n")
+                else:
+                    writer.write(f"HTTP/1.1 {status}\r\nContent-Length: {len(body)}\r\n\r\n".encode() + body)
+                await writer.drain()
+                if self.close_after_response:
+                    break
+        except asyncio.CancelledError:
+            pass
+        finally:
+            writer.close()
+
+
+def _closed_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+@pytest.fixture
+def metric_readers(monkeypatch):
+    """Replace the OTLP readers of the poller's meter provider with in-memory ones."""
+    readers = []
+
+    def create_metric_readers(destinations, export_interval_millis):
+        reader = InMemoryMetricReader()
+        readers.append(reader)
+        return [reader]
+
+    monkeypatch.setattr(lib.exporters, "create_metric_readers", create_metric_readers)
+    return readers
+
+
+def _gauge_points(metrics_data, name):
+    points = []
+    for resource_metrics in metrics_data.resource_metrics:
+        for scope_metrics in resource_metrics.scope_metrics:
+            for metric in scope_metrics.metrics:
+                if metric.name == name:
+                    points += [(dict(point.attributes), point.value) for point in metric.data.data_points]
+    return points
+
+
+def test_get_decodes_chunked_response():
+    async def scenario():
+        async with MockApiServer({"/version": {"version": "8.2.4"}}, chunked=True) as server:
+            client = PveApiClient("127.0.0.1", server.port, token="monitor@pve!otel=secret")
+            try:
+                assert await client.get("/version") == {"version": "8.2.4"}
+                # The connection stays usable after the trailer
+                assert await client.get("/version") == {"version": "8.2.4"}
+            finally:
+                await client.close()
+            return server
+
+    server = asyncio.run(scenario())
+    assert server.connections == 1
+    assert server.requests[0][1]["authorization"] == "PVEAPIToken=monitor@pve!otel=secret"
+
+
+def test_get_reuses_keep_alive_connection():
+    async def scenario():
+        async with MockApiServer({"/nodes": [{"node": "pve1"}]}) as server:
+            client = PveApiClient("127.0.0.1", server.port, max_connections=2)
+            try:
+                for _ in range(5):
+                    assert await client.get("/nodes") == [{"node": "pve1"}]
+            finally:
+                await client.close()
+            return server.connections
+
+    assert asyncio.run(scenario()) == 1
+
+
+def test_get_reconnects_when_idle_connection_was_closed():
+    async def scenario():
+        async with MockApiServer({"/nodes": []}, close_after_response=True) as server:
+            client = PveApiClient("127.0.0.1", server.port)
+            try:
+                assert await client.get("/nodes") == []
+                await asyncio.sleep(0.05)
+                assert await client.get("/nodes") == []
+            finally:
+                await client.close()
+            return server.connections
+
+    assert asyncio.run(scenario()) == 2
+
+
+def test_get_raises_on_error_status():
+    async def scenario():
+        async with MockApiServer({}) as server:
+            client = PveApiClient("127.0.0.1", server.port)
+            try:
+                with pytest.raises(PveApiError, match="HTTP 404"):
+                    await client.get("/nodes")
+            finally:
+                await client.close()
+
+    asyncio.run(scenario())
+
+
+def _node_routes(node, cpu):
+    return {
+        "/cluster/status": [{"type": "cluster", "name": "lab"},
+                            {"type": "node", "name": node, "local": 1}],
+        f"/nodes/{node}/status": {"cpu": cpu, "uptime": 3600, "pveversion": "pve-manager/8.2.4/faa83925c9641325",
+                                  "memory": {"total": 1000, "used": 400, "free": 600}},
+        f"/nodes/{node}/storage": [{"storage": "local", "type": "dir", "active": 1, "content": "iso,vztmpl",
+                                    "total": 2 ** 30, "used": 2 ** 29}],
+        f"/nodes/{node}/qemu": [{"vmid": 100, "name": "web", "status": "running", "cpu": 0.5,
+                                 "mem": 512, "maxmem": 1024}],
+        f"/nodes/{node}/lxc": [],
+    }
+
+
+def test_poller_records_nodes_on_one_meter_provider(metric_readers, monkeypatch):
+    # The mock API servers speak plain HTTP
+    monkeypatch.setattr(lib.poller, "create_ssl_context", lambda verify, ca_file: None)
+
+    async def scenario():
+        async with MockApiServer(_node_routes("pve2", 0.25), chunked=True) as first, \
+                MockApiServer(_node_routes("pve3", 0.75)) as second:
+            config = load_config({"POLLER_TARGETS": f"127.0.0.1:{first.port},127.0.0.1:{second.port}",
+                                  "ENABLED_COLLECTORS": "system,storage,vm"})
+            poller = Poller(config)
+            try:
+                return poller, [await node.poll() for node in poller.nodes]
+            finally:
+                for node in poller.nodes:
+                    await node.client.close()
+
+    poller, items = asyncio.run(scenario())
+    assert [node.node for node in poller.nodes] == ["pve2", "pve3"]
+    # 5 node status, 4 storage and 3 guest data points per node
+    assert items == [12, 12]
+    # One reader (so one exporter per destination) for the poller and every node
+    assert len(metric_readers) == 1
+    metrics_data = metric_readers[0].get_metrics_data()
+    assert sorted(_gauge_points(metrics_data, "proxmox_cpu_usage_percent"), key=lambda point: point[1]) == [
+        ({"node": "pve2", "hostname": "faa83925c9641325"}, 25.0),
+        ({"node": "pve3", "hostname": "faa83925c9641325"}, 75.0)]
+    # Same storage on both nodes, kept apart by the node attribute
+    assert sorted(attributes["node"] for attributes, _ in _gauge_points(metrics_data, "proxmox_storage_status")) == [
+        "pve2", "pve3"]
+    poller.shutdown()
+
+
+def test_unreachable_node_backs_off(metric_readers):
+    config = load_config({
+        "POLLER_TARGETS": f"127.0.0.1:{_closed_port()}",
+        "OTEL_COLLECTION_INTERVAL": "30",
+        "POLLER_MAX_BACKOFF": "100",
+        "POLLER_TIMEOUT": "2",
+    })
+    poller = Poller(config)
+    node = poller.nodes[0]
+
+    async def scenario():
+        poller._semaphore = asyncio.Semaphore(config.poller_concurrency)
+        await poller.poll_round()
+        first_attempt = node.next_attempt
+        # Still backing off: the next round skips the node
+        await poller.poll_round()
+        return first_attempt
+
+    started = time.monotonic()
+    first_attempt = asyncio.run(scenario())
+    assert node.failures == 1
+    assert node.next_attempt == first_attempt
+    # interval * 2^1 = 60s with +-20% jitter
+    assert started + 48 <= first_attempt <= time.monotonic() + 72
+    assert _gauge_points(metric_readers[0].get_metrics_data(), "proxmox_poller_up") == [({"target": node.target}, 0)]
+
+    # Further failures are capped at POLLER_MAX_BACKOFF (plus jitter)
+    node.failures = 10
+    node.record_failure(OSError("unreachable"))
+    assert node.next_attempt - time.monotonic() <= 100 * 1.2
+    poller.shutdown()
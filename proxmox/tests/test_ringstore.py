@@ -0,0 +1,29 @@
+"""
+Tests for the local ring store (lib/ringstore.py)
+"""
+from lib.ringstore import RingStore, parse_series_key, series_key
+
+
+def test_series_key_round_trip():
+    attributes = {"pool": "rpool", "dataset": 'rpool/data/"vm-100",disk', "path": "C:\\temp", "note": "a\nb"}
+    key = series_key("zfs_dataset_used", attributes)
+
+    assert key.count("\n") == 0
+    assert parse_series_key(key) == ("zfs_dataset_used", attributes)
+
+
+def test_series_key_plain_values_unchanged():
+    assert series_key("proxmox_vm_status", {"vmid": "100", "name": "web"}) == 'proxmox_vm_status{name="web",vmid="100"}'
+    assert parse_series_key("proxmox_cpu_usage_percent") == ("proxmox_cpu_usage_percent", {})
+
+
+def test_series_filtered_by_escaped_label(tmp_path):
+    store = RingStore(str(tmp_path / "metrics.ring"), resolution=60, retention=600, max_series=8)
+    tricky = {"storage": 'nfs",backup', "type": "nfs"}
+    store.write(1_800_000_000, [(series_key("proxmox_storage_used", tricky), 1.0),
+                                (series_key("proxmox_storage_used", {"storage": "nfs", "type": "nfs"}), 2.0)])
+
+    keys = store.series("proxmox_storage_used", {"storage": 'nfs",backup'})
+    assert keys == [series_key("proxmox_storage_used", tricky)]
+    assert store.read(keys[0]) == [(1_800_000_000, 1.0)]
+    store.close()
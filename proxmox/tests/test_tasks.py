@@ -0,0 +1,95 @@
+"""
+Tests for the PVE task index tailing (lib/collectors/task_collector.py)
+
+The task directory and state file live under tmp_path; index lines are
+written the way pvedaemon appends them.
+"""
+import pytest
+
+from lib.collectors import task_collector
+from lib.config import load_config
+
+START = 0x67000000
+
+
+def _upid(number, task_type="vzdump", vmid="100"):
+    return f"UPID:pve1:{0x1000 + number:08X}:{0x2000 + number:08X}:{START + number * 60:08X}:{task_type}:{vmid}:root@pam:"
+
+
+def _index_line(number, duration=30, status="OK", **task):
+    return f"{_upid(number, **task)} {START + number * 60 + duration:08X} {status}\n"
+
+
+@pytest.fixture
+def task_dir(tmp_path, monkeypatch):
+    directory = tmp_path / "tasks"
+    directory.mkdir()
+    (directory / "active").write_text("")
+    load_config({"TASK_LOG_DIR": str(directory), "TASK_STATE_FILE": str(tmp_path / "state" / "tasks.json")})
+    monkeypatch.setattr(task_collector, "_state", None)
+    return directory
+
+
+def _append(path, *numbers):
+    with open(path, "a") as f:
+        f.writelines(_index_line(number) for number in numbers)
+
+
+def test_in_place_rewrite_resumes_after_last_task(task_dir):
+    index = task_dir / "index"
+    _append(index, *range(1, 21))
+    state = task_collector._new_state()
+    task_collector._tail_index(state)
+    assert state['last'][0] == _upid(20)
+
+    # PVE trims the oldest entries and appends a task, keeping the inode
+    with open(index, "r+") as f:
+        f.truncate(0)
+        f.writelines(_index_line(number) for number in range(15, 22))
+
+    assert task_collector._tail_index(state) == [_index_line(21).rstrip("\n")]
+    assert state['offset'] == index.stat().st_size
+    assert state['last'][0] == _upid(21)
+
+
+def test_in_place_rewrite_without_last_task_keeps_newer_ones(task_dir):
+    index = task_dir / "index"
+    _append(index, *range(1, 21))
+    state = task_collector._new_state()
+    task_collector._tail_index(state)
+
+    # The last processed task was trimmed away as well
+    index.write_text("".join(_index_line(number) for number in (18, 19, 22, 23)))
+
+    assert task_collector._tail_index(state) == [_index_line(number).rstrip("\n") for number in (22, 23)]
+
+
+def _runs(samples):
+    return sorted((dict(sample.labels)['vmid'], sample.value) for sample in samples if sample.metric == 'task_runs')
+
+
+def test_seeding_pass_does_not_count_runs(task_dir):
+    index = task_dir / "index"
+    _append(index, 1, 2, 3)
+
+    samples = task_collector.collect_task_metrics()
+    assert _runs(samples) == []
+    assert sorted(dict(sample.labels)['vmid'] for sample in samples if sample.metric == 'backup_status') == ["100"]
+
+    _append(index, 4)
+    assert _runs(task_collector.collect_task_metrics()) == [("100", 1)]
+    assert _runs(task_collector.collect_task_metrics()) == []
+
+
+def test_state_saved_only_when_changed(task_dir, monkeypatch):
+    _append(task_dir / "index", 1)
+    saved = []
+    monkeypatch.setattr(task_collector, "_save_state", lambda state: saved.append(state['offset']))
+
+    task_collector.collect_task_metrics()
+    task_collector.collect_task_metrics()
+    assert len(saved) == 1
+
+    _append(task_dir / "index", 2)
+    task_collector.collect_task_metrics()
+    assert saved == [len(_index_line(1)), len(_index_line(1)) * 2]
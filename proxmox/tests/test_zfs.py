@@ -0,0 +1,71 @@
+"""
+Tests for the `zpool status -p` text parser (lib/collectors/zfs_collector.py)
+"""
+import pytest
+
+from lib.collectors.zfs_collector import _parse_pool_status_text
+
+STATUS_TEMPLATE = """\
+  pool: rpool
+ state: ONLINE
+{scan}
+config:
+
+\tNAME                                 STATE     READ WRITE CKSUM
+\trpool                                ONLINE       0     0     0
+\t  mirror-0                           ONLINE       0     0     0
+\t    nvme-eui.1-part3                 ONLINE       0     0     3
+\t    nvme-eui.2-part3                 ONLINE       1     0     2
+
+errors: No known data errors
+"""
+
+SCAN_LINES = {
+    "scrub_in_progress": """\
+  scan: scrub in progress since Sun Oct 11 00:24:01 2026
+\t1352466939904 / 2199023255552 scanned at 1181116006/s, 858993459200 / 2199023255552 issued at 734003200/s
+\t0 repaired, 39.06% done, 00:30:12 to go""",
+    "scrub_finished": """\
+  scan: scrub repaired 0 in 00:01:02 with 2 errors on Sun Oct 11 00:25:03 2026""",
+    "scrub_canceled": """\
+  scan: scrub canceled on Sun Oct 11 00:25:03 2026""",
+    "resilver_in_progress": """\
+  scan: resilver in progress since Sun Oct 11 00:24:01 2026
+\t107374182400 / 214748364800 scanned at 1073741824/s, 53687091200 / 214748364800 issued at 524288000/s
+\t53150220288 resilvered, 25.00% done, 00:05:00 to go""",
+    "resilver_finished": """\
+  scan: resilvered 1288490188 in 00:01:02 with 1 errors on Sun Oct 11 00:25:03 2026""",
+    "resilver_canceled": """\
+  scan: resilver canceled on Sun Oct 11 00:25:03 2026""",
+}
+
+
+@pytest.mark.parametrize("case, expected", [
+    ("scrub_in_progress", {'function': 'scrub', 'state': 'scanning', 'percent': 39.06, 'errors': 0}),
+    ("scrub_finished", {'function': 'scrub', 'state': 'finished', 'percent': 100.0, 'errors': 2}),
+    ("scrub_canceled", {'function': 'scrub', 'state': 'canceled', 'percent': 0.0, 'errors': 0}),
+    ("resilver_in_progress", {'function': 'resilver', 'state': 'scanning', 'percent': 25.0, 'errors': 0}),
+    ("resilver_finished", {'function': 'resilver', 'state': 'finished', 'percent': 100.0, 'errors': 1}),
+    ("resilver_canceled", {'function': 'resilver', 'state': 'canceled', 'percent': 0.0, 'errors': 0}),
+])
+def test_scan_section(case, expected):
+    status = _parse_pool_status_text(STATUS_TEMPLATE.format(scan=SCAN_LINES[case]))
+
+    assert status['rpool']['scan'] == expected
+
+
+def test_pool_without_scan():
+    status = _parse_pool_status_text(STATUS_TEMPLATE.format(scan="  scan: none requested"))
+
+    assert status['rpool']['scan'] is None
+
+
+def test_vdev_counters_and_leaves():
+    status = _parse_pool_status_text(STATUS_TEMPLATE.format(scan=SCAN_LINES["scrub_finished"]))
+
+    assert [(vdev['name'], vdev['read'], vdev['cksum'], vdev['leaf']) for vdev in status['rpool']['vdevs']] == [
+        ("rpool", 0, 0, False),
+        ("mirror-0", 0, 0, False),
+        ("nvme-eui.1-part3", 0, 3, True),
+        ("nvme-eui.2-part3", 1, 2, True),
+    ]